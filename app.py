@@ -1,125 +1,353 @@
-from flask import Flask, render_template, request, jsonify, send_file
-import pandas as pd
+from flask import Flask, Request, Response, render_template, request, jsonify, send_file, g
+import logging
 import os
+import re
 from werkzeug.utils import secure_filename
 import tempfile
-from comparison_logic import compare_excel_files, get_column_suggestions
-import shutil
+from batch import CHUNKED_ROW_THRESHOLD, parse_sheet_mappings
+from comparison_logic import compare_workbooks, get_column_suggestions
+from chunked_compare import DEFAULT_CHUNK_SIZE, compare_large_files
+from columnar_cache import remove_columnar, start_conversion
+from diff_report import REPORT_FILES, REPORT_MIMETYPES, report_files
+from file_transfer import PACKAGES, HashingFile, gzip_chunks, zip_chunks
+from column_matching import ColumnMatcher
+from workbook_cache import sheet_cache
+from workbook_meta import read_sheet_columns, read_workbook_metadata
+from jobs import JobManager, load_job_state
+from metrics import process_metrics
+from workspaces import WorkspaceStore
+import uuid
+
+class UploadRequest(Request):
+    """Streams uploaded files straight into the workspace's upload folder, hashing them on the way"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingFile(g.workspace.upload_dir)
 
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp()
-# Initialize file paths as None
-app.config['PRELOAD_FILE'] = None
-app.config['POSTLOAD_FILE'] = None
+app.request_class = UploadRequest
+logger = logging.getLogger(__name__)
+# Uploads, results and job states live in per-user workspaces under this folder.
+# It must be shared by all worker processes (e.g. gunicorn -w 4 --threads 4 app:app).
+app.config['UPLOAD_FOLDER'] = os.environ.get(
+    'POSTLOAD_UPLOAD_FOLDER', os.path.join(tempfile.gettempdir(), 'postload_validation')
+)
+# Workspaces idle for longer than this are deleted. Like SHEET_CACHE_MAX_BYTES and
+# JOB_WORKERS it is read once at import; later changes go through workspaces.ttl_seconds
+app.config['WORKSPACE_TTL_SECONDS'] = 6 * 3600
+workspaces = WorkspaceStore(app.config['UPLOAD_FOLDER'], ttl_seconds=app.config['WORKSPACE_TTL_SECONDS'])
+WORKSPACE_COOKIE = 'workspace_id'
+FILE_TYPES = ('preload', 'postload')
+_SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+# Stream results into a write-only workbook holding only the compared sheets,
+# instead of rewriting a full in-memory copy of the postload workbook
+app.config['STREAMING_OUTPUT'] = False
+# Memory budget for parsed sheets shared by all routes (LRU eviction beyond it);
+# read once at import, call sheet_cache.resize() to change it later
+app.config['SHEET_CACHE_MAX_BYTES'] = 512 * 1024 * 1024
+sheet_cache.resize(app.config['SHEET_CACHE_MAX_BYTES'])
+# Sheets with more cells than this are flagged so the UI can warn before comparing
+app.config['LARGE_SHEET_CELLS'] = 5_000_000
+# Processes used to diff mapped sheets in parallel (None = one per CPU)
+app.config['COMPARE_WORKERS'] = None
+# Postload sheets with more rows than this are compared out-of-core, chunk by chunk
+app.config['CHUNKED_ROW_THRESHOLD'] = CHUNKED_ROW_THRESHOLD
+app.config['CHUNK_SIZE'] = DEFAULT_CHUNK_SIZE
+# Ranked column candidates returned per postload column by /get_column_suggestions
+app.config['COLUMN_CANDIDATES'] = 5
+# Convert each upload once into columnar files so later reads skip the Excel parse
+app.config['COLUMNAR_CACHE'] = True
+# Re-comparisons only diff the postload rows that changed since the last run of the same mapping
+app.config['INCREMENTAL_COMPARE'] = True
+# Estimate result column widths from this many rows per sheet (None = measure every row)
+app.config['WIDTH_SAMPLE_ROWS'] = None
+# Default output: None for the highlighted workbook, or 'csv', 'parquet' or 'xlsx' for a diff-only report
+app.config['REPORT_FORMAT'] = None
+# Comparison jobs that may run at the same time in the background; read once at import
+app.config['JOB_WORKERS'] = 2
+job_manager = JobManager(max_workers=app.config['JOB_WORKERS'])
+
+@app.before_request
+def open_workspace():
+    workspace_id = request.cookies.get(WORKSPACE_COOKIE) or request.headers.get('X-Workspace-Id')
+    g.workspace = workspaces.open(workspace_id)
+    workspaces.cleanup_expired()
+
+@app.after_request
+def remember_workspace(response):
+    workspace = getattr(g, 'workspace', None)
+    if workspace and request.cookies.get(WORKSPACE_COOKIE) != workspace.id:
+        response.set_cookie(
+            WORKSPACE_COOKIE, workspace.id,
+            max_age=app.config['WORKSPACE_TTL_SECONDS'], httponly=True, samesite='Lax'
+        )
+    return response
+
+def uploaded_file(file_type):
+    """Path of the current workspace's uploaded file of this type, if still present"""
+    filepath = g.workspace.get(f'{file_type.upper()}_FILE')
+    if filepath and os.path.exists(filepath):
+        return filepath
+    return None
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def release_upload(file_type, filepath):
+    """Delete the file previously uploaded as this type, unless it is still the other type's file.
+
+    Files a queued or running job still reads are kept; the workspace's TTL cleanup removes them later.
+    """
+    previous = g.workspace.get(f'{file_type.upper()}_FILE')
+    others = [g.workspace.get(f'{other.upper()}_FILE') for other in FILE_TYPES if other != file_type]
+    if previous and previous != filepath and previous not in others and g.workspace.contains(previous) \
+            and os.path.exists(previous) and previous not in g.workspace.files_in_use():
+        remove_columnar(previous)
+        os.remove(previous)
+
 @app.route('/get_sheets/<file_type>', methods=['POST'])
 def get_sheets(file_type):
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file provided'}), 400
-    
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
+    # A JSON body is a pre-check: {sha256, filename} of a file the browser would upload
+    if request.is_json:
+        data = request.get_json()
+        digest = str(data.get('sha256', '')).lower()
+        if not _SHA256_PATTERN.match(digest):
+            return jsonify({'error': 'Invalid sha256'}), 400
+        filename = secure_filename(data.get('filename', ''))
+        file = None
+    else:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file provided'}), 400
+
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+        filename = secure_filename(file.filename)
+    if file_type not in FILE_TYPES:
+        return jsonify({'error': f'Unknown file type {file_type}'}), 400
     
     try:
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{file_type}_{filename}")
-        
-        # If file exists, remove it first
-        if os.path.exists(filepath):
-            os.remove(filepath)
-            
-        file.save(filepath)
-        
-        # Store the filepath in app config
-        if file_type == 'preload':
-            app.config['PRELOAD_FILE'] = filepath
+        if file is None:
+            # Already uploaded in this workspace: nothing needs to be sent again
+            filepath = g.workspace.upload_path(digest, filename)
+            if not os.path.exists(filepath):
+                return jsonify({'error': 'File not uploaded yet', 'uploadRequired': True}), 404
         else:
-            app.config['POSTLOAD_FILE'] = filepath
+            # The upload was streamed to disk and hashed while the request was read (see UploadRequest)
+            filepath = g.workspace.store_upload(file.stream, filename)
+            digest = file.stream.hexdigest()
+
+        release_upload(file_type, filepath)
+        
+        # Store the filepath in the user's workspace
+        g.workspace.set(f'{file_type.upper()}_FILE', filepath)
             
-        # Read sheets using pandas
-        sheets = pd.ExcelFile(filepath).sheet_names
+        # Read sheet names from the workbook structure only
+        metadata = read_workbook_metadata(filepath)
+        sheets = [sheet.name for sheet in metadata]
+
+        if app.config['COLUMNAR_CACHE']:
+            # Sheets big enough for the chunked mode are streamed from the upload instead
+            start_conversion(
+                filepath,
+                max_rows=app.config['CHUNKED_ROW_THRESHOLD'],
+                row_counts={sheet.name: sheet.rows for sheet in metadata}
+            )
         
-        return jsonify(sheets)
+        response = jsonify(sheets)
+        # The browser remembers the digest to pre-check this file next time without hashing it
+        response.headers['X-Content-SHA256'] = digest
+        return response
     except Exception as e:
-        print(f"Error in get_sheets: {str(e)}")
+        logger.error("Error in get_sheets: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/get_columns/<file_type>/<sheet_name>')
 def get_columns(file_type, sheet_name):
     try:
-        filepath = app.config.get(f'{file_type.upper()}_FILE')
+        filepath = uploaded_file(file_type)
         if not filepath:
             return jsonify({'error': f'No {file_type} file uploaded'}), 404
             
-        df = pd.read_excel(filepath, sheet_name=sheet_name)
-        columns = df.columns.tolist()
+        columns = read_sheet_columns(filepath, sheet_name)
         
         return jsonify(columns)
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 404
+    except Exception as e:
+        logger.error("Error in get_columns: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/get_sheet_info/<file_type>')
+def get_sheet_info(file_type):
+    try:
+        filepath = uploaded_file(file_type)
+        if not filepath:
+            return jsonify({'error': f'No {file_type} file uploaded'}), 404
+
+        sheets = []
+        for sheet in read_workbook_metadata(filepath):
+            info = sheet.to_dict()
+            info['large'] = (sheet.rows or 0) * len(sheet.columns) > app.config['LARGE_SHEET_CELLS']
+            sheets.append(info)
+
+        return jsonify(sheets)
     except Exception as e:
-        print(f"Error in get_columns: {str(e)}")
+        logger.error("Error in get_sheet_info: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/compare', methods=['POST'])
 def compare():
     try:
         data = request.get_json()
-        if not app.config.get('PRELOAD_FILE') or not app.config.get('POSTLOAD_FILE'):
+        preload_file = uploaded_file('preload')
+        postload_file = uploaded_file('postload')
+        if not preload_file or not postload_file:
             return jsonify({'error': 'Files not uploaded'}), 400
 
-        output_dir = tempfile.mkdtemp()
-        sheet_mappings = data.get('sheetMappings', [])
-        
-        for mapping in sheet_mappings:
-            if mapping.get('postloadSheet') != 'none':
-                output_file = compare_excel_files(
-                    app.config['PRELOAD_FILE'],
-                    app.config['POSTLOAD_FILE'],
-                    mapping['preloadSheet'],
-                    mapping['postloadSheet'],
-                    mapping['keyColumn'],
-                    output_dir
-                )
-                app.config['COMPARISON_RESULT'] = output_file
+        output_dir = g.workspace.new_result_dir(uuid.uuid4().hex)
+        # keyColumn is a column name or a list of columns forming a composite key;
+        # mode 'position' compares the rows by their order instead.
+        # Optional columnOverrides map postload columns to a preload column (or null to skip them),
+        # optional columnRules set how postload columns compare (tolerance, case, dates...)
+        try:
+            sheet_mappings = parse_sheet_mappings(data.get('sheetMappings', []))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # Row estimates from the header-only read give progress and ETA from the start
+        post_rows = {sheet.name: sheet.rows for sheet in read_workbook_metadata(postload_file)}
+        sheet_rows = [(mapping[1], post_rows.get(mapping[1])) for mapping in sheet_mappings]
+
+        # reportFormat asks for only the differing cells instead of a highlighted workbook
+        report_format = data.get('reportFormat', app.config['REPORT_FORMAT'])
+        if report_format and report_format not in REPORT_FILES:
+            return jsonify({'error': f'Unknown report format: {report_format}'}), 400
+
+        chunked = data.get('chunked')
+        if chunked is None:
+            chunked = any((rows or 0) > app.config['CHUNKED_ROW_THRESHOLD'] for _, rows in sheet_rows)
+
+        if chunked:
+            job = job_manager.submit(
+                compare_large_files,
+                sheet_rows,
+                args=(
+                    preload_file, postload_file, sheet_mappings,
+                    os.path.join(output_dir, REPORT_FILES[report_format] if report_format else 'comparison_result.xlsx')
+                ),
+                kwargs={'chunk_size': app.config['CHUNK_SIZE'], 'report': bool(report_format)},
+                state_dir=g.workspace.jobs_dir,
+                inputs=(preload_file, postload_file)
+            )
+        else:
+            job = job_manager.submit(
+                compare_workbooks,
+                sheet_rows,
+                args=(preload_file, postload_file, sheet_mappings, output_dir),
+                kwargs={
+                    'max_workers': app.config['COMPARE_WORKERS'],
+                    'write_only': data.get('streaming', app.config['STREAMING_OUTPUT']),
+                    'snapshot_dir': (
+                        g.workspace.snapshots_dir
+                        if data.get('incremental', app.config['INCREMENTAL_COMPARE']) else None
+                    ),
+                    'width_sample': app.config['WIDTH_SAMPLE_ROWS'],
+                    'report_format': report_format
+                },
+                state_dir=g.workspace.jobs_dir,
+                inputs=(preload_file, postload_file)
+            )
+        g.workspace.set('LATEST_JOB', job.id)
 
         return jsonify({
-            'message': 'Comparison completed successfully',
-            'downloadReady': True
-        })
+            'message': 'Comparison started',
+            'jobId': job.id,
+            'statusUrl': f'/jobs/{job.id}'
+        }), 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    # Job states are read from the workspace so any worker process can answer
+    state = load_job_state(g.workspace.jobs_dir, job_id)
+    if not state:
+        return jsonify({'error': 'Unknown job'}), 404
+    state.pop('resultFile', None)
+    state.pop('inputFiles', None)
+    return jsonify(state)
+
+@app.route('/jobs/<job_id>/download')
+def download_job_result(job_id):
+    state = load_job_state(g.workspace.jobs_dir, job_id)
+    if not state:
+        return jsonify({'error': 'Unknown job'}), 404
+    if state['status'] != 'completed':
+        return jsonify({'error': f"Job is {state['status']}"}), 409
+    return send_result_file(state['resultFile'])
+
 @app.route('/download_result')
 def download_result():
+    # Kept for older clients: serves the workspace's most recent job
+    job_id = g.workspace.get('LATEST_JOB')
+    state = load_job_state(g.workspace.jobs_dir, job_id) if job_id else None
+    if state and state['status'] == 'completed':
+        return send_result_file(state['resultFile'])
+    return send_result_file(None)
+
+def send_result_file(output_file):
     try:
-        output_file = app.config.get('COMPARISON_RESULT')
-        if not output_file or not os.path.exists(output_file):
+        if not output_file or not g.workspace.contains(output_file) or not os.path.exists(output_file):
             return jsonify({'error': 'No comparison result available'}), 404
+
+        # ?package=zip bundles the result with its companion files, ?package=gzip compresses the result;
+        # both are generated while they are sent
+        package = request.args.get('package')
+        if package and package not in PACKAGES:
+            return jsonify({'error': f'Unknown package: {package}'}), 400
+        name = os.path.basename(output_file)
+        if package == 'zip':
+            return Response(
+                zip_chunks(report_files(output_file)),
+                mimetype='application/zip',
+                headers={'Content-Disposition': f'attachment; filename={os.path.splitext(name)[0]}.zip'}
+            )
+        if package == 'gzip':
+            return Response(
+                gzip_chunks(output_file),
+                mimetype='application/gzip',
+                headers={'Content-Disposition': f'attachment; filename={name}.gz'}
+            )
         
+        # Highlighted workbooks and diff reports keep their own file name and type
         return send_file(
             output_file,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            mimetype=REPORT_MIMETYPES[os.path.splitext(output_file)[1].lower()],
             as_attachment=True,
-            download_name='comparison_result.xlsx'
+            download_name=name
         )
     except Exception as e:
-        print(f"Error in download_result: {str(e)}")
+        logger.error("Error in download_result: %s", e)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/metrics')
+def metrics_route():
+    # Stage times and counters of every comparison run by this worker process since it started
+    return jsonify(process_metrics.to_dict())
+
 @app.route('/clear', methods=['POST'])
 def clear():
     try:
         # Clear stored files
-        for key in ['PRELOAD_FILE', 'POSTLOAD_FILE', 'COMPARISON_RESULT']:
-            filepath = app.config.get(key)
-            if filepath and os.path.exists(filepath):
+        for key in ['PRELOAD_FILE', 'POSTLOAD_FILE']:
+            filepath = g.workspace.get(key)
+            if filepath and g.workspace.contains(filepath) and os.path.exists(filepath):
+                remove_columnar(filepath)
                 os.remove(filepath)
-            app.config[key] = None
+            g.workspace.delete(key)
             
         return jsonify({'message': 'Cleared successfully'})
     except Exception as e:
@@ -129,22 +357,30 @@ def clear():
 def get_column_suggestions_route():
     try:
         data = request.get_json()
-        preload_file = app.config['PRELOAD_FILE']
-        postload_file = app.config['POSTLOAD_FILE']
+        preload_file = uploaded_file('preload')
+        postload_file = uploaded_file('postload')
         pre_sheet = data.get('preSheet')
         post_sheet = data.get('postSheet')
         
         if not all([preload_file, postload_file, pre_sheet, post_sheet]):
             return jsonify({'error': 'Missing required files or sheet names'}), 400
         
-        pre_data = pd.read_excel(preload_file, sheet_name=pre_sheet)
-        post_data = pd.read_excel(postload_file, sheet_name=post_sheet)
+        pre_columns = read_sheet_columns(preload_file, pre_sheet)
+        post_columns = read_sheet_columns(postload_file, post_sheet)
+        
+        suggestions = get_column_suggestions(pre_columns, post_columns)
         
-        suggestions = get_column_suggestions(pre_data.columns, post_data.columns)
+        # Ranked candidates per postload column: overrides, exact base names, then fuzzy matches
+        matcher = ColumnMatcher(pre_columns, data.get('overrides'))
+        candidates = {
+            post_col: matcher.rank(post_col, limit=app.config['COLUMN_CANDIDATES'])
+            for post_col in post_columns
+        }
         
         return jsonify({
             'success': True,
-            'suggestions': suggestions
+            'suggestions': suggestions,
+            'candidates': candidates
         })
         
     except Exception as e:
@@ -154,6 +390,11 @@ def get_column_suggestions_route():
         })
 
 if __name__ == '__main__':
+    # Per-row and per-column details are logged at DEBUG
+    logging.basicConfig(
+        level=os.environ.get('POSTLOAD_LOG_LEVEL', 'INFO').upper(),
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+    )
     # Create upload folder if it doesn't exist
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,164 @@
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from chunked_compare import DEFAULT_CHUNK_SIZE, compare_large_files
+from comparison_logic import WORKER_START_METHOD, compare_workbooks
+from comparison_rules import compile_rules
+from diff_report import REPORT_FILES
+from metrics import Metrics, collecting
+from workbook_meta import read_workbook_metadata
+
+logger = logging.getLogger(__name__)
+
+# Postload sheets with more rows than this are compared out-of-core, chunk by chunk
+CHUNKED_ROW_THRESHOLD = 500_000
+# Counters that make a comparison's result differ from a clean migration
+DIFFERENCE_COUNTERS = ('cellsChanged', 'cellsMissing', 'blankKeys', 'unmatchedKeys', 'preloadOnlyKeys')
+# File names a batch directory pairs up: <name>_preload.xlsx with <name>_postload.xlsx
+PRELOAD_SUFFIX = '_preload'
+POSTLOAD_SUFFIX = '_postload'
+TABLE_EXTENSIONS = ('.xlsx', '.xlsm', '.csv', '.txt', '.parquet', '.pq')
+# Sheet mapping mode comparing rows by their order instead of a key
+COMPARE_BY_POSITION = 'position'
+
+def parse_sheet_mappings(entries):
+    """Sheet mappings in the /compare request format as compare_workbooks tuples.
+
+    Each entry has ``preloadSheet``, ``postloadSheet``, ``keyColumn`` (a column
+    or a list of columns) and optional ``columnOverrides`` and ``columnRules``
+    (postload column -> rule options, see comparison_rules.ColumnRule); entries
+    whose postload sheet is 'none' are skipped. An entry with
+    ``"mode": "position"`` compares its rows by their order and needs no key
+    column. Rules are compiled here, so invalid options fail before any work.
+    """
+    return [
+        (
+            entry['preloadSheet'], entry['postloadSheet'],
+            None if entry.get('mode') == COMPARE_BY_POSITION else entry['keyColumn'],
+            entry.get('columnOverrides'), compile_rules(entry.get('columnRules')),
+        )
+        for entry in entries
+        if entry.get('postloadSheet') != 'none'
+    ]
+
+def load_mapping_file(path):
+    """Read a JSON mapping file: ``{"sheetMappings": [...]}`` or just the list (see parse_sheet_mappings)"""
+    with open(path, encoding='utf-8') as f:
+        mapping = json.load(f)
+    if isinstance(mapping, dict):
+        mapping = mapping.get('sheetMappings', [])
+    sheet_mappings = parse_sheet_mappings(mapping)
+    if not sheet_mappings:
+        raise ValueError(f"No sheet mappings in {path}")
+    return sheet_mappings
+
+def find_pairs(directory, preload_suffix=PRELOAD_SUFFIX, postload_suffix=POSTLOAD_SUFFIX):
+    """``(name, preload_file, postload_file)`` for every <name><preload_suffix> file with a postload partner"""
+    files = {}
+    for filename in sorted(os.listdir(directory)):
+        stem, extension = os.path.splitext(filename)
+        if extension.lower() in TABLE_EXTENSIONS:
+            files.setdefault(stem, os.path.join(directory, filename))
+
+    pairs = []
+    for stem, preload_file in files.items():
+        if not stem.endswith(preload_suffix):
+            continue
+        name = stem[:-len(preload_suffix)]
+        postload_file = files.get(name + postload_suffix)
+        if postload_file is None:
+            logger.warning("No postload file for %s", os.path.basename(preload_file))
+            continue
+        pairs.append((name, preload_file, postload_file))
+    return pairs
+
+def compare_files(preload_file, postload_file, sheet_mappings, output_dir, report_format=None, chunked=None,
+                  chunked_row_threshold=CHUNKED_ROW_THRESHOLD, chunk_size=DEFAULT_CHUNK_SIZE, max_workers=None,
+                  write_only=False, snapshot_dir=None):
+    """Compare a preload/postload pair without the web app and summarize the outcome.
+
+    Runs compare_workbooks, or compare_large_files when a postload sheet has
+    more than ``chunked_row_threshold`` rows (``chunked`` forces either way),
+    writing a highlighted workbook or, with ``report_format``, a diff-only
+    report into ``output_dir``. Failures are logged and reported in the
+    summary rather than raised, so one bad pair does not stop a batch.
+
+    Returns a JSON-ready dict: ``status`` ('completed' or 'failed'), ``output``,
+    ``error``, ``seconds``, ``differences`` (see DIFFERENCE_COUNTERS) and the
+    run's ``metrics``.
+    """
+    started = time.perf_counter()
+    run_metrics = Metrics()
+    summary = {'preload': preload_file, 'postload': postload_file, 'status': 'failed', 'output': None, 'error': None}
+    try:
+        with collecting(run_metrics):
+            os.makedirs(output_dir, exist_ok=True)
+            if chunked is None:
+                post_rows = {sheet.name: sheet.rows for sheet in read_workbook_metadata(postload_file)}
+                chunked = any(
+                    (post_rows.get(mapping[1]) or 0) > chunked_row_threshold for mapping in sheet_mappings
+                )
+            if chunked:
+                output_name = REPORT_FILES[report_format] if report_format else 'comparison_result.xlsx'
+                output_file = os.path.join(output_dir, output_name)
+                summary['output'] = compare_large_files(
+                    preload_file, postload_file, sheet_mappings, output_file, chunk_size=chunk_size,
+                    report=bool(report_format)
+                )
+            else:
+                summary['output'] = compare_workbooks(
+                    preload_file, postload_file, sheet_mappings, output_dir, max_workers=max_workers,
+                    write_only=write_only, snapshot_dir=snapshot_dir, report_format=report_format
+                )
+        summary['status'] = 'completed'
+    except Exception as e:
+        logger.error("Error comparing %s with %s: %s", preload_file, postload_file, e)
+        summary['error'] = str(e)
+
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    summary['metrics'] = run_metrics.to_dict()
+    counters = summary['metrics']['counters']
+    summary['differences'] = sum(counters.get(name, 0) for name in DIFFERENCE_COUNTERS)
+    return summary
+
+def _compare_pair(args):
+    # Process pool entry point: compare one named pair into its own output folder
+    name, preload_file, postload_file, sheet_mappings, output_dir, options = args
+    if options.get('snapshot_dir'):
+        # Pairs compare the same sheet names, so each keeps its snapshots apart
+        options['snapshot_dir'] = os.path.join(options['snapshot_dir'], name)
+    summary = compare_files(preload_file, postload_file, sheet_mappings, os.path.join(output_dir, name), **options)
+    summary['name'] = name
+    return summary
+
+def compare_batch(pairs, sheet_mappings, output_dir, jobs=None, **options):
+    """Compare every ``(name, preload_file, postload_file)`` pair, ``jobs`` pairs at a time.
+
+    Each pair's result goes to ``output_dir/<name>``. ``options`` are passed to
+    compare_files. Returns a JSON-ready summary of the whole batch with the
+    compare_files summary of every pair, in ``pairs`` order.
+    """
+    tasks = [(name, pre, post, sheet_mappings, output_dir, dict(options)) for name, pre, post in pairs]
+    workers = min(jobs or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        results = [_compare_pair(task) for task in tasks]
+    else:
+        logger.info("Comparing %d file pairs with %d worker processes", len(tasks), workers)
+        # The pairs already keep every CPU busy, so each diffs its own sheets in turn
+        for task in tasks:
+            task[5]['max_workers'] = 1
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context(WORKER_START_METHOD)
+        ) as executor:
+            results = list(executor.map(_compare_pair, tasks))
+
+    return {
+        'pairs': results,
+        'completed': sum(result['status'] == 'completed' for result in results),
+        'failed': sum(result['status'] == 'failed' for result in results),
+        'differences': sum(result['differences'] for result in results),
+    }
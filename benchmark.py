@@ -0,0 +1,364 @@
+"""Benchmark the comparison pipeline on synthetic supplier-master workbooks.
+
+Example::
+
+    python benchmark.py --rows 100000 --columns 30 --sheets 2 --output bench.json
+
+Prints (or writes) a JSON report with the seconds, throughput and peak memory
+of every stage so runs can be compared across commits and machines.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+import metrics
+from chunked_compare import compare_large_files
+from comparison_logic import (
+    SheetComparison, column_widths, compare_workbooks, diff_frames, get_column_suggestions, index_keys,
+    match_columns, replace_sheet, write_streaming_sheet
+)
+from normalization import normalize_column
+from table_io import TABLE_SHEET_NAME, read_table
+from validation import find_similar_columns
+
+KEY_COLUMN = 'ALTKN_Prev'
+# Supplier master fields (SAP names) and the small value pools real extracts repeat
+FIELDS = [
+    ('NAME1', 'name'), ('LAND1', 'country'), ('ORT01', 'city'), ('PSTLZ', 'postcode'), ('STRAS', 'street'),
+    ('REGIO', 'region'), ('BANKS', 'country'), ('BANKL', 'bank'), ('BANKN', 'account'), ('WAERS', 'currency'),
+    ('ZTERM', 'terms'), ('AKONT', 'ledger'), ('KTOKK', 'group'), ('STCD1', 'account'), ('TELF1', 'phone'),
+    ('BUKRS', 'company'), ('EKORG', 'company'), ('SMTP_ADDR', 'email'), ('NAME2', 'name'), ('SORTL', 'name'),
+]
+POOLS = {
+    'country': ['DE', 'US', 'IN', 'GB', 'FR', 'NL', 'CN', 'BR'],
+    'city': ['Berlin', 'Austin', 'Pune', 'Leeds', 'Lyon', 'Delft', 'Wuxi', 'Recife'],
+    'region': ['01', '02', '07', '10', 'TX', 'MH', None],
+    'currency': ['EUR', 'USD', 'INR', 'GBP', 'CNY'],
+    'terms': ['0001', 'Z030', 'Z045', 'Z060'],
+    'ledger': [160000, 160010, 161000],
+    'group': ['ZVEN', 'ZEMP', 'ZONE'],
+    'company': [1000, 2000, 3100],
+    'bank': ['10070000', '37040044', 'HDFC0001234', None],
+}
+
+def generate_workbooks(directory, rows=10_000, columns=20, sheets=1, change_rate=0.02, blank_key_rate=0.01,
+                       duplicate_key_rate=0.005, file_format='xlsx', seed=0):
+    """Write a synthetic preload/postload pair and return ``(preload, postload, sheet_mappings)``.
+
+    The postload is the preload shuffled, with ``change_rate`` of its compared
+    cells edited (half of them blanked), ``blank_key_rate`` of its keys blanked and
+    ``duplicate_key_rate`` of the keys on both sides repeated. Postload keys are
+    stored as numbers and half of the postload column names carry a suffix, so
+    key cleaning and base-name matching are exercised as with real extracts.
+    CSV and Parquet files hold a single sheet.
+    """
+    rng = np.random.default_rng(seed)
+    if file_format != 'xlsx':
+        sheets = 1
+    pre_frames = OrderedDict()
+    post_frames = OrderedDict()
+    for sheet_idx in range(sheets):
+        pre = _supplier_frame(rng, rows, columns)
+        post = pre.sample(frac=1, random_state=seed + sheet_idx).reset_index(drop=True)
+        _duplicate_keys(rng, pre, duplicate_key_rate)
+        _duplicate_keys(rng, post, duplicate_key_rate)
+
+        value_columns = post.columns[1:]
+        edits = rng.random((len(post), len(value_columns))) < change_rate
+        for col_idx, column in enumerate(value_columns):
+            rows_edited = np.flatnonzero(edits[:, col_idx])
+            blanked = rows_edited[: len(rows_edited) // 2]
+            post[column] = post[column].astype(object)
+            post.loc[blanked, column] = None
+            post.loc[rows_edited[len(rows_edited) // 2:], column] = 'CHANGED'
+
+        post[KEY_COLUMN] = post[KEY_COLUMN].astype('int64').astype(object)
+        post.loc[rng.random(len(post)) < blank_key_rate, KEY_COLUMN] = None
+        post.columns = [KEY_COLUMN] + [
+            f'{column} Description' if idx % 2 else column for idx, column in enumerate(value_columns)
+        ]
+        pre_frames[f'Sheet{sheet_idx + 1}'] = pre
+        post_frames[f'Sheet{sheet_idx + 1}'] = post
+
+    pre_file = os.path.join(directory, f'preload.{file_format}')
+    post_file = os.path.join(directory, f'postload.{file_format}')
+    _write_frames(pre_frames, pre_file, file_format)
+    _write_frames(post_frames, post_file, file_format)
+    names = list(pre_frames) if file_format == 'xlsx' else [TABLE_SHEET_NAME]
+    return pre_file, post_file, [(name, name, KEY_COLUMN) for name in names]
+
+def _supplier_frame(rng, rows, columns):
+    data = OrderedDict()
+    data[KEY_COLUMN] = np.char.zfill((1_000_000 + np.arange(rows)).astype(str), 10).astype(object)
+    for idx in range(max(columns - 1, 1)):
+        name, kind = FIELDS[idx % len(FIELDS)]
+        if idx >= len(FIELDS):
+            name = f'{name}_{idx // len(FIELDS) + 1}'
+        data[name] = _field_values(rng, kind, rows)
+    return pd.DataFrame(data)
+
+def _field_values(rng, kind, rows):
+    if kind in POOLS:
+        pool = np.array(POOLS[kind], dtype=object)
+        return pool[rng.integers(0, len(pool), rows)]
+    numbers = rng.integers(0, 10 ** 9, rows)
+    if kind == 'name':
+        words = np.array(['Acme', 'Globex', 'Initech', 'Umbrella', 'Stark', 'Wayne', 'Hooli', 'Vandelay'], dtype=object)
+        return words[numbers % len(words)] + ' ' + (numbers % 997).astype(str).astype(object)
+    if kind == 'street':
+        return 'Main St ' + (numbers % 500).astype(str).astype(object)
+    if kind == 'postcode':
+        return np.char.zfill((numbers % 100_000).astype(str), 5).astype(object)
+    if kind == 'phone':
+        return '+49 ' + numbers.astype(str).astype(object)
+    if kind == 'email':
+        return 'ap' + (numbers % 10_000).astype(str).astype(object) + '@example.com'
+    return numbers.astype(str).astype(object)
+
+def _duplicate_keys(rng, frame, rate):
+    count = int(len(frame) * rate)
+    if count:
+        targets = rng.choice(len(frame), count, replace=False)
+        sources = rng.choice(len(frame), count, replace=False)
+        frame.loc[targets, KEY_COLUMN] = frame.loc[sources, KEY_COLUMN].to_numpy()
+
+def _write_frames(frames, path, file_format):
+    if file_format == 'csv':
+        next(iter(frames.values())).to_csv(path, index=False)
+    elif file_format == 'parquet':
+        frame = next(iter(frames.values()))
+        frame.astype({column: str for column in frame.columns if frame[column].dtype == object}).to_parquet(path)
+    else:
+        with pd.ExcelWriter(path) as writer:
+            for name, frame in frames.items():
+                frame.to_excel(writer, sheet_name=name, index=False)
+
+class StageTimer:
+    """Accumulates wall time and processed rows/cells per named stage"""
+
+    def __init__(self):
+        self.stages = OrderedDict()
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=0, cells=0):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.count(name, rows, cells)
+            self.stages[name]['seconds'] += time.perf_counter() - started
+
+    def count(self, name, rows=0, cells=0):
+        """Add rows/cells to a stage once they are known"""
+        entry = self.stages.setdefault(name, {'seconds': 0.0, 'rows': 0, 'cells': 0})
+        entry['rows'] += rows
+        entry['cells'] += cells
+
+    def report(self):
+        report = OrderedDict()
+        for name, entry in self.stages.items():
+            seconds = entry['seconds']
+            stage = {'seconds': round(seconds, 4)}
+            if entry['rows']:
+                stage['rows'] = entry['rows']
+                stage['rowsPerSecond'] = round(entry['rows'] / seconds) if seconds else None
+            if entry['cells']:
+                stage['cells'] = entry['cells']
+                stage['cellsPerSecond'] = round(entry['cells'] / seconds) if seconds else None
+            report[name] = stage
+        return report
+
+def run_stages(timer, preload_file, postload_file, sheet_mappings, write_only=False, output_dir=None):
+    """Run the in-memory pipeline one stage at a time, timing each stage"""
+    comparisons = []
+    for pre_sheet, post_sheet, key_column in sheet_mappings:
+        with timer.stage('read'):
+            pre_data = read_table(preload_file, pre_sheet)
+            post_data = read_table(postload_file, post_sheet)
+        rows, cells = len(post_data), post_data.size
+        timer.count('read', rows=len(pre_data) + rows, cells=pre_data.size + cells)
+
+        with timer.stage('match', cells=len(pre_data.columns) * len(post_data.columns)):
+            get_column_suggestions(pre_data.columns, post_data.columns)
+            column_mapping = match_columns(pre_data.columns, post_data.columns)
+        with timer.stage('fuzzyMatch', cells=len(pre_data.columns) * len(post_data.columns)):
+            find_similar_columns(list(map(str, pre_data.columns)), list(map(str, post_data.columns)))
+
+        with timer.stage('clean', rows=rows + len(pre_data)):
+            for post_col, pre_col in column_mapping.items():
+                normalize_column(pre_data[pre_col])
+                normalize_column(post_data[post_col])
+        with timer.stage('index', rows=len(pre_data)):
+            key_index = index_keys(pre_data, key_column)
+        with timer.stage('diff', rows=rows, cells=cells):
+            keys, changed, missing = diff_frames(pre_data, post_data, key_column, column_mapping, key_index)
+        comparisons.append(SheetComparison(
+            post_sheet, post_data, keys.blank_key, changed, missing, keys.unmatched_key,
+            duplicate_key=keys.duplicate_key
+        ))
+
+    output_file = os.path.join(output_dir, 'stages_result.xlsx')
+    rows = sum(len(comparison.data) for comparison in comparisons)
+    cells = sum(comparison.data.size for comparison in comparisons)
+    with timer.stage('widths', rows=rows, cells=cells):
+        for comparison in comparisons:
+            comparison.widths = column_widths(comparison.data)
+    if write_only or not postload_file.endswith('.xlsx'):
+        workbook = Workbook(write_only=True)
+        with timer.stage('style', rows=rows, cells=cells):
+            for comparison in comparisons:
+                write_streaming_sheet(workbook, comparison)
+    else:
+        with timer.stage('load', rows=rows, cells=cells):
+            shutil.copy2(postload_file, output_file)
+            workbook = load_workbook(output_file)
+        with timer.stage('style', rows=rows, cells=cells):
+            for comparison in comparisons:
+                replace_sheet(workbook, comparison)
+    with timer.stage('save', rows=rows, cells=cells):
+        workbook.save(output_file)
+
+def run_benchmark(rows=10_000, columns=20, sheets=1, change_rate=0.02, blank_key_rate=0.01,
+                  duplicate_key_rate=0.005, file_format='xlsx', write_only=False, workers=None,
+                  end_to_end=True, chunked=False, route=False, seed=0, work_dir=None):
+    """Generate inputs, time every stage and return the JSON-ready report"""
+    config = OrderedDict(
+        rows=rows, columns=columns, sheets=sheets, changeRate=change_rate, blankKeyRate=blank_key_rate,
+        duplicateKeyRate=duplicate_key_rate, format=file_format, writeOnly=write_only, workers=workers, seed=seed,
+    )
+    timer = StageTimer()
+    directory = tempfile.mkdtemp(prefix='postload_bench_', dir=work_dir)
+    try:
+        with timer.stage('generate', rows=rows * sheets * 2):
+            preload_file, postload_file, sheet_mappings = generate_workbooks(
+                directory, rows, columns, sheets, change_rate, blank_key_rate, duplicate_key_rate, file_format, seed
+            )
+        run_stages(timer, preload_file, postload_file, sheet_mappings, write_only, directory)
+
+        total_rows = rows * len(sheet_mappings)
+        total_cells = total_rows * columns
+        engine_metrics = metrics.Metrics()
+        if end_to_end:
+            with timer.stage('compareWorkbooks', rows=total_rows, cells=total_cells), \
+                    metrics.collecting(engine_metrics):
+                compare_workbooks(
+                    preload_file, postload_file, sheet_mappings, _fresh_dir(directory, 'compare'),
+                    max_workers=workers, write_only=write_only
+                )
+        if chunked:
+            with timer.stage('compareLargeFiles', rows=total_rows, cells=total_cells):
+                compare_large_files(
+                    preload_file, postload_file, sheet_mappings,
+                    os.path.join(_fresh_dir(directory, 'chunked'), 'comparison_result.xlsx')
+                )
+        if route:
+            with timer.stage('compareRoute', rows=total_rows, cells=total_cells):
+                _run_compare_route(preload_file, postload_file, sheet_mappings, write_only)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return OrderedDict(
+        config=config,
+        stages=timer.report(),
+        engineMetrics=engine_metrics.to_dict(),
+        peakRssBytes=peak_rss_bytes(),
+        python=platform.python_version(),
+        pandas=pd.__version__,
+        cpuCount=os.cpu_count(),
+    )
+
+def _fresh_dir(directory, name):
+    path = os.path.join(directory, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def _run_compare_route(preload_file, postload_file, sheet_mappings, write_only):
+    """Upload, compare and download through the Flask app, as a browser would"""
+    from app import app
+    client = app.test_client()
+    for file_type, path in (('preload', preload_file), ('postload', postload_file)):
+        with open(path, 'rb') as f:
+            response = client.post(f'/get_sheets/{file_type}', data={'file': (f, os.path.basename(path))})
+        if response.status_code != 200:
+            raise RuntimeError(f"Upload failed: {response.get_json()}")
+    response = client.post('/compare', json={
+        'streaming': write_only,
+        'sheetMappings': [
+            {'preloadSheet': pre_sheet, 'postloadSheet': post_sheet, 'keyColumn': key_column}
+            for pre_sheet, post_sheet, key_column in sheet_mappings
+        ],
+    })
+    status_url = response.get_json()['statusUrl']
+    while True:
+        state = client.get(status_url).get_json()
+        if state['status'] in ('completed', 'failed'):
+            break
+        time.sleep(0.1)
+    if state['status'] != 'completed':
+        raise RuntimeError(f"Comparison job failed: {state['error']}")
+    client.get(f"{status_url}/download")
+
+def peak_rss_bytes():
+    """Peak resident memory of this process and its finished children, None where unsupported"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return {'self': own, 'children': children}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000, help='rows per sheet')
+    parser.add_argument('--columns', type=int, default=20, help='columns per sheet, key included')
+    parser.add_argument('--sheets', type=int, default=1, help='sheet pairs to compare (xlsx only)')
+    parser.add_argument('--change-rate', type=float, default=0.02, help='share of postload cells edited')
+    parser.add_argument('--blank-key-rate', type=float, default=0.01, help='share of postload keys blanked')
+    parser.add_argument('--duplicate-key-rate', type=float, default=0.005, help='share of keys repeated')
+    parser.add_argument('--format', choices=['xlsx', 'csv', 'parquet'], default='xlsx')
+    parser.add_argument('--write-only', action='store_true', help='stream results into a write-only workbook')
+    parser.add_argument('--workers', type=int, default=None, help='processes for compare_workbooks')
+    parser.add_argument('--no-end-to-end', dest='end_to_end', action='store_false',
+                        help='skip the end-to-end compare_workbooks run')
+    parser.add_argument('--chunked', action='store_true', help='also time the out-of-core comparison')
+    parser.add_argument('--route', action='store_true', help='also time the /compare route through Flask')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', default=None, help='where to generate the workbooks (default: temp dir)')
+    parser.add_argument('--output', default=None, help='write the JSON report here instead of stdout')
+    parser.add_argument('--log-level', default='WARNING', help='pipeline log level (logged to stderr)')
+    args = parser.parse_args(argv)
+
+    # Keep stdout for the JSON report
+    logging.basicConfig(stream=sys.stderr, level=args.log_level.upper())
+    report = run_benchmark(
+        rows=args.rows, columns=args.columns, sheets=args.sheets, change_rate=args.change_rate,
+        blank_key_rate=args.blank_key_rate, duplicate_key_rate=args.duplicate_key_rate,
+        file_format=args.format, write_only=args.write_only, workers=args.workers,
+        end_to_end=args.end_to_end, chunked=args.chunked, route=args.route, seed=args.seed,
+        work_dir=args.work_dir,
+    )
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+import itertools
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+import metrics
+from comparison_logic import (
+    SheetComparison, append_comparison_rows, column_widths, count_comparison, diff_matched_rows, match_columns,
+    start_streaming_sheet
+)
+from comparison_rules import check_rule_columns, column_rule, compile_rules
+from diff_report import diff_records, preload_only_records, write_diff_report
+from key_index import KEY_EXAMPLES, clean_keys, display_key, key_columns, row_labels
+from metrics import timed
+from table_io import iter_table_chunks
+
+logger = logging.getLogger(__name__)
+
+# Rows per postload chunk; memory stays bounded by this plus the preload index
+DEFAULT_CHUNK_SIZE = 50_000
+
+class PreloadIndex:
+    """Cleaned preload rows spilled to disk and located through a compact key index.
+
+    Only a 64-bit hash and a file offset per key stay in memory (16 bytes a row);
+    the cleaned values are read back from the spill file for the keys a postload
+    chunk actually needs. The stored key is checked on read so a hash collision
+    can never match the wrong row. As in the in-memory comparison, the last row
+    wins for duplicate keys. Composite keys are indexed on their clean_keys()
+    string. ``columns`` are ``(column, rule)`` pairs: each column is spilled as
+    its rule cleans it.
+    """
+
+    def __init__(self, spill_path, columns, hashes, offsets, duplicate_keys=0, duplicate_rows=0):
+        self.spill_path = spill_path
+        self.columns = columns
+        self.hashes = hashes
+        self.offsets = offsets
+        # Keys found on more than one preload row, and how many rows they cover
+        self.duplicate_keys = duplicate_keys
+        self.duplicate_rows = duplicate_rows
+        # Keys matched by at least one postload row so far
+        self.used = np.zeros(len(hashes), dtype=bool)
+        self._spill = open(spill_path, 'rb')
+
+    @classmethod
+    def build(cls, chunks, key_column, columns, spill_path, rules=None):
+        """Stream preload chunks once, spilling the cleaned ``columns`` of keyed rows"""
+        hashes = []
+        offsets = []
+        with open(spill_path, 'wb') as spill:
+            for chunk in chunks:
+                keys = clean_keys(chunk, key_columns(key_column), rules)
+                has_key = keys != ''
+                if not has_key.any():
+                    continue
+                keys = keys[has_key]
+                values = [rule.clean(chunk[column]).to_numpy()[has_key] for column, rule in columns]
+
+                lines = [json.dumps(row).encode('utf-8') + b'\n' for row in zip(keys, *values)]
+                ends = spill.tell() + np.cumsum([len(line) for line in lines], dtype=np.int64)
+                offsets.append(ends - [len(line) for line in lines])
+                spill.write(b''.join(lines))
+                hashes.append(pd.util.hash_array(keys))
+
+        hashes = np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64)
+        offsets = np.concatenate(offsets) if offsets else np.empty(0, dtype=np.int64)
+
+        # Keep the last row per key, sorted by hash for searchsorted lookups
+        reversed_hashes = hashes[::-1]
+        hashes, first, counts = np.unique(reversed_hashes, return_index=True, return_counts=True)
+        offsets = offsets[::-1][first]
+        repeated = counts > 1
+        return cls(spill_path, list(columns), hashes, offsets, int(repeated.sum()), int(counts[repeated].sum()))
+
+    def lookup(self, keys, candidates):
+        """Find preload rows for ``keys`` where ``candidates`` is set.
+
+        Returns ``(matched, rows)``: a boolean mask over ``keys`` and an object
+        array of the cleaned preload values of the matched keys, one row each.
+        """
+        matched = np.zeros(len(keys), dtype=bool)
+        if not len(self.hashes) or not candidates.any():
+            return matched, np.empty((0, len(self.columns)), dtype=object)
+
+        rows_idx = np.flatnonzero(candidates)
+        key_hashes = pd.util.hash_array(keys[rows_idx].astype(object))
+        positions = np.searchsorted(self.hashes, key_hashes)
+        positions[positions == len(self.hashes)] = 0
+        found = self.hashes[positions] == key_hashes
+        rows_idx = rows_idx[found]
+        positions = positions[found]
+        offsets = self.offsets[positions]
+
+        # Read each needed spill line once, in file order
+        records = {}
+        for offset in np.unique(offsets):
+            self._spill.seek(offset)
+            records[offset] = json.loads(self._spill.readline())
+
+        rows = []
+        for row_idx, position, offset in zip(rows_idx, positions, offsets):
+            record = records[offset]
+            if record[0] == keys[row_idx]:
+                matched[row_idx] = True
+                self.used[position] = True
+                rows.append(record[1:])
+        rows = np.array(rows, dtype=object).reshape(len(rows), len(self.columns))
+        return matched, rows
+
+    def keys(self, positions):
+        """Display strings of the keys at the given positions"""
+        keys = []
+        for offset in self.offsets[positions]:
+            self._spill.seek(offset)
+            keys.append(display_key(json.loads(self._spill.readline())[0]))
+        return keys
+
+    def close(self):
+        self._spill.close()
+
+class PreloadRows:
+    """Cleaned preload rows read in step with the postload, for loads compared by row order.
+
+    Chunk sizes of the two sheets need not line up (blank rows are held back
+    and added to a later chunk), so preload rows are buffered and each postload
+    chunk takes exactly as many rows as it has. ``columns`` are
+    ``(column, rule)`` pairs, as for PreloadIndex.
+    """
+
+    def __init__(self, chunks, columns):
+        self.chunks = chunks
+        self.columns = columns
+        # Preload rows read but not yet paired with a postload row
+        self.pending = []
+        # Preload rows read so far, and how many of them had a postload row
+        self.rows_read = 0
+        self.rows_matched = 0
+
+    def lookup(self, chunk):
+        """``(matched, rows)`` for a postload chunk, as PreloadIndex.lookup returns them"""
+        available = sum(len(frame) for frame in self.pending)
+        while available < len(chunk):
+            pre_chunk = next(self.chunks, None)
+            if pre_chunk is None:
+                break
+            self.pending.append(pre_chunk)
+            self.rows_read += len(pre_chunk)
+            available += len(pre_chunk)
+
+        count = min(available, len(chunk))
+        matched = np.arange(len(chunk)) < count
+        self.rows_matched += count
+        rows = np.empty((count, len(self.columns)), dtype=object)
+        if count:
+            pending = pd.concat(self.pending, ignore_index=True) if len(self.pending) > 1 else self.pending[0]
+            for idx, (column, rule) in enumerate(self.columns):
+                rows[:, idx] = rule.clean(pending[column].iloc[:count]).to_numpy()
+            self.pending = [pending.iloc[count:]] if count < len(pending) else []
+        return matched, rows
+
+    def preload_only(self):
+        """Preload rows past the end of the postload, once every postload chunk was looked up"""
+        self.rows_read += sum(len(chunk) for chunk in self.chunks)
+        return np.arange(self.rows_matched, self.rows_read)
+
+def compare_sheet_chunked(workbook, preload_file, postload_file, pre_sheet, post_sheet, key_column,
+                          spill_dir, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, column_overrides=None,
+                          records=None, column_rules=None):
+    """Diff one sheet pair chunk by chunk, appending highlighted rows to a write-only workbook.
+
+    When a ``records`` list is given instead of a workbook, only the differences
+    of each chunk are appended to it (see diff_records). A ``key_column`` of
+    None compares the rows by their order (see PreloadRows).
+    """
+    pre_chunks = iter_table_chunks(preload_file, pre_sheet, chunk_size)
+    post_chunks = iter_table_chunks(postload_file, post_sheet, chunk_size)
+    first_pre = next(pre_chunks)
+    first_post = next(post_chunks)
+
+    logger.debug("Starting column mapping process for %s", post_sheet)
+    column_mapping = match_columns(first_pre.columns, first_post.columns, column_overrides)
+    rules = compile_rules(column_rules)
+    check_rule_columns(rules, first_post.columns)
+    keys = key_columns(key_column)
+    # Preload columns are kept cleaned by the rule of each post column mapped to them
+    pre_columns = list(dict.fromkeys(
+        (pre_col, column_rule(rules, post_col)) for post_col, pre_col in column_mapping.items() if post_col not in keys
+    ))
+    column_positions = {column: idx for idx, column in enumerate(pre_columns)}
+
+    if key_column is None:
+        index = None
+        positional = PreloadRows(itertools.chain([first_pre], pre_chunks), pre_columns)
+    else:
+        logger.debug("Indexing preload sheet %s", pre_sheet)
+        with timed('index'):
+            index = PreloadIndex.build(
+                itertools.chain([first_pre], pre_chunks), key_column, pre_columns,
+                os.path.join(spill_dir, 'preload.jsonl'), rules
+            )
+    try:
+        if records is None:
+            # Column widths are estimated from the first chunk: write-only sheets need them up front
+            worksheet = start_streaming_sheet(workbook, post_sheet, first_post.columns, column_widths(first_post))
+
+        rows_done = 0
+        post_hashes = []
+        for chunk in itertools.chain([first_post], post_chunks):
+            chunk = chunk.reset_index(drop=True)
+            with timed('diff'):
+                if index is None:
+                    blank_key = np.zeros(len(chunk), dtype=bool)
+                    matched, pre_rows = positional.lookup(chunk)
+                else:
+                    post_keys = clean_keys(chunk, keys, rules)
+                    blank_key = post_keys == ''
+                    matched, pre_rows = index.lookup(post_keys, ~blank_key)
+                    post_hashes.append(pd.util.hash_array(post_keys[~blank_key]))
+
+                changed, missing = diff_matched_rows(
+                    chunk, key_column, column_mapping, matched,
+                    lambda pre_col, rule: pre_rows[:, column_positions[pre_col, rule]], rules
+                )
+            comparison = SheetComparison(post_sheet, chunk, blank_key, changed, missing, ~matched & ~blank_key)
+            count_comparison(comparison, sheets=0)
+            if records is None:
+                append_comparison_rows(worksheet, comparison)
+            else:
+                with timed('report'):
+                    # The matched rows' preload values are the rows of pre_rows, in chunk order
+                    slots = np.cumsum(matched) - 1
+                    records.append(diff_records(
+                        post_sheet, chunk, key_column, column_mapping, blank_key, comparison.unmatched_key,
+                        changed, missing,
+                        lambda pre_col, rule, rows: pre_rows[slots[rows], column_positions[pre_col, rule]],
+                        row_offset=rows_done, rules=rules
+                    ))
+
+            rows_done += len(chunk)
+            if progress:
+                progress(post_sheet, rows_done, None)
+        if index is None:
+            preload_only = positional.preload_only()
+            metrics.count('preloadOnlyKeys', len(preload_only))
+            if len(preload_only):
+                logger.warning("%s: %d preload rows are past the end of the postload", post_sheet, len(preload_only))
+            preload_only_keys = lambda: row_labels(preload_only)
+        else:
+            preload_only = report_chunked_keys(post_sheet, index, post_hashes)
+            preload_only_keys = lambda: index.keys(preload_only)
+        if records is not None and len(preload_only):
+            with timed('report'):
+                records.append(preload_only_records(post_sheet, preload_only_keys()))
+    finally:
+        if index is not None:
+            index.close()
+    metrics.count('sheetsCompared')
+    return rows_done
+
+def report_chunked_keys(sheet_name, index, post_hashes):
+    """Count and log duplicate and preload-only keys of a chunked comparison.
+
+    Postload keys are only kept as hashes, so their duplicates are counted by hash.
+    Returns the index positions of the preload-only keys.
+    """
+    post_hashes = np.concatenate(post_hashes) if post_hashes else np.empty(0, dtype=np.uint64)
+    _, counts = np.unique(post_hashes, return_counts=True)
+    repeated = counts[counts > 1]
+    preload_only = np.flatnonzero(~index.used)
+
+    metrics.count('duplicatePreloadKeys', index.duplicate_keys)
+    metrics.count('duplicatePostloadKeys', len(repeated))
+    metrics.count('preloadOnlyKeys', len(preload_only))
+    if index.duplicate_keys:
+        logger.warning(
+            "%s: %d keys repeat on %d preload rows (the last row is compared)",
+            sheet_name, index.duplicate_keys, index.duplicate_rows
+        )
+    if len(repeated):
+        logger.warning("%s: %d keys repeat on %d postload rows", sheet_name, len(repeated), int(repeated.sum()))
+    if len(preload_only):
+        logger.warning(
+            "%s: %d preload keys are missing from the postload, e.g. %s",
+            sheet_name, len(preload_only), index.keys(preload_only[:KEY_EXAMPLES])
+        )
+    return preload_only
+
+def compare_large_files(preload_file, postload_file, sheet_mappings, output_file,
+                        chunk_size=DEFAULT_CHUNK_SIZE, progress=None, report=False):
+    """Out-of-core variant of compare_workbooks for postloads larger than memory.
+
+    The preload of each mapping is indexed once, then the postload is streamed in
+    chunks of ``chunk_size`` rows that are diffed and written straight into a
+    write-only workbook. Inputs may be xlsx, CSV or Parquet files.
+    ``progress(sheet_name, rows_done, None)`` is called after every chunk.
+    With ``report`` only the differences are written, as a long-format report
+    in the format of ``output_file``'s extension (see write_diff_report).
+    """
+    try:
+        workbook = None if report else Workbook(write_only=True)
+        records = [] if report else None
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_file))) as spill_dir:
+            for mapping in sheet_mappings:
+                pre_sheet, post_sheet, key_column = mapping[:3]
+                rows = compare_sheet_chunked(
+                    workbook, preload_file, postload_file, pre_sheet, post_sheet, key_column,
+                    spill_dir, chunk_size, progress, column_overrides=mapping[3] if len(mapping) > 3 else None,
+                    records=records, column_rules=mapping[4] if len(mapping) > 4 else None
+                )
+                if progress:
+                    progress(post_sheet, rows, rows)
+        if report:
+            write_diff_report(records, output_file)
+        else:
+            with timed('save'):
+                workbook.save(output_file)
+        logger.info("Comparison completed and saved to %s", output_file)
+        return output_file
+
+    except Exception as e:
+        logger.error("Error in compare_large_files: %s", e)
+        raise
@@ -0,0 +1,115 @@
+"""Compare preload/postload files from the command line, without the web app.
+
+Examples::
+
+    python cli.py compare preload.xlsx postload.xlsx --mapping mapping.json --output-dir result
+    python cli.py batch exports/ --mapping mapping.json --output-dir results --jobs 4 --report csv
+
+The mapping file lists the sheet mappings in the format the web app's
+/compare request uses::
+
+    {"sheetMappings": [{"preloadSheet": "Sheet4", "postloadSheet": "Sheet1",
+                        "keyColumn": ["LIFNR", "BUKRS"], "columnOverrides": {"NAME1 Name": "NAME1"}}]}
+
+A mapping with ``"mode": "position"`` instead of a ``keyColumn`` compares the
+sheets row by row, for loads that keep the preload's row order. Optional
+``columnRules`` tune how postload columns compare (see comparison_rules)::
+
+    "columnRules": {"WRBTR": {"tolerance": 0.01}, "NAME1": {"ignoreCase": true, "collapseWhitespace": true},
+                    "ALTKN": {"leadingZeros": "strip"}, "ERDAT": {"date": "%d.%m.%Y"}}
+
+``batch`` compares every <name>_preload / <name>_postload file pair of a
+directory, each into its own folder. A JSON summary is printed to stdout (or
+written with --summary) and the exit status tells the outcome: 0 when
+nothing differs, 1 when differences were found, 2 when a comparison failed.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from batch import (
+    POSTLOAD_SUFFIX, PRELOAD_SUFFIX, compare_batch, compare_files, find_pairs, load_mapping_file
+)
+from diff_report import REPORT_FILES
+
+logger = logging.getLogger(__name__)
+
+EXIT_OK = 0
+EXIT_DIFFERENCES = 1
+EXIT_FAILED = 2
+
+def exit_status(summaries):
+    """EXIT_FAILED if any comparison failed, else EXIT_DIFFERENCES if any found differences, else EXIT_OK"""
+    if any(summary['status'] == 'failed' for summary in summaries):
+        return EXIT_FAILED
+    if any(summary['differences'] for summary in summaries):
+        return EXIT_DIFFERENCES
+    return EXIT_OK
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    compare = commands.add_parser('compare', help='compare one preload/postload pair')
+    compare.add_argument('preload', help='preload workbook, CSV or Parquet file')
+    compare.add_argument('postload', help='postload workbook, CSV or Parquet file')
+
+    batch = commands.add_parser('batch', help='compare every file pair of a directory')
+    batch.add_argument('directory', help='folder holding <name>_preload and <name>_postload files')
+    batch.add_argument('--jobs', type=int, default=None, help='pairs compared at once (default: one per CPU)')
+    batch.add_argument('--preload-suffix', default=PRELOAD_SUFFIX)
+    batch.add_argument('--postload-suffix', default=POSTLOAD_SUFFIX)
+
+    for command in (compare, batch):
+        command.add_argument('--mapping', required=True, help='JSON file with the sheet mappings')
+        command.add_argument('--output-dir', required=True, help='where results are written')
+        command.add_argument('--report', choices=sorted(REPORT_FILES), default=None,
+                             help='write a diff-only report instead of a highlighted workbook')
+        command.add_argument('--chunked', action='store_true', default=None,
+                             help='compare out-of-core, chunk by chunk (default: only for large sheets)')
+        command.add_argument('--write-only', action='store_true', help='stream results into a write-only workbook')
+        command.add_argument('--snapshot-dir', default=None,
+                             help='keep diff snapshots here so re-runs only diff rows that changed')
+        command.add_argument('--summary', default=None, help='write the JSON summary here instead of stdout')
+        command.add_argument('--log-level', default='INFO', help='log level (logged to stderr)')
+    args = parser.parse_args(argv)
+
+    # Keep stdout for the JSON summary
+    logging.basicConfig(
+        stream=sys.stderr, level=args.log_level.upper(), format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+    )
+    try:
+        sheet_mappings = load_mapping_file(args.mapping)
+    except Exception as e:
+        logger.error("Error in mapping file %s: %s", args.mapping, e)
+        return EXIT_FAILED
+
+    options = {
+        'report_format': args.report, 'chunked': args.chunked, 'write_only': args.write_only,
+        'snapshot_dir': args.snapshot_dir,
+    }
+    if args.command == 'compare':
+        summary = compare_files(args.preload, args.postload, sheet_mappings, args.output_dir, **options)
+        status = exit_status([summary])
+    else:
+        pairs = find_pairs(args.directory, args.preload_suffix, args.postload_suffix)
+        if not pairs:
+            # An empty batch means the exports are missing, which is no clean run either
+            logger.error("No file pairs found in %s", args.directory)
+        summary = compare_batch(pairs, sheet_mappings, args.output_dir, jobs=args.jobs, **options)
+        status = exit_status(summary['pairs']) if pairs else EXIT_FAILED
+    summary['exitStatus'] = status
+
+    text = json.dumps(summary, indent=2)
+    if args.summary:
+        os.makedirs(os.path.dirname(os.path.abspath(args.summary)), exist_ok=True)
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
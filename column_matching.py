@@ -0,0 +1,118 @@
+import heapq
+import re
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+
+_SEPARATORS = re.compile(r'[\W_]+')
+
+# Similarity below which fuzzy candidates are dropped (difflib's default cutoff)
+FUZZY_CUTOFF = 0.6
+
+def get_base_column_name(column_name):
+    """Get the base column name (first word before any separator or space)"""
+    for word in _SEPARATORS.split(str(column_name).strip().upper()):
+        if word:
+            return word
+    return str(column_name).upper()
+
+class ColumnMatcher:
+    """Index of candidate columns, built once per sheet, that ranks matches for other columns.
+
+    Three strategies are tried in order: explicit ``overrides`` (column -> candidate,
+    or None to leave a column unmatched), exact base-name matches and fuzzy
+    similarity. Base names and padded bigrams of every candidate are computed up
+    front, so a lookup is a dict hit for exact matches and fuzzy ones score the
+    candidates sharing the most bigrams with the column first.
+    """
+
+    def __init__(self, candidates, overrides=None):
+        self.candidates = list(candidates)
+        self.overrides = dict(overrides or {})
+        unknown = [target for target in self.overrides.values() if target is not None and target not in self.candidates]
+        if unknown:
+            raise ValueError(f"Column overrides name unknown columns: {', '.join(map(str, unknown))}")
+
+        self._by_base = defaultdict(list)
+        self._names = []
+        self._by_gram = defaultdict(list)
+        for idx, candidate in enumerate(self.candidates):
+            self._by_base[get_base_column_name(candidate)].append(idx)
+            name = _fuzzy_name(candidate)
+            self._names.append(name)
+            for gram in set(_bigrams(name)):
+                self._by_gram[gram].append(idx)
+
+    def exact(self, column):
+        """Candidates sharing the column's base name, in candidate order"""
+        return [self.candidates[idx] for idx in self._by_base.get(get_base_column_name(column), ())]
+
+    def fuzzy(self, column, cutoff=FUZZY_CUTOFF, limit=None):
+        """Up to ``limit`` ``(candidate, score)`` pairs scoring at least ``cutoff``, best first.
+
+        Scores and order are those of get_close_matches on the upper-cased names:
+        ties go to the greater name, then to the earlier candidate. Candidates
+        sharing the most bigrams are scored first, so with a ``limit`` the bar
+        rises quickly and most others are rejected by difflib's cheap upper
+        bounds without computing their ratio.
+        """
+        name = _fuzzy_name(column)
+        shared = Counter()
+        for gram in set(_bigrams(name)):
+            shared.update(self._by_gram.get(gram, ()))
+        order = [idx for idx, _ in sorted(shared.items(), key=lambda item: (-item[1], item[0]))]
+        # Names sharing no bigram can still reach the cutoff ('QABCR' and 'AXBYC' score 0.6)
+        order.extend(idx for idx in range(len(self.candidates)) if idx not in shared)
+
+        matcher = SequenceMatcher()
+        matcher.set_seq2(name)
+        best = []
+        for idx in order:
+            # Ties with the current bar are still scored, as they may win on their name
+            bar = best[0][0] if limit and len(best) >= limit else cutoff
+            matcher.set_seq1(self._names[idx])
+            if matcher.real_quick_ratio() < bar or matcher.quick_ratio() < bar:
+                continue
+            score = matcher.ratio()
+            if score < bar:
+                continue
+            heapq.heappush(best, (score, self._names[idx], -idx))
+            if limit and len(best) > limit:
+                heapq.heappop(best)
+        best.sort(reverse=True)
+        return [(self.candidates[-idx], round(score, 4)) for score, _, idx in best]
+
+    def rank(self, column, fuzzy=True, cutoff=FUZZY_CUTOFF, limit=None):
+        """Ranked candidates as ``{'column', 'score', 'strategy'}`` dicts: override, exact, then fuzzy"""
+        if column in self.overrides:
+            target = self.overrides[column]
+            return [] if target is None else [{'column': target, 'score': 1.0, 'strategy': 'override'}]
+
+        ranked = [{'column': candidate, 'score': 1.0, 'strategy': 'exact'} for candidate in self.exact(column)]
+        if fuzzy and (limit is None or len(ranked) < limit):
+            seen = set(self.exact(column))
+            ranked.extend(
+                {'column': candidate, 'score': score, 'strategy': 'fuzzy'}
+                for candidate, score in self.fuzzy(column, cutoff, limit and limit + len(seen)) if candidate not in seen
+            )
+        return ranked[:limit]
+
+    def match(self, column, fuzzy=False, cutoff=FUZZY_CUTOFF):
+        """Best candidate for the column, or None"""
+        ranked = self.rank(column, fuzzy, cutoff, limit=1)
+        return ranked[0]['column'] if ranked else None
+
+    def mapping(self, columns, fuzzy=False, cutoff=FUZZY_CUTOFF):
+        """Map each column to its best candidate, leaving out unmatched columns"""
+        matches = {}
+        for column in columns:
+            candidate = self.match(column, fuzzy, cutoff)
+            if candidate is not None:
+                matches[column] = candidate
+        return matches
+
+def _fuzzy_name(column):
+    return str(column).strip().upper()
+
+def _bigrams(name):
+    padded = f' {name} '
+    return [padded[idx:idx + 2] for idx in range(len(padded) - 1)]
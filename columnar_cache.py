@@ -0,0 +1,152 @@
+import json
+import logging
+import os
+import pickle
+import shutil
+import threading
+import uuid
+
+import pandas as pd
+
+from table_io import TABLE_SHEET_NAME, file_hash, iter_table_chunks, read_table, table_format
+from workspaces import write_json_atomic
+
+# Converted sheets live in this folder next to the uploaded file, one subfolder per content hash
+COLUMNAR_DIR = '.columnar'
+MANIFEST = 'manifest.json'
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# Content hash -> event set once an in-flight conversion finishes
+_converting = {}
+
+def columnar_dir(filepath, digest=None):
+    """Folder holding the converted sheets of a file's current content"""
+    return os.path.join(os.path.dirname(os.path.abspath(filepath)), COLUMNAR_DIR, digest or file_hash(filepath))
+
+def convert_to_columnar(filepath, max_rows=None, row_counts=None):
+    """Parse every sheet of an uploaded file once and store it in a columnar format.
+
+    Sheets are written as Arrow IPC (Feather) files, which needs pyarrow; without
+    it nothing is converted. Sheets Arrow cannot hold exactly (mixed-type object
+    columns, non-string column names) fall back to pickle, which still skips the
+    Excel parse. With ``max_rows``, sheets with more rows or an unknown count in
+    ``row_counts`` are left out, since those may be compared chunk by chunk
+    anyway. Parquet files are already columnar and are not converted.
+    """
+    file_format = table_format(filepath)
+    if file_format == 'parquet':
+        return
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        logger.warning("Columnar conversion requires the 'pyarrow' package; %s is read from the upload",
+                       os.path.basename(filepath))
+        return
+    digest = file_hash(filepath)
+    target = columnar_dir(filepath, digest)
+    if os.path.exists(os.path.join(target, MANIFEST)):
+        return
+
+    with _lock:
+        if digest in _converting:
+            return
+        done = _converting[digest] = threading.Event()
+    try:
+        os.makedirs(target, exist_ok=True)
+        manifest = {}
+        for idx, (sheet_name, df) in enumerate(_parse_sheets(filepath, file_format, max_rows, row_counts or {})):
+            manifest[sheet_name] = _write_sheet(df, target, str(idx))
+        # The manifest is written last, so its presence marks a complete conversion
+        write_json_atomic(os.path.join(target, MANIFEST), manifest)
+        logger.info("Converted %d sheets of %s to columnar files", len(manifest), os.path.basename(filepath))
+    except Exception as e:
+        logger.error("Error converting %s to columnar files: %s", os.path.basename(filepath), e)
+    finally:
+        with _lock:
+            _converting.pop(digest, None)
+        done.set()
+
+def start_conversion(filepath, max_rows=None, row_counts=None):
+    """Run convert_to_columnar on a background thread so uploads return immediately"""
+    thread = threading.Thread(
+        target=convert_to_columnar, args=(filepath, max_rows, row_counts), name='columnar-convert', daemon=True
+    )
+    thread.start()
+    return thread
+
+def load_columnar(filepath, sheet_name):
+    """Read a converted sheet, or None if the file was never converted or the sheet was skipped.
+
+    Waits for a conversion of the same file still running in this process
+    rather than parsing the workbook a second time.
+    """
+    digest = file_hash(filepath)
+    with _lock:
+        converting = _converting.get(digest)
+    if converting is not None:
+        converting.wait()
+
+    target = columnar_dir(filepath, digest)
+    try:
+        with open(os.path.join(target, MANIFEST), encoding='utf-8') as f:
+            entry = json.load(f).get(sheet_name)
+    except FileNotFoundError:
+        return None
+    if entry is None:
+        return None
+
+    path = os.path.join(target, entry['file'])
+    if entry['format'] == 'feather':
+        from pyarrow import feather
+        # Memory-mapped, with one block per column so numeric columns without nulls
+        # use the mapped pages instead of a copy
+        return feather.read_table(path, memory_map=True).to_pandas(split_blocks=True, self_destruct=True)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def remove_columnar(filepath):
+    """Delete the converted sheets of a file"""
+    if os.path.exists(filepath):
+        shutil.rmtree(columnar_dir(filepath), ignore_errors=True)
+
+def _parse_sheets(filepath, file_format, max_rows, row_counts):
+    if file_format != 'excel':
+        if max_rows is None:
+            yield TABLE_SHEET_NAME, read_table(filepath, TABLE_SHEET_NAME)
+            return
+        # CSV row counts are unknown up front: one row more than allowed tells a table is too long
+        df = next(iter_table_chunks(filepath, TABLE_SHEET_NAME, max_rows + 1), None)
+        if df is not None and len(df) <= max_rows:
+            yield TABLE_SHEET_NAME, df
+        return
+    # One ExcelFile opens the workbook once for all of its sheets
+    with pd.ExcelFile(filepath) as excel:
+        for sheet_name in excel.sheet_names:
+            rows = row_counts.get(sheet_name)
+            if max_rows is not None and (rows is None or rows > max_rows):
+                continue
+            yield sheet_name, excel.parse(sheet_name)
+
+def _write_sheet(df, directory, name):
+    tmp_path = os.path.join(directory, f'{name}.{uuid.uuid4().hex}.tmp')
+    try:
+        from pyarrow import feather
+        feather.write_feather(df, tmp_path)
+        # Keep Arrow only if it gives back exactly what pandas parsed
+        restored = feather.read_table(tmp_path).to_pandas()
+        if restored.equals(df) and restored.dtypes.equals(df.dtypes) and restored.columns.equals(df.columns):
+            os.replace(tmp_path, os.path.join(directory, f'{name}.feather'))
+            return {'file': f'{name}.feather', 'format': 'feather'}
+    except Exception:
+        # Arrow rejects mixed-type object columns and non-string column names (or is not installed)
+        pass
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    tmp_path = os.path.join(directory, f'{name}.{uuid.uuid4().hex}.tmp')
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, os.path.join(directory, f'{name}.pkl'))
+    return {'file': f'{name}.pkl', 'format': 'pickle'}
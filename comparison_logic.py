@@ -1,173 +1,546 @@
+import logging
+import multiprocessing
+import numpy as np
 import pandas as pd
-from openpyxl import load_workbook
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import PatternFill
 from openpyxl.utils import get_column_letter
 import os
 import shutil
+from concurrent.futures import ProcessPoolExecutor
+from column_matching import ColumnMatcher, get_base_column_name
+from comparison_rules import check_rule_columns, column_rule, compile_rules, rules_signature
+from diff_report import REPORT_FILES, diff_records, preload_only_records, write_diff_report
+# clean_value is re-exported: it was defined here before normalization.py existed
+from normalization import blank_code, clean_value, encode_values
+from incremental import DiffSnapshot, row_hashes, snapshot_path
+from key_index import KeyIndex, RowMatch, key_columns
+from table_io import file_hash, table_format
+from workbook_cache import read_sheet
+import metrics
+from metrics import timed
 
-def clean_value(value):
-    """Clean and standardize value for comparison"""
-    if value is None or pd.isna(value):
-        return ''
-    # Convert to string, remove all leading/trailing spaces
-    cleaned = str(value).strip()
-    
-    # Handle decimal numbers (convert to integer string)
-    try:
-        if '.' in cleaned:
-            cleaned = str(int(float(cleaned)))
-        elif cleaned.isdigit():
-            cleaned = str(int(cleaned))
-    except ValueError:
-        pass
-    
-    return cleaned
+logger = logging.getLogger(__name__)
 
-def get_base_column_name(column_name):
-    """Get the base column name (first word before any separator or space)"""
-    try:
-        # Convert to string and uppercase
-        col_name = str(column_name).strip().upper()
-        
-        # Remove all special characters and replace with space
-        cleaned_name = ''
-        for char in col_name:
-            if char.isalnum():
-                cleaned_name += char
-            else:
-                cleaned_name += ' '
-        
-        # Get the first word
-        base_name = cleaned_name.split()[0]
-        return base_name
-        
-    except Exception as e:
-        print(f"Error processing column name '{column_name}': {str(e)}")
-        return str(column_name).upper()
+# Colors for highlighting
+CHANGED_FILL = PatternFill(start_color='FFF2CC', end_color='FFF2CC', fill_type='solid')  # yellow
+MISSING_FILL = PatternFill(start_color='E5A78C', end_color='E5A78C', fill_type='solid')  # red
+BLANK_KEY_FILL = PatternFill(start_color='E6F3FF', end_color='E6F3FF', fill_type='solid')  # blue
+
+# Rows written between progress callbacks
+PROGRESS_INTERVAL = 5000
+# Worker processes start fresh rather than forking a parent that holds threads and locks (the web app's jobs)
+WORKER_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+# Widest a column gets when auto-adjusted to its longest value
+MAX_COLUMN_WIDTH = 50
+# Object column kinds (pd.api.types.infer_dtype) whose equal values always print the same
+_DEDUPED_KINDS = {
+    'string', 'bytes', 'empty', 'integer', 'floating', 'boolean', 'datetime', 'datetime64', 'date',
+    'timedelta', 'timedelta64', 'time', 'period',
+}
 
 def get_column_suggestions(pre_columns, post_columns):
     """Get all possible column matches between pre and post data"""
     column_suggestions = {}
+    matcher = ColumnMatcher(pre_columns)
     
-    print("\nAnalyzing possible column matches:")
+    debug = logger.isEnabledFor(logging.DEBUG)
+    logger.debug("Analyzing possible column matches")
     for post_col in post_columns:
-        post_base = get_base_column_name(post_col)
-        matches = []
-        
-        for pre_col in pre_columns:
-            pre_base = get_base_column_name(pre_col)
-            if post_base == pre_base:
-                matches.append(pre_col)
-                print(f"Found match: {post_col} -> {pre_col} (base: {post_base})")
+        matches = matcher.exact(post_col)
+        if debug:
+            for pre_col in matches:
+                logger.debug("Found match: %s -> %s (base: %s)", post_col, pre_col, get_base_column_name(post_col))
         
         if matches:
             column_suggestions[post_col] = matches
     
     return column_suggestions
 
-def compare_excel_files(preload_file, postload_file, pre_sheet, post_sheet, key_column, output_dir):
+def match_columns(pre_columns, post_columns, overrides=None):
+    """Map each post column to the first pre column sharing its base name, or to its override (None leaves it out)"""
+    with timed('mapping'):
+        column_mapping = ColumnMatcher(pre_columns, overrides).mapping(post_columns)
+    if logger.isEnabledFor(logging.DEBUG):
+        for post_col, pre_col in column_mapping.items():
+            logger.debug("Matched: %s -> %s", post_col, pre_col)
+    return column_mapping
+
+def diff_frames(pre_data, post_data, key_column, column_mapping, key_index=None, rules=None):
+    """Join post rows to pre rows on the cleaned key column(s): (KeyMatch, changed mask, missing mask)"""
+    # key_index is the preload's index_keys() result when already known; rules apply to key columns too
+    if key_index is None:
+        key_index = index_keys(pre_data, key_column, rules)
+    keys = key_index.lookup(post_data)
+    changed, missing = diff_aligned(
+        pre_data, post_data, key_column, column_mapping, keys.matched, keys.aligned_rows, rules
+    )
+    return keys, changed, missing
+
+def diff_aligned(pre_data, post_data, key_column, column_mapping, matched, aligned_rows, rules=None):
+    """Changed/missing masks for the post rows flagged in ``matched``, whose pre rows are ``aligned_rows``"""
+    # Each preload column is normalized once per rule, however many post columns map to it
+    pre_normalized = {}
+    def aligned_pre_values(pre_col, rule):
+        if (pre_col, rule) not in pre_normalized:
+            pre_normalized[pre_col, rule] = rule.normalize(pre_data[pre_col])
+        normalized = pre_normalized[pre_col, rule]
+        return pd.Categorical.from_codes(normalized.codes[aligned_rows], categories=normalized.categories)
+
+    return diff_matched_rows(post_data, key_column, column_mapping, matched, aligned_pre_values, rules)
+
+def diff_positional(pre_data, post_data, column_mapping, rules=None):
+    """diff_frames for loads that keep the row order: each post row is compared with the pre row at its position"""
+    # A RowMatch stands in for the KeyMatch; no column is a key, so every mapped column is compared
+    rows = RowMatch(len(pre_data), len(post_data))
+    changed, missing = diff_aligned(pre_data, post_data, [], column_mapping, rows.matched, rows.aligned_rows, rules)
+    return rows, changed, missing
+
+def index_keys(pre_data, key_column, rules=None):
+    """Index a preload sheet on its cleaned key column(s) (see KeyIndex)"""
+    with timed('index'):
+        return KeyIndex.build(pre_data, key_columns(key_column), rules)
+
+def diff_incremental(pre_data, post_data, key_column, column_mapping, snapshot_file, signature, rules=None):
+    """diff_frames that reuses the previous run's result for unchanged rows and diffs only new or edited ones"""
+    # Rows whose content hash is in the snapshot of the last run with the same signature take
+    # their result from it, key lookup included; the preload key index comes from it too
+    hashes = row_hashes(post_data)
+    snapshot = DiffSnapshot.load(snapshot_file, signature)
+    if snapshot is not None:
+        key_index = snapshot.key_index
+        reused, previous = snapshot.find(hashes)
+        todo = np.flatnonzero(~reused)
+        keys = snapshot.key_match(post_data, reused, previous, key_index.lookup(post_data.iloc[todo]))
+    else:
+        key_index = index_keys(pre_data, key_column, rules)
+        keys = key_index.lookup(post_data)
+
+    if snapshot is None or len(todo) > len(post_data) // 2:
+        # Mostly new rows: one pass over everything beats patching
+        logger.debug("Incremental diff: diffing all %d rows", len(post_data))
+        changed, missing = diff_aligned(
+            pre_data, post_data, key_column, column_mapping, keys.matched, keys.aligned_rows, rules
+        )
+        changed = changed.to_numpy()
+        missing = missing.to_numpy()
+    else:
+        logger.debug("Incremental diff: reusing %d rows, diffing %d", len(previous), len(todo))
+        changed = np.zeros(post_data.shape, dtype=bool)
+        missing = np.zeros(post_data.shape, dtype=bool)
+        changed[reused] = snapshot.changed[previous]
+        missing[reused] = snapshot.missing[previous]
+
+        if len(todo):
+            # Narrow the preload to the rows the todo keys point to
+            todo_matched = keys.matched[todo]
+            pre_rows, aligned_rows = np.unique(
+                key_index.rows[keys.positions[todo][todo_matched]], return_inverse=True
+            )
+            todo_changed, todo_missing = diff_aligned(
+                pre_data.iloc[pre_rows], post_data.iloc[todo], key_column, column_mapping,
+                todo_matched, aligned_rows, rules
+            )
+            changed[todo] = todo_changed.to_numpy()
+            missing[todo] = todo_missing.to_numpy()
+
+    # This run's result is the next run's snapshot
+    DiffSnapshot(signature, key_index, hashes, keys, changed, missing).save(snapshot_file)
+    changed = pd.DataFrame(changed, index=post_data.index, columns=post_data.columns)
+    missing = pd.DataFrame(missing, index=post_data.index, columns=post_data.columns)
+    return keys, changed, missing
+
+def diff_matched_rows(post_data, key_column, column_mapping, matched, aligned_pre_values, rules=None):
+    """Changed/missing masks for the post rows flagged in ``matched``, compared as post column category codes"""
+    # aligned_pre_values(pre_col, rule) gives a column's preload values for the matched rows, in post row
+    # order and cleaned by the post column's rule, as a Categorical or an array of strings
+    changed = np.zeros(post_data.shape, dtype=bool)
+    missing = np.zeros(post_data.shape, dtype=bool)
+    keys = key_columns(key_column)
+    for col_idx, post_col in enumerate(post_data.columns):
+        pre_col = column_mapping.get(post_col)
+        if post_col in keys or pre_col is None:
+            continue
+        rule = column_rule(rules, post_col)
+        post_values = rule.normalize(post_data[post_col])
+        post_codes = post_values.codes[matched]
+        pre_values = aligned_pre_values(pre_col, rule)
+        # Preload values absent from the post column encode as -1 and always differ
+        pre_codes = encode_values(post_values.categories, pre_values)
+
+        differs = post_codes != pre_codes
+        if rule.tolerance is not None and differs.any():
+            # Numbers within the tolerance are equal even where their codes differ
+            differs &= ~rule.within_tolerance(rule.numbers(post_values)[matched], rule.numbers(pre_values))
+        empty = post_codes == blank_code(post_values)
+        changed[matched, col_idx] = differs & ~empty
+        missing[matched, col_idx] = differs & empty
+
+    changed = pd.DataFrame(changed, index=post_data.index, columns=post_data.columns)
+    missing = pd.DataFrame(missing, index=post_data.index, columns=post_data.columns)
+    return changed, missing
+
+class SheetComparison:
+    """Diff result for one postload sheet, ready to be written to a workbook"""
+
+    def __init__(self, sheet_name, data, blank_key, changed, missing, unmatched_key=None, widths=None,
+                 duplicate_key=None, key_report=None):
+        self.sheet_name = sheet_name
+        self.data = data
+        self.blank_key = blank_key
+        self.changed = changed
+        self.missing = missing
+        self.unmatched_key = unmatched_key
+        self.duplicate_key = duplicate_key
+        # Duplicate and preload-only keys (see KeyMatch.report)
+        self.key_report = key_report
+        # Column widths, computed with the diff so writers never measure cells
+        self.widths = widths
+        # Long-format differences (see diff_records) when only a diff report is wanted
+        self.records = None
+        # Stage times and counters measured in a worker process, merged by the parent
+        self.metrics = None
+
+def count_comparison(comparison, sheets=1):
+    """Add a comparison's row, cell and key counts to the metrics counters"""
+    metrics.count('rowsCompared', len(comparison.data))
+    metrics.count('cellsChanged', comparison.changed.to_numpy().sum())
+    metrics.count('cellsMissing', comparison.missing.to_numpy().sum())
+    metrics.count('blankKeys', np.count_nonzero(comparison.blank_key))
+    if comparison.unmatched_key is not None:
+        metrics.count('unmatchedKeys', np.count_nonzero(comparison.unmatched_key))
+    if comparison.key_report is not None:
+        for name, problem in comparison.key_report.items():
+            metrics.count(name, problem['keys'])
+    metrics.count('sheetsCompared', sheets)
+
+def log_key_report(sheet_name, key_report):
+    """Warn about duplicate and preload-only keys, with a few examples"""
+    duplicates = key_report['duplicatePreloadKeys']
+    if duplicates['keys']:
+        logger.warning(
+            "%s: %d keys repeat on %d preload rows (the last row is compared), e.g. %s",
+            sheet_name, duplicates['keys'], duplicates['rows'], duplicates['examples']
+        )
+    duplicates = key_report['duplicatePostloadKeys']
+    if duplicates['keys']:
+        logger.warning(
+            "%s: %d keys repeat on %d postload rows, e.g. %s",
+            sheet_name, duplicates['keys'], duplicates['rows'], duplicates['examples']
+        )
+    preload_only = key_report['preloadOnlyKeys']
+    if preload_only['keys']:
+        logger.warning(
+            "%s: %d preload keys are missing from the postload, e.g. %s",
+            sheet_name, preload_only['keys'], preload_only['examples']
+        )
+
+@timed('styling')
+def highlight_worksheet(worksheet, post_data, blank_key, changed, missing, progress=None):
+    """Write post_data to an empty worksheet and apply fills from the diff masks"""
+    # Write headers and data
+    worksheet.append(list(post_data.columns))
+    for row_idx, row in enumerate(post_data.itertuples(index=False, name=None), 1):
+        worksheet.append(row)
+        if progress and row_idx % PROGRESS_INTERVAL == 0:
+            progress(row_idx)
+
+    # Apply fills only where the masks are set
+    column_count = len(post_data.columns)
+    for row_idx in np.flatnonzero(blank_key):
+        for col_idx in range(1, column_count + 1):
+            worksheet.cell(row=row_idx + 2, column=col_idx).fill = BLANK_KEY_FILL
+    for mask, fill in ((changed, CHANGED_FILL), (missing, MISSING_FILL)):
+        for row_idx, col_idx in zip(*np.nonzero(mask.to_numpy())):
+            worksheet.cell(row=row_idx + 2, column=col_idx + 1).fill = fill
+    if progress:
+        progress(len(post_data))
+
+@timed('widths')
+def column_widths(data, sample=None):
+    """Column widths matching the auto-adjust pass: longest printed value or header plus 2, up to MAX_COLUMN_WIDTH"""
+    # Longer sheets are measured on ``sample`` evenly spaced rows
+    if sample and len(data) > sample:
+        data = data.iloc[np.linspace(0, len(data) - 1, sample).astype(np.intp)]
+    widths = []
+    for col_idx, column_name in enumerate(data.columns):
+        max_length = len(str(column_name))
+        if len(data):
+            max_length = max(max_length, _max_printed_length(data.iloc[:, col_idx]))
+        widths.append(min(max_length + 2, MAX_COLUMN_WIDTH))
+    return widths
+
+def _max_printed_length(series):
+    """Length of the longest str() of the column's values, as written cells print them"""
+    if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) not in _DEDUPED_KINDS:
+        # 1, 1.0 and True are one value to unique() but print differently
+        return series.map(str).str.len().max()
+    uniques = pd.Series(series.unique()).astype(object)
+    max_length = uniques.map(str).str.len().max()
+    if pd.api.types.is_float_dtype(series.dtype) or (series.dtype == object and uniques.map(type).eq(float).any()):
+        # unique() merges -0.0 into 0.0
+        values = series.to_numpy(dtype=float, na_value=np.nan)
+        if np.signbit(values[values == 0]).any():
+            max_length = max(max_length, len(str(-0.0)))
+    return max_length
+
+def apply_column_widths(worksheet, widths):
+    """Set the widths of a worksheet's columns, first column first"""
+    for col_idx, width in enumerate(widths, 1):
+        worksheet.column_dimensions[get_column_letter(col_idx)].width = width
+
+def comparison_widths(comparison):
+    """The comparison's column widths, measuring its data if the diff did not"""
+    if comparison.widths is None:
+        comparison.widths = column_widths(comparison.data)
+    return comparison.widths
+
+def write_streaming_sheet(workbook, comparison, progress=None):
+    """Append one comparison as a sheet of a write-only workbook, row by row"""
+    worksheet = start_streaming_sheet(
+        workbook, comparison.sheet_name, comparison.data.columns, comparison_widths(comparison)
+    )
+    append_comparison_rows(worksheet, comparison, progress)
+    if progress:
+        progress(len(comparison.data))
+
+def start_streaming_sheet(workbook, sheet_name, columns, widths):
+    """Create a write-only sheet with its column widths and header row"""
+    worksheet = workbook.create_sheet(sheet_name)
+
+    # Write-only sheets need their dimensions before the first row
+    apply_column_widths(worksheet, widths)
+
+    worksheet.append(list(columns))
+    return worksheet
+
+@timed('styling')
+def append_comparison_rows(worksheet, comparison, progress=None):
+    """Append a comparison's rows to a write-only sheet, styling only highlighted cells"""
+    data = comparison.data
+    changed = comparison.changed.to_numpy()
+    missing = comparison.missing.to_numpy()
+    styled_rows = comparison.blank_key | changed.any(axis=1) | missing.any(axis=1)
+    for row_idx, row in enumerate(data.itertuples(index=False, name=None)):
+        if progress and row_idx and row_idx % PROGRESS_INTERVAL == 0:
+            progress(row_idx)
+        if not styled_rows[row_idx]:
+            worksheet.append(row)
+            continue
+        cells = []
+        for col_idx, value in enumerate(row):
+            cell = WriteOnlyCell(worksheet, value=value)
+            if comparison.blank_key[row_idx]:
+                cell.fill = BLANK_KEY_FILL
+            elif changed[row_idx, col_idx]:
+                cell.fill = CHANGED_FILL
+            elif missing[row_idx, col_idx]:
+                cell.fill = MISSING_FILL
+            cells.append(cell)
+        worksheet.append(cells)
+
+def _sheet_progress(progress, comparison):
+    """Adapt a (sheet, rows done, rows total) callback to one sheet's row count"""
+    if not progress:
+        return None
+    total = len(comparison.data)
+    return lambda rows_done: progress(comparison.sheet_name, rows_done, total)
+
+def write_comparison_workbook(comparisons, output_file, progress=None):
+    """Stream comparison results into a new workbook, one sheet per comparison"""
+    # comparisons may be a generator: only one sheet's data is held at a time, and
+    # write-only mode flushes each row to disk as it is appended
+    workbook = Workbook(write_only=True)
+    for comparison in comparisons:
+        write_streaming_sheet(workbook, comparison, _sheet_progress(progress, comparison))
+    with timed('save'):
+        workbook.save(output_file)
+    return output_file
+
+def compare_sheet(preload_file, postload_file, pre_sheet, post_sheet, key_column, column_overrides=None,
+                  column_rules=None, snapshot_dir=None, width_sample=None, report=False):
+    """Load and diff one pre/post sheet pair (rows paired by their order when ``key_column`` is None)"""
+    # Load Excel sheets
+    pre_data = read_sheet(preload_file, pre_sheet)
+    post_data = read_sheet(postload_file, post_sheet)
+
+    # Find matching columns
+    logger.debug("Starting column mapping process for %s", post_sheet)
+    column_mapping = match_columns(pre_data.columns, post_data.columns, column_overrides)
+    rules = compile_rules(column_rules)
+    check_rule_columns(rules, post_data.columns)
+
+    with timed('diff'):
+        if key_column is None:
+            keys, changed, missing = diff_positional(pre_data, post_data, column_mapping, rules)
+        elif snapshot_dir:
+            # Rows unchanged since the last comparison of the same mapping reuse its result
+            signature = {
+                'preload': file_hash(preload_file),
+                'key_column': key_column,
+                'column_mapping': sorted(column_mapping.items(), key=repr),
+                'columns': list(post_data.columns),
+                'rules': rules_signature(rules),
+            }
+            keys, changed, missing = diff_incremental(
+                pre_data, post_data, key_column, column_mapping,
+                snapshot_path(snapshot_dir, pre_sheet, post_sheet, key_column), signature, rules
+            )
+        else:
+            # Diff whole columns at once
+            keys, changed, missing = diff_frames(pre_data, post_data, key_column, column_mapping, rules=rules)
+        key_report = keys.report()
+    comparison = SheetComparison(
+        post_sheet, post_data, keys.blank_key, changed, missing, keys.unmatched_key,
+        widths=None if report else column_widths(post_data, width_sample), duplicate_key=keys.duplicate_key,
+        key_report=key_report
+    )
+    log_key_report(post_sheet, key_report)
+    count_comparison(comparison)
+    if report:
+        # Only the differences are kept, so the sheet data and masks never travel back from a worker process
+        comparison.records = sheet_records(comparison, pre_data, key_column, column_mapping, keys, rules)
+        comparison.data = comparison.changed = comparison.missing = None
+    return comparison
+
+@timed('report')
+def sheet_records(comparison, pre_data, key_column, column_mapping, keys, rules=None):
+    """diff_records of an in-memory comparison, preload values read from its aligned rows"""
+    pre_rows = keys.preload_rows()
+    records = diff_records(
+        comparison.sheet_name, comparison.data, key_column, column_mapping, comparison.blank_key,
+        comparison.unmatched_key, comparison.changed, comparison.missing,
+        lambda pre_col, rule, rows: rule.clean(pre_data[pre_col].iloc[pre_rows[rows]]).to_numpy(dtype=object),
+        rules=rules
+    )
+    preload_only = keys.preload_only_keys()
+    if len(preload_only):
+        records = pd.concat([records, preload_only_records(comparison.sheet_name, preload_only)], ignore_index=True)
+    return records
+
+def replace_sheet(workbook, comparison, progress=None):
+    """Replace (or add) the comparison's sheet in a regular openpyxl workbook"""
+    # Remove the sheet if it exists and create a new one
+    if comparison.sheet_name in workbook.sheetnames:
+        workbook.remove(workbook[comparison.sheet_name])
+    worksheet = workbook.create_sheet(comparison.sheet_name)
+
+    highlight_worksheet(
+        worksheet, comparison.data, comparison.blank_key, comparison.changed, comparison.missing,
+        _sheet_progress(progress, comparison)
+    )
+
+    # Auto-adjust column widths
+    apply_column_widths(worksheet, comparison_widths(comparison))
+
+def compare_excel_files(preload_file, postload_file, pre_sheet, post_sheet, key_column, output_dir, write_only=False):
     """Compare two Excel sheets and highlight differences"""
     try:
-        # Load Excel sheets
-        pre_data = pd.read_excel(preload_file, sheet_name=pre_sheet)
-        
         # Create output file path
         output_file = os.path.join(output_dir, 'comparison_result.xlsx')
-        
+        comparison = compare_sheet(preload_file, postload_file, pre_sheet, post_sheet, key_column)
+
+        if write_only:
+            # A fresh workbook holding only this sheet instead of a copy of the postload file
+            write_comparison_workbook([comparison], output_file)
+            logger.info("Comparison completed and saved to %s", output_file)
+            return output_file
+
         # If this is the first sheet being processed, copy the postload file
         if not os.path.exists(output_file):
-            print("Copying postload file to output file")
+            logger.debug("Copying postload file to output file")
             shutil.copy2(postload_file, output_file)
-        
-        # Load the workbook and get the post-load data
-        workbook = load_workbook(output_file)
-        post_data = pd.read_excel(postload_file, sheet_name=post_sheet)
-
-        # Find matching columns
-        print("\nStarting column mapping process...")
-        column_mapping = {}
-        for post_col in post_data.columns:
-            post_base = get_base_column_name(post_col)
-            for pre_col in pre_data.columns:
-                if get_base_column_name(pre_col) == post_base:
-                    column_mapping[post_col] = pre_col
-                    print(f"Matched: {post_col} -> {pre_col}")
-                    break
-
-        # Create pre-data dictionary
-        pre_dict = {}
-        for _, row in pre_data.iterrows():
-            key_value = clean_value(row[key_column])
-            if key_value:
-                pre_dict[key_value] = {col: clean_value(val) for col, val in row.items()}
-
-        # Define colors for highlighting
-        changed_fill = PatternFill(start_color='FFF2CC', end_color='FFF2CC', fill_type='solid')  # yellow
-        missing_fill = PatternFill(start_color='E5A78C', end_color='E5A78C', fill_type='solid')  # red
-        blank_key_fill = PatternFill(start_color='E6F3FF', end_color='E6F3FF', fill_type='solid')  # blue
-
-        # Remove the sheet if it exists and create a new one
-        if post_sheet in workbook.sheetnames:
-            workbook.remove(workbook[post_sheet])
-        worksheet = workbook.create_sheet(post_sheet)
-
-        # Write headers
-        for col_idx, column_name in enumerate(post_data.columns, 1):
-            cell = worksheet.cell(row=1, column=col_idx)
-            cell.value = column_name
-
-        # Write data and compare
-        for row_idx, row in post_data.iterrows():
-            excel_row = row_idx + 2
-            
-            # Write all values first
-            for col_idx, (column_name, value) in enumerate(row.items(), 1):
-                cell = worksheet.cell(row=excel_row, column=col_idx)
-                cell.value = value
-
-            # Get key value
-            key_value = clean_value(row[key_column])
-            
-            # Handle blank key values
-            if not key_value:
-                for col_idx in range(1, len(post_data.columns) + 1):
-                    worksheet.cell(row=excel_row, column=col_idx).fill = blank_key_fill
-                continue
-
-            # Compare values if key exists in pre-data
-            if key_value in pre_dict:
-                for col_idx, post_col_name in enumerate(post_data.columns, 1):
-                    if post_col_name != key_column:  # Skip key column
-                        cell = worksheet.cell(row=excel_row, column=col_idx)
-                        post_value = clean_value(cell.value)
-                        
-                        pre_col_name = column_mapping.get(post_col_name)
-                        if pre_col_name:
-                            pre_value = clean_value(pre_dict[key_value].get(pre_col_name, ''))
-                            
-                            if post_value != pre_value:
-                                if not post_value and pre_value:
-                                    cell.fill = missing_fill
-                                else:
-                                    cell.fill = changed_fill
-
-        # Auto-adjust column widths
-        for column in worksheet.columns:
-            max_length = 0
-            column_letter = get_column_letter(column[0].column)
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            worksheet.column_dimensions[column_letter].width = adjusted_width
+        with timed('parse'):
+            workbook = load_workbook(output_file)
+        replace_sheet(workbook, comparison)
 
-        workbook.save(output_file)
-        print(f"Comparison completed and saved to {output_file}")
+        with timed('save'):
+            workbook.save(output_file)
+        logger.info("Comparison completed and saved to %s", output_file)
         return output_file
 
     except Exception as e:
-        print(f"Error in compare_excel_files: {str(e)}")
-        raise 
\ No newline at end of file
+        logger.error("Error in compare_excel_files: %s", e)
+        raise
+
+def _compare_sheet_task(args):
+    """Process pool entry point: unpack one mapping and diff it"""
+    preload_file, postload_file, mapping, snapshot_dir, width_sample, report = args
+    with metrics.collecting(metrics.Metrics()) as task_metrics:
+        comparison = compare_sheet(
+            preload_file, postload_file, *mapping, snapshot_dir=snapshot_dir, width_sample=width_sample,
+            report=report
+        )
+    # A worker process's counters are not visible to the parent, so they travel back on the comparison
+    comparison.metrics = task_metrics.to_dict()
+    return comparison
+
+def _merge_task_metrics(comparisons):
+    # Record what the worker processes measured into this process's collectors
+    for comparison in comparisons:
+        metrics.merge(comparison.metrics)
+        yield comparison
+
+def compare_workbooks(preload_file, postload_file, sheet_mappings, output_dir, max_workers=None, write_only=False,
+                      progress=None, snapshot_dir=None, width_sample=None, report_format=None):
+    """Compare several sheet pairs in parallel and write every result with one save"""
+    try:
+        # A report_format ('csv', 'parquet' or 'xlsx') writes only the differing cells and keys, not a workbook
+        if report_format:
+            output_file = os.path.join(output_dir, REPORT_FILES[report_format])
+        else:
+            output_file = os.path.join(output_dir, 'comparison_result.xlsx')
+        # Mappings are compare_sheet's (pre_sheet, post_sheet, key_column[, column_overrides[, column_rules]])
+        tasks = [
+            (preload_file, postload_file, tuple(mapping), snapshot_dir, width_sample, bool(report_format))
+            for mapping in sheet_mappings
+        ]
+        workers = min(max_workers or os.cpu_count() or 1, len(tasks))
+
+        if workers <= 1:
+            # Not worth a pool; stay lazy so only one sheet is held at a time
+            comparisons = (_compare_sheet_task(task) for task in tasks)
+            _assemble_output(comparisons, postload_file, output_file, write_only, progress, report_format)
+        else:
+            logger.info("Comparing %d sheets with %d worker processes", len(tasks), workers)
+            with ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context(WORKER_START_METHOD)
+            ) as executor:
+                # map() yields in mapping order as results arrive
+                comparisons = _merge_task_metrics(executor.map(_compare_sheet_task, tasks))
+                _assemble_output(comparisons, postload_file, output_file, write_only, progress, report_format)
+
+        logger.info("Comparison completed and saved to %s", output_file)
+        return output_file
+
+    except Exception as e:
+        logger.error("Error in compare_workbooks: %s", e)
+        raise
+
+def _assemble_output(comparisons, postload_file, output_file, write_only, progress, report_format):
+    if report_format:
+        write_diff_report(_report_records(comparisons, progress), output_file)
+    else:
+        _assemble_workbook(comparisons, postload_file, output_file, write_only, progress)
+
+def _report_records(comparisons, progress):
+    for comparison in comparisons:
+        if progress:
+            rows = len(comparison.blank_key)
+            progress(comparison.sheet_name, rows, rows)
+        yield comparison.records
+
+def _assemble_workbook(comparisons, postload_file, output_file, write_only, progress):
+    # CSV/Parquet postloads have no workbook to copy, so their results are always streamed
+    if write_only or table_format(postload_file) != 'excel':
+        write_comparison_workbook(comparisons, output_file, progress)
+        return
+
+    shutil.copy2(postload_file, output_file)
+    with timed('parse'):
+        workbook = load_workbook(output_file)
+    for comparison in comparisons:
+        replace_sheet(workbook, comparison, progress)
+    with timed('save'):
+        workbook.save(output_file)
@@ -0,0 +1,208 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from normalization import clean_series, normalize_column, print_numbers
+
+# Options of a column rule, as sheet mappings spell them in their columnRules
+RULE_OPTIONS = ('tolerance', 'ignoreCase', 'collapseWhitespace', 'date', 'leadingZeros')
+# leadingZeros: drop them from digit strings only (as clean_value does), keep them, or drop them from any value
+LEADING_ZEROS = ('digits', 'keep', 'strip')
+# How values a date rule recognizes are compared
+DATE_FORMAT = '%Y-%m-%d'
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Relative slack for float rounding when numbers are compared within a tolerance
+TOLERANCE_SLACK = 1e-9
+
+_LEADING_ZEROS = r'^0+(?=[0-9A-Za-z])'
+
+class ColumnRule:
+    """How the values of one column are compared, compiled into vectorized column steps.
+
+    A rule without options compares as clean_value cleans. Any option makes
+    the column compare exact values instead, with the option applied on top:
+    numbers keep their decimals (12.75 is not 12) and text only loses its
+    surrounding whitespace.
+
+    - ``tolerance``: numbers at most this far apart are equal
+    - ``ignore_case``: text compares case-insensitively
+    - ``collapse_whitespace``: runs of whitespace compare as one space
+    - ``date``: values read as dates (True, or a strptime format such as
+      '%d.%m.%Y' for text dates) compare as the date and time they denote
+    - ``leading_zeros``: see LEADING_ZEROS; 'strip' treats '000A12' as 'A12',
+      as SAP's ALPHA conversion does for fields like ALTKN
+
+    The steps run as pandas string and datetime operations on each column's
+    distinct values only (see normalization.normalize_column), and rows are
+    then compared as category codes, so a rule costs about as much as the
+    default cleaning whatever the sheet's length.
+    """
+
+    def __init__(self, tolerance=None, ignore_case=False, collapse_whitespace=False, date=False,
+                 leading_zeros='digits'):
+        if tolerance is not None and (isinstance(tolerance, bool) or not isinstance(tolerance, (int, float))
+                                      or not tolerance >= 0):
+            raise ValueError(f"A tolerance must be a number of at least 0, not {tolerance!r}")
+        if not isinstance(date, (bool, str)):
+            raise ValueError(f"A date rule is true or a date format, not {date!r}")
+        if leading_zeros not in LEADING_ZEROS:
+            raise ValueError(f"leadingZeros must be one of {', '.join(LEADING_ZEROS)}, not {leading_zeros!r}")
+        self.tolerance = None if tolerance is None else float(tolerance)
+        self.ignore_case = bool(ignore_case)
+        self.collapse_whitespace = bool(collapse_whitespace)
+        self.date = date
+        self.leading_zeros = leading_zeros
+        self.exact = self.options() != {}
+
+    @classmethod
+    def from_options(cls, options):
+        """Rule from its JSON options, e.g. ``{"tolerance": 0.01, "ignoreCase": true}``"""
+        if not isinstance(options, dict):
+            raise ValueError(f"Column rule options must be an object, not {options!r}")
+        unknown = [name for name in options if name not in RULE_OPTIONS]
+        if unknown:
+            raise ValueError(f"Unknown column rule options: {', '.join(map(str, unknown))}")
+        return cls(
+            tolerance=options.get('tolerance'), ignore_case=options.get('ignoreCase', False),
+            collapse_whitespace=options.get('collapseWhitespace', False), date=options.get('date', False),
+            leading_zeros=options.get('leadingZeros', 'digits'),
+        )
+
+    def options(self):
+        """The rule's JSON options, defaults left out (see from_options)"""
+        options = {
+            'tolerance': self.tolerance, 'ignoreCase': self.ignore_case,
+            'collapseWhitespace': self.collapse_whitespace, 'date': self.date,
+            'leadingZeros': self.leading_zeros,
+        }
+        defaults = {'tolerance': None, 'ignoreCase': False, 'collapseWhitespace': False, 'date': False,
+                    'leadingZeros': 'digits'}
+        return {name: value for name, value in options.items() if value != defaults[name]}
+
+    def normalize(self, series):
+        """normalize_column following the rule"""
+        return normalize_column(series, self._text if self.exact else None)
+
+    def clean(self, series):
+        """clean_series following the rule: the values as the comparison sees them"""
+        return clean_series(series, self._text if self.exact else None)
+
+    def numbers(self, values):
+        """Numeric value of normalized values (NaN where not a number), for the tolerance.
+
+        ``values`` is a normalize() Categorical or an array of its strings.
+        """
+        if isinstance(values, pd.Categorical):
+            numbers = _to_numbers(values.categories.to_numpy(dtype=object))
+            # Code -1 (no value) reads the trailing NaN
+            return np.append(numbers, np.nan)[values.codes]
+        return _to_numbers(np.asarray(values, dtype=object))
+
+    def within_tolerance(self, post_numbers, pre_numbers):
+        """Which number pairs are at most the tolerance apart (never where either is NaN)"""
+        with np.errstate(invalid='ignore'):
+            slack = TOLERANCE_SLACK * np.maximum(np.abs(post_numbers), np.abs(pre_numbers))
+            return np.abs(post_numbers - pre_numbers) <= self.tolerance + slack
+
+    def _text(self, values):
+        """Comparison text of a Series of (distinct) values, blanks as ''"""
+        text = _exact_text(values)
+        if self.collapse_whitespace:
+            text = text.str.replace(r'\s+', ' ', regex=True)
+        if self.date:
+            text = self._dates(values, text)
+        if self.leading_zeros == 'strip':
+            text = text.str.replace(_LEADING_ZEROS, '', regex=True)
+        elif self.leading_zeros == 'digits':
+            digits = (text.str.isdigit() & text.str.isascii()).to_numpy(dtype=bool)
+            text[digits] = text[digits].str.replace(_LEADING_ZEROS, '', regex=True)
+        if self.ignore_case:
+            text = text.str.casefold()
+        return text
+
+    def _dates(self, values, text):
+        """``text`` with the values that read as dates in DATE_FORMAT, or DATETIME_FORMAT with a time of day"""
+        if pd.api.types.is_datetime64_any_dtype(values.dtype):
+            parsed = pd.Series(values.to_numpy(), index=text.index)
+        else:
+            # Digit strings may be amounts or codes, so only text with separators is read
+            candidates = text.where(~text.str.fullmatch(r'\d*'))
+            is_date = values.map(lambda value: isinstance(value, (datetime.date, np.datetime64))).to_numpy(dtype=bool)
+            candidates[is_date] = None
+            parsed = pd.to_datetime(candidates, format=self.date if isinstance(self.date, str) else 'mixed',
+                                    errors='coerce')
+            if isinstance(self.date, str):
+                # Cells Excel already stored as dates print in ISO form
+                rest = parsed.isna() & candidates.notna()
+                parsed[rest] = pd.to_datetime(candidates[rest], format='ISO8601', errors='coerce')
+            if is_date.any():
+                parsed[is_date] = pd.to_datetime(values[is_date].to_numpy(), errors='coerce')
+
+        found = parsed.notna().to_numpy(dtype=bool)
+        if found.any():
+            dates = parsed[found]
+            has_time = (dates != dates.dt.normalize()).to_numpy(dtype=bool)
+            printed = dates.dt.strftime(DATE_FORMAT).astype(object)
+            printed[has_time] = dates[has_time].dt.strftime(DATETIME_FORMAT).to_numpy(dtype=object)
+            text = text.copy()
+            text[found] = printed.to_numpy(dtype=object)
+        return text
+
+# Columns without a rule compare as clean_value cleans
+DEFAULT_RULE = ColumnRule()
+
+def _exact_text(values):
+    """Values printed as they are and stripped; integral floats without their '.0' and blanks as ''"""
+    text = pd.Series('', index=values.index, dtype=object)
+    present = ~values.isna().to_numpy()
+    if not present.any():
+        return text
+    dtype = values.dtype
+    if pd.api.types.is_float_dtype(dtype):
+        text[present] = print_numbers(values.to_numpy(dtype=float)[present])
+    elif pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+        text[present] = values[present].to_numpy().astype(str).astype(object)
+    else:
+        present_values = values[present].to_numpy(dtype=object)
+        printed = np.array([str(value) for value in present_values], dtype=object)
+        floats = np.array([isinstance(value, (float, np.floating)) for value in present_values], dtype=bool)
+        printed[floats] = print_numbers(present_values[floats])
+        text[present] = pd.Series(printed, dtype=object).str.strip().to_numpy(dtype=object)
+    return text
+
+def _to_numbers(values):
+    # Blank and non-numeric text reads as NaN
+    return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+def compile_rules(column_rules):
+    """ColumnRule of each postload column from a mapping's ``columnRules`` (None without rules).
+
+    ``column_rules`` maps column names to JSON options (see ColumnRule.from_options)
+    or ColumnRule objects. Rules are compiled once per sheet mapping and
+    shipped with it to the worker comparing the sheet.
+    """
+    if not column_rules:
+        return None
+    if not isinstance(column_rules, dict):
+        raise ValueError("columnRules must map postload columns to their rule options")
+    return {
+        column: rule if isinstance(rule, ColumnRule) else ColumnRule.from_options(rule)
+        for column, rule in column_rules.items()
+    }
+
+def check_rule_columns(rules, columns):
+    """Raise ValueError if ``rules`` name columns the postload sheet does not have"""
+    unknown = [column for column in rules or {} if column not in set(columns)]
+    if unknown:
+        raise ValueError(f"Column rules name unknown columns: {', '.join(map(str, unknown))}")
+
+def column_rule(rules, column):
+    """The rule a column is compared by: its own, or DEFAULT_RULE"""
+    if not rules:
+        return DEFAULT_RULE
+    return rules.get(column, DEFAULT_RULE)
+
+def rules_signature(rules):
+    """JSON-ready description of compiled rules, for snapshot signatures"""
+    return sorted((str(column), rule.options()) for column, rule in (rules or {}).items())
@@ -0,0 +1,171 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from comparison_rules import column_rule
+from key_index import KEY_DISPLAY_SEPARATOR, KEY_SEPARATOR, clean_keys, key_columns
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Formats of the diff-only report and the file name each is written to
+REPORT_FILES = {
+    'csv': 'comparison_diff.csv',
+    'parquet': 'comparison_diff.parquet',
+    'xlsx': 'comparison_diff.xlsx',
+}
+REPORT_MIMETYPES = {
+    '.csv': 'text/csv',
+    '.parquet': 'application/vnd.apache.parquet',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+# One report row per difference; ``row`` is the postload row as numbered in Excel
+REPORT_COLUMNS = ['sheet', 'row', 'key', 'column', 'pre_value', 'post_value', 'kind']
+CHANGED = 'changed'
+MISSING = 'missing'
+BLANK_KEY = 'blank key'
+UNMATCHED_KEY = 'unmatched key'
+PRELOAD_ONLY_KEY = 'preload only key'
+KINDS = (CHANGED, MISSING, BLANK_KEY, UNMATCHED_KEY, PRELOAD_ONLY_KEY)
+# Data rows an xlsx sheet can hold below its header
+XLSX_MAX_ROWS = 1_048_575
+
+def diff_records(sheet_name, post_data, key_column, column_mapping, blank_key, unmatched_key, changed, missing,
+                 pre_values, row_offset=0, rules=None):
+    """Long-format table of one sheet's differences (see REPORT_COLUMNS).
+
+    There is a row per changed or missing cell, with the cleaned preload and
+    postload values, and a row per postload row whose key is blank or not in
+    the preload. ``pre_values(pre_col, rule, rows)`` returns the preload values
+    of that column for the given (matched) postload rows, cleaned by ``rule``.
+    Only the cells that differ are cleaned again, so the table costs next to
+    nothing when few cells differ. ``row_offset`` is the position of
+    ``post_data``'s first row in the sheet, for chunks. Values are shown as the
+    column ``rules`` compared them (see comparison_rules).
+    """
+    changed = np.asarray(changed)
+    missing = np.asarray(missing)
+    differs = changed | missing
+
+    rows, order, columns, pre, post, kinds = [], [], [], [], [], []
+    for col_idx in np.flatnonzero(differs.any(axis=0)):
+        post_col = post_data.columns[col_idx]
+        rule = column_rule(rules, post_col)
+        cells = np.flatnonzero(differs[:, col_idx])
+        rows.append(cells)
+        order.append(np.full(len(cells), col_idx))
+        columns.append(np.full(len(cells), str(post_col), dtype=object))
+        pre.append(np.asarray(pre_values(column_mapping[post_col], rule, cells), dtype=object))
+        post.append(rule.clean(post_data.iloc[cells, col_idx]).to_numpy(dtype=object))
+        kinds.append(np.where(missing[cells, col_idx], MISSING, CHANGED).astype(object))
+
+    # Key problems come first on their row, with no column
+    for mask, kind in ((blank_key, BLANK_KEY), (unmatched_key, UNMATCHED_KEY)):
+        key_rows = np.flatnonzero(mask)
+        rows.append(key_rows)
+        order.append(np.full(len(key_rows), -1))
+        for values in (columns, pre, post):
+            values.append(np.full(len(key_rows), '', dtype=object))
+        kinds.append(np.full(len(key_rows), kind, dtype=object))
+
+    rows = np.concatenate(rows)
+    sort = np.lexsort((np.concatenate(order), rows))
+    rows = rows[sort]
+    return pd.DataFrame({
+        'sheet': np.full(len(rows), sheet_name, dtype=object),
+        'row': pd.array(rows + row_offset + 2, dtype='Int64'),
+        'key': _display_keys(post_data, key_column, rows, rules),
+        'column': np.concatenate(columns)[sort],
+        'pre_value': np.concatenate(pre)[sort],
+        'post_value': np.concatenate(post)[sort],
+        'kind': np.concatenate(kinds)[sort],
+    }, columns=REPORT_COLUMNS)
+
+def preload_only_records(sheet_name, keys):
+    """Report rows for preload keys (display strings) that no postload row has"""
+    return pd.DataFrame({
+        'sheet': np.full(len(keys), sheet_name, dtype=object),
+        'row': pd.array([None] * len(keys), dtype='Int64'),
+        'key': np.asarray(keys, dtype=object),
+        'column': np.full(len(keys), '', dtype=object),
+        'pre_value': np.full(len(keys), '', dtype=object),
+        'post_value': np.full(len(keys), '', dtype=object),
+        'kind': np.full(len(keys), PRELOAD_ONLY_KEY, dtype=object),
+    }, columns=REPORT_COLUMNS)
+
+def _display_keys(post_data, key_column, rows, rules=None):
+    """Cleaned key of each of ``rows`` as shown to users, cleaning every distinct row once"""
+    if key_column is None:
+        # Rows compared by position have no key; their row number says it all
+        return np.full(len(rows), '', dtype=object)
+    distinct, inverse = np.unique(rows, return_inverse=True)
+    keys = clean_keys(post_data.iloc[distinct], key_columns(key_column), rules)
+    if len(key_columns(key_column)) > 1:
+        keys = pd.Series(keys, dtype=object).str.replace(KEY_SEPARATOR, KEY_DISPLAY_SEPARATOR, regex=False)
+        keys = keys.to_numpy(dtype=object)
+    return np.asarray(keys, dtype=object)[inverse]
+
+def empty_records():
+    """A report without differences"""
+    return pd.DataFrame({
+        column: pd.array([], dtype='Int64') if column == 'row' else np.empty(0, dtype=object)
+        for column in REPORT_COLUMNS
+    })
+
+def column_counts(records):
+    """Differences per sheet and column, one count column per kind plus a total"""
+    counts = pd.crosstab([records['sheet'], records['column']], records['kind'])
+    counts = counts.reindex(columns=[kind for kind in KINDS if kind in counts.columns])
+    counts.columns = list(counts.columns)
+    counts['total'] = counts.sum(axis=1)
+    return counts.reset_index()
+
+def report_format(output_file):
+    """Report format of an output file, from its extension"""
+    fmt = os.path.splitext(output_file)[1].lower().lstrip('.')
+    if fmt not in REPORT_FILES:
+        raise ValueError(f"Unsupported report format: {fmt or output_file}")
+    return fmt
+
+def counts_file(output_file):
+    """Where write_diff_report puts the per-column counts of a CSV or Parquet report"""
+    root, ext = os.path.splitext(output_file)
+    return f'{root}_column_counts{ext}'
+
+def report_files(output_file):
+    """Files making up a comparison result: the result itself and the counts file of a report"""
+    files = [output_file]
+    if os.path.exists(counts_file(output_file)):
+        files.append(counts_file(output_file))
+    return files
+
+def write_diff_report(records, output_file):
+    """Write diff_records() tables (one per sheet) as a single report plus per-column counts.
+
+    The format follows the file extension (see REPORT_FILES). An xlsx report
+    holds the counts on a second sheet; CSV and Parquet reports get them in a
+    sibling file (see counts_file). Parquet needs pyarrow.
+    """
+    fmt = report_format(output_file)
+    records = list(records)
+    records = pd.concat(records, ignore_index=True) if records else empty_records()
+    with timed('save'):
+        counts = column_counts(records)
+        if fmt == 'csv':
+            records.to_csv(output_file, index=False)
+            counts.to_csv(counts_file(output_file), index=False)
+        elif fmt == 'parquet':
+            records.to_parquet(output_file, index=False)
+            counts.to_parquet(counts_file(output_file), index=False)
+        else:
+            if len(records) > XLSX_MAX_ROWS:
+                raise ValueError(
+                    f"{len(records)} differences do not fit in an xlsx report; use the csv or parquet format"
+                )
+            with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
+                records.to_excel(writer, sheet_name='Differences', index=False)
+                counts.to_excel(writer, sheet_name='Column counts', index=False)
+    logger.info("Wrote %d differences to %s", len(records), os.path.basename(output_file))
+    return output_file
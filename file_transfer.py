@@ -0,0 +1,101 @@
+import hashlib
+import os
+import tempfile
+import zipfile
+import zlib
+
+# Bytes read or sent at a time when streaming files in and out
+TRANSFER_CHUNK_SIZE = 1024 * 1024
+# Packagings offered for result downloads
+PACKAGES = ('zip', 'gzip')
+# Already compressed formats are stored as they are in zip downloads
+_COMPRESSED_EXTENSIONS = ('.xlsx', '.parquet')
+
+class HashingFile:
+    """Upload file written straight to disk, hashed (SHA-256) as the bytes arrive.
+
+    Werkzeug's form parser writes each chunk of an uploaded file into it as the
+    request body is read, so large workbooks are never buffered in memory or
+    copied a second time. Until commit() moves it to its final path the file
+    is a temporary '.part' file, which close() deletes.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=directory, suffix='.part', delete=False)
+        self._hash = hashlib.sha256()
+        self.size = 0
+        self.committed = False
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def commit(self, path):
+        """Move the received file to ``path``"""
+        self._file.flush()
+        os.replace(self._file.name, path)
+        self.committed = True
+
+    def close(self):
+        self._file.close()
+        if not self.committed and os.path.exists(self._file.name):
+            os.remove(self._file.name)
+
+    def __getattr__(self, name):
+        # read, seek, tell... for werkzeug's FileStorage
+        return getattr(self._file, name)
+
+class _ChunkBuffer:
+    """Write-only sink handing back what was written since the last drain()"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def zip_chunks(paths, chunk_size=TRANSFER_CHUNK_SIZE):
+    """Zip archive of ``paths`` (stored under their base names), generated piece by piece.
+
+    Nothing is staged on disk: compressed bytes are yielded as the files are
+    read, so a download starts right away and memory stays at one chunk.
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for path in paths:
+            info = zipfile.ZipInfo.from_file(path, os.path.basename(path))
+            if os.path.splitext(path)[1].lower() in _COMPRESSED_EXTENSIONS:
+                info.compress_type = zipfile.ZIP_STORED
+            else:
+                info.compress_type = zipfile.ZIP_DEFLATED
+            with open(path, 'rb') as source, archive.open(info, 'w', force_zip64=True) as target:
+                for chunk in iter(lambda: source.read(chunk_size), b''):
+                    target.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+    yield buffer.drain()
+
+def gzip_chunks(path, chunk_size=TRANSFER_CHUNK_SIZE):
+    """Gzip stream of one file, generated piece by piece"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(chunk_size), b''):
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+    yield compressor.flush()
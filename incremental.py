@@ -0,0 +1,143 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from key_index import KeyMatch
+from normalization import print_numbers
+
+logger = logging.getLogger(__name__)
+
+# Bump when the snapshot layout changes so old snapshots are ignored
+SNAPSHOT_VERSION = 3
+
+def row_hashes(data):
+    """64-bit content hash of every row of a DataFrame.
+
+    Rows whose values print the same hash the same; since clean_value only looks
+    at the printed value, such rows (key included) always diff the same way.
+    Numeric columns are hashed through their printed form too, integral values
+    without a decimal point as pd.read_excel gives them in mixed columns, so a
+    column that gains a blank or a text cell in the next revision still hashes
+    its untouched rows the same. Blank cells are hashed separately so a blank
+    never collides with the text 'nan'.
+    """
+    printed = {}
+    for column, dtype in data.dtypes.items():
+        if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+            printed[column] = _printed_numbers(data[column])
+    if printed:
+        data = data.copy(deep=False)
+        for column, values in printed.items():
+            data[column] = values
+    values = pd.util.hash_pandas_object(data, index=False).to_numpy()
+    blanks = pd.util.hash_pandas_object(data.isna(), index=False).to_numpy()
+    return values * np.uint64(31) + blanks
+
+def _printed_numbers(series):
+    if pd.api.types.is_integer_dtype(series.dtype) and not series.hasnans:
+        return series.to_numpy().astype(str).astype(object)
+    return print_numbers(series.to_numpy(dtype=float, na_value=np.nan))
+
+def snapshot_path(snapshot_dir, pre_sheet, post_sheet, key_column):
+    """File holding the snapshot of one sheet mapping"""
+    name = hashlib.sha1(json.dumps([pre_sheet, post_sheet, str(key_column)]).encode('utf-8')).hexdigest()
+    return os.path.join(snapshot_dir, f'{name}.pkl')
+
+class DiffSnapshot:
+    """Row hashes and diff results of the last comparison of a sheet mapping.
+
+    ``signature`` identifies everything else the diff depended on (preload
+    content, key column, column mapping, postload columns); a snapshot is only
+    reused when it matches exactly. The preload's cleaned key index is kept as
+    well, since the preload did not change either, along with where each row's
+    key pointed in it (a KeyMatch). Rows are sorted by hash.
+    """
+
+    def __init__(self, signature, key_index, hashes, keys, changed, missing):
+        order = np.argsort(hashes, kind='stable')
+        self.signature = signature
+        self.key_index = key_index
+        self.hashes = hashes[order]
+        self.key_hashes = keys.hashes[order]
+        self.positions = keys.positions[order]
+        self.blank_key = keys.blank_key[order]
+        self.changed = changed[order]
+        self.missing = missing[order]
+
+    @classmethod
+    def load(cls, path, signature):
+        """The snapshot stored at path, or None if absent, unreadable or for another signature"""
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Ignoring unreadable snapshot %s: %s", os.path.basename(path), e)
+            return None
+        if state.get('version') != SNAPSHOT_VERSION or state['signature'] != signature:
+            return None
+
+        width = len(signature['columns'])
+        snapshot = cls.__new__(cls)
+        snapshot.signature = state['signature']
+        snapshot.key_index = state['key_index']
+        snapshot.hashes = state['hashes']
+        snapshot.key_hashes = state['key_hashes']
+        snapshot.positions = state['positions']
+        snapshot.blank_key = state['blank_key']
+        snapshot.changed = np.unpackbits(state['changed'], axis=1, count=width).astype(bool)
+        snapshot.missing = np.unpackbits(state['missing'], axis=1, count=width).astype(bool)
+        return snapshot
+
+    def save(self, path):
+        """Write the snapshot atomically, with the masks bit-packed"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        state = {
+            'version': SNAPSHOT_VERSION,
+            'signature': self.signature,
+            'key_index': self.key_index,
+            'hashes': self.hashes,
+            'key_hashes': self.key_hashes,
+            'positions': self.positions,
+            'blank_key': self.blank_key,
+            'changed': np.packbits(self.changed, axis=1),
+            'missing': np.packbits(self.missing, axis=1),
+        }
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def key_match(self, data, reused, previous, todo_keys):
+        """KeyMatch of ``data``: reused rows from this snapshot, the rest from ``todo_keys``"""
+        todo = ~reused
+        key_hashes = np.empty(len(data), dtype=np.uint64)
+        positions = np.empty(len(data), dtype=np.intp)
+        blank_key = np.empty(len(data), dtype=bool)
+        key_hashes[reused] = self.key_hashes[previous]
+        positions[reused] = self.positions[previous]
+        blank_key[reused] = self.blank_key[previous]
+        key_hashes[todo] = todo_keys.hashes
+        positions[todo] = todo_keys.positions
+        blank_key[todo] = todo_keys.blank_key
+        return KeyMatch(self.key_index, data, key_hashes, positions, blank_key)
+
+    def find(self, hashes):
+        """Locate rows unchanged since the snapshot.
+
+        Returns ``(found, positions)``: a mask over the given rows and, for the
+        found ones, their row in this snapshot.
+        """
+        if not len(self.hashes):
+            return np.zeros(len(hashes), dtype=bool), np.empty(0, dtype=np.intp)
+        positions = np.searchsorted(self.hashes, hashes)
+        positions[positions == len(self.hashes)] = 0
+        found = self.hashes[positions] == hashes
+        return found, positions[found]
@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import Metrics, collecting
+from workspaces import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+_JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# Minimum seconds between progress writes to a job's state file
+STATE_WRITE_INTERVAL = 1.0
+
+class Job:
+    """State of one background comparison, updated by its progress callback.
+
+    With a ``state_file`` the job's status is mirrored to disk so that any
+    worker process can answer status and download requests for it.
+    """
+
+    def __init__(self, job_id, sheet_rows, state_file=None, inputs=()):
+        self.id = job_id
+        self.status = 'queued'
+        self.error = None
+        self.result_file = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # sheet name -> [rows processed, rows total]; totals are estimates until diffed
+        self.sheets = OrderedDict((sheet, [0, rows or 0]) for sheet, rows in sheet_rows)
+        self.state_file = state_file
+        # Files the job reads, kept on disk until it finishes (see Workspace.files_in_use)
+        self.inputs = list(inputs)
+        # Stage times and counters of this comparison only
+        self.metrics = Metrics()
+        self._lock = threading.Lock()
+        self._last_write = 0
+
+    def update(self, sheet_name, rows_processed, rows_total):
+        with self._lock:
+            if rows_total is None:
+                # Streaming modes only know the total at the end; keep the estimate meanwhile
+                rows_total = max(self.sheets.get(sheet_name, [0, 0])[1], rows_processed)
+            self.sheets[sheet_name] = [rows_processed, rows_total]
+        if time.time() - self._last_write >= STATE_WRITE_INTERVAL:
+            self.save_state()
+
+    def set_status(self, status):
+        self.status = status
+        self.save_state()
+
+    def save_state(self):
+        """Write the job's public state plus its result and input paths to the state file"""
+        if not self.state_file:
+            return
+        self._last_write = time.time()
+        state = self.to_dict()
+        state['resultFile'] = self.result_file
+        state['inputFiles'] = self.inputs
+        write_json_atomic(self.state_file, state)
+
+    def to_dict(self):
+        with self._lock:
+            sheets = [
+                {'sheet': sheet, 'rowsProcessed': done, 'rowsTotal': total}
+                for sheet, (done, total) in self.sheets.items()
+            ]
+        rows_done = sum(sheet['rowsProcessed'] for sheet in sheets)
+        rows_total = sum(sheet['rowsTotal'] for sheet in sheets)
+
+        progress = 1.0 if self.status == 'completed' else 0.0
+        eta = None
+        if self.status == 'running' and rows_total:
+            progress = min(rows_done / rows_total, 1.0)
+            elapsed = time.time() - self.started_at
+            if rows_done:
+                eta = round(elapsed * (rows_total - rows_done) / rows_done, 1)
+
+        return {
+            'jobId': self.id,
+            'status': self.status,
+            'progress': round(progress, 4),
+            'etaSeconds': eta,
+            'sheets': sheets,
+            'error': self.error,
+            'downloadReady': self.status == 'completed',
+            'metrics': self.metrics.to_dict(),
+        }
+
+class JobManager:
+    """Runs comparisons on a background thread pool.
+
+    Jobs are tracked through their state files only, so that every worker
+    process answers for them alike (see load_job_state).
+    """
+
+    def __init__(self, max_workers=2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='compare-job')
+
+    def submit(self, func, sheet_rows, args=(), kwargs=None, state_dir=None, inputs=()):
+        """Queue ``func(*args, progress=..., **kwargs)``; it must return the result file path
+
+        ``sheet_rows`` lists ``(sheet name, estimated rows)`` so progress and ETA
+        can be reported before the first sheet has been diffed. Job states are
+        written to ``state_dir`` when given (see load_job_state), along with the
+        ``inputs`` paths the job reads.
+        """
+        job_id = uuid.uuid4().hex
+        state_file = None
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+            state_file = os.path.join(state_dir, f'{job_id}.json')
+        job = Job(job_id, sheet_rows, state_file, inputs)
+        job.save_state()
+        self._executor.submit(self._run, job, func, args, kwargs or {})
+        return job
+
+    def _run(self, job, func, args, kwargs):
+        job.started_at = time.time()
+        job.set_status('running')
+        try:
+            with collecting(job.metrics):
+                job.result_file = func(*args, progress=job.update, **kwargs)
+            job.finished_at = time.time()
+            job.set_status('completed')
+        except Exception as e:
+            logger.exception("Error in job %s: %s", job.id, e)
+            job.error = str(e)
+            job.finished_at = time.time()
+            job.set_status('failed')
+
+def load_job_state(state_dir, job_id):
+    """Read a job state written by any process, or None for unknown ids"""
+    if not _JOB_ID_PATTERN.match(job_id):
+        return None
+    try:
+        with open(os.path.join(state_dir, f'{job_id}.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
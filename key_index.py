@@ -0,0 +1,262 @@
+import numpy as np
+import pandas as pd
+
+from comparison_rules import column_rule
+from normalization import blank_code
+
+# Hash keys tried in turn until the preload's distinct keys hash without a collision
+_HASH_KEYS = ('0123456789123456', 'postload-keys-01', 'postload-keys-02', 'postload-keys-03')
+# Joins the cleaned parts of a composite key into one string
+KEY_SEPARATOR = '\x1f'
+# Shown between the parts of a composite key in reports and logs
+KEY_DISPLAY_SEPARATOR = ' | '
+# Example keys listed per key problem in a report
+KEY_EXAMPLES = 5
+
+def key_columns(key_column):
+    """Key columns of a mapping: ``key_column`` is one column name or a list of them"""
+    if key_column is None:
+        # Rows compared by their order have no key
+        return []
+    if isinstance(key_column, (list, tuple)):
+        return list(key_column)
+    return [key_column]
+
+def normalize_keys(data, columns, rules=None):
+    """Cleaned key parts of every row, one Categorical per key column, and the blank-key mask.
+
+    A row's key is blank when every one of its key columns is blank. Key
+    columns with a rule in ``rules`` are cleaned by it (see comparison_rules).
+    """
+    parts = [column_rule(rules, column).normalize(data[column]) for column in columns]
+    blank = np.ones(len(data), dtype=bool)
+    for part in parts:
+        blank &= part.codes == blank_code(part)
+    return parts, blank
+
+def clean_keys(data, columns, rules=None):
+    """Cleaned key string of every row ('' for blank keys), composite parts joined by KEY_SEPARATOR"""
+    parts, blank = normalize_keys(data, columns, rules)
+    keys = _part_values(parts[0])
+    if len(parts) > 1:
+        keys = pd.Series(keys).str.cat([pd.Series(_part_values(part)) for part in parts[1:]], sep=KEY_SEPARATOR)
+        keys = keys.to_numpy(dtype=object)
+        keys[blank] = ''
+    return keys
+
+def display_key(key):
+    """A clean_keys() string as shown to users"""
+    return key.replace(KEY_SEPARATOR, KEY_DISPLAY_SEPARATOR)
+
+class KeyIndex:
+    """Preload rows by cleaned key, for one or more key columns.
+
+    Keys are located through a 64-bit hash of their cleaned parts. Each key
+    column is factorized by normalize_column first, so only its distinct
+    values are hashed and a composite key costs a multiply-xor per row and
+    part. Hashes of the preload's distinct keys are unique (another hash key
+    is tried on a collision) and every hit is checked against the stored
+    parts, so a post key can never match the wrong row. As before, the last
+    row wins for duplicate keys; the duplicates themselves are remembered for
+    reporting.
+    """
+
+    def __init__(self, columns, parts, rows, duplicated, duplicate_rows, hash_key, rules=None):
+        self.columns = columns
+        # Column rules the key parts were cleaned by, applied to postload keys alike
+        self.rules = rules
+        # Cleaned key parts of each distinct key, and the preload row it points to
+        self.parts = parts
+        self.rows = rows
+        # Keys found on more than one preload row, and how many rows they cover
+        self.duplicated = duplicated
+        self.duplicate_rows = duplicate_rows
+        self.hash_key = hash_key
+        self._index = pd.Index(_hash_parts(parts, hash_key))
+
+    @classmethod
+    def build(cls, data, columns, rules=None):
+        """Index the keyed rows of a preload sheet"""
+        parts, blank = normalize_keys(data, columns, rules)
+        keyed = np.flatnonzero(~blank)
+        repeated = _duplicated(parts, keyed, keep=False)
+        keep = ~_duplicated(parts, keyed, keep='last')
+        rows = keyed[keep]
+        entry_parts = [_take(part, rows) for part in parts]
+        for hash_key in _HASH_KEYS:
+            index = cls(list(columns), entry_parts, rows, repeated[keep], int(repeated.sum()), hash_key, rules)
+            if index._index.is_unique:
+                return index
+        raise ValueError("Preload keys could not be hashed without collisions")
+
+    def __len__(self):
+        return len(self.rows)
+
+    def lookup(self, data):
+        """Match the rows of a postload sheet (or chunk) against the index"""
+        parts, blank = normalize_keys(data, self.columns, self.rules)
+        hashes = _hash_parts(parts, self.hash_key)
+        positions = self._index.get_indexer(hashes) if len(self) else np.full(len(data), -1)
+        positions[blank] = -1
+
+        # A hash hit only counts if every cleaned part agrees
+        found = np.flatnonzero(positions >= 0)
+        same = np.ones(len(found), dtype=bool)
+        for part, entry_part in zip(parts, self.parts):
+            entry_codes = part.categories.get_indexer(entry_part.categories)[entry_part.codes[positions[found]]]
+            same &= entry_codes == part.codes[found]
+        positions[found[~same]] = -1
+        return KeyMatch(self, data, hashes, positions, blank)
+
+    def keys(self, entries):
+        """Display strings of the keys at the given entries"""
+        values = [part.categories.to_numpy(dtype=object)[part.codes[entries]] for part in self.parts]
+        return [KEY_DISPLAY_SEPARATOR.join(key) for key in zip(*values)]
+
+class KeyMatch:
+    """Where each postload row's key points in a KeyIndex (-1: blank or not in the preload).
+
+    ``hashes`` are the rows' key hashes under the index's hash key. Postload
+    keys repeated on several rows are found by hash.
+    """
+
+    def __init__(self, index, data, hashes, positions, blank_key):
+        self.index = index
+        self.data = data
+        self.hashes = hashes
+        self.positions = positions
+        self.blank_key = blank_key
+        # Non-blank keys found on more than one postload row
+        keyed = np.flatnonzero(~blank_key)
+        self.duplicate_key = np.zeros(len(blank_key), dtype=bool)
+        self.duplicate_key[keyed] = pd.Index(hashes[keyed]).duplicated(keep=False)
+
+    @property
+    def matched(self):
+        return self.positions >= 0
+
+    @property
+    def unmatched_key(self):
+        return ~self.matched & ~self.blank_key
+
+    @property
+    def aligned_rows(self):
+        """Preload row of every matched postload row, in postload order"""
+        return self.index.rows[self.positions[self.matched]]
+
+    def preload_rows(self):
+        """Preload row of every postload row (-1 where none matched)"""
+        return np.where(self.matched, self.index.rows[self.positions], -1)
+
+    def preload_only(self):
+        """Entries of the index whose key no postload row has"""
+        missing = np.ones(len(self.index), dtype=bool)
+        missing[self.positions[self.matched]] = False
+        return np.flatnonzero(missing)
+
+    def preload_only_keys(self):
+        """Display strings of the preload keys no postload row has"""
+        return self.index.keys(self.preload_only())
+
+    def keys(self, rows):
+        """Display strings of the keys of the given postload rows"""
+        values = [
+            column_rule(self.index.rules, column).clean(self.data[column].iloc[rows]).to_numpy(dtype=object)
+            for column in self.index.columns
+        ]
+        return [KEY_DISPLAY_SEPARATOR.join(key) for key in zip(*values)]
+
+    def report(self, examples=KEY_EXAMPLES):
+        """Duplicate keys on either side and preload-only keys: counts and a few examples"""
+        duplicated = np.flatnonzero(self.index.duplicated)
+        post_rows = np.flatnonzero(self.duplicate_key)
+        post_keys = post_rows[~pd.Index(self.hashes[post_rows]).duplicated()]
+        preload_only = self.preload_only()
+        return {
+            'duplicatePreloadKeys': {
+                'keys': len(duplicated), 'rows': self.index.duplicate_rows,
+                'examples': self.index.keys(duplicated[:examples]),
+            },
+            'duplicatePostloadKeys': {
+                'keys': len(post_keys), 'rows': len(post_rows),
+                'examples': self.keys(post_keys[:examples]),
+            },
+            'preloadOnlyKeys': {
+                'keys': len(preload_only), 'rows': len(preload_only),
+                'examples': self.index.keys(preload_only[:examples]),
+            },
+        }
+
+class RowMatch:
+    """Row-order pairing of a postload sheet with its preload: row i against row i.
+
+    Stands in for a KeyMatch when a load keeps the row order and has no key.
+    Postload rows past the end of the preload count as unmatched; preload rows
+    past the end of the postload are reported as preload-only, by row number.
+    Nothing is ever blank or duplicated.
+    """
+
+    def __init__(self, pre_rows, post_rows):
+        self.pre_rows = pre_rows
+        self.post_rows = post_rows
+        self.blank_key = np.zeros(post_rows, dtype=bool)
+        self.duplicate_key = np.zeros(post_rows, dtype=bool)
+
+    @property
+    def matched(self):
+        return np.arange(self.post_rows) < self.pre_rows
+
+    @property
+    def unmatched_key(self):
+        return ~self.matched
+
+    @property
+    def aligned_rows(self):
+        return np.arange(min(self.pre_rows, self.post_rows))
+
+    def preload_rows(self):
+        return np.where(self.matched, np.arange(self.post_rows), -1)
+
+    def preload_only(self):
+        return np.arange(self.post_rows, self.pre_rows)
+
+    def preload_only_keys(self):
+        return row_labels(self.preload_only())
+
+    def report(self, examples=KEY_EXAMPLES):
+        preload_only = self.preload_only()
+        none = {'keys': 0, 'rows': 0, 'examples': []}
+        return {
+            'duplicatePreloadKeys': dict(none),
+            'duplicatePostloadKeys': dict(none),
+            'preloadOnlyKeys': {
+                'keys': len(preload_only), 'rows': len(preload_only),
+                'examples': row_labels(preload_only[:examples]),
+            },
+        }
+
+def row_labels(rows):
+    """Display labels of rows as numbered in Excel, below the header"""
+    return [f'row {row + 2}' for row in rows]
+
+def _part_values(part):
+    return part.categories.to_numpy(dtype=object)[part.codes] if len(part.categories) else np.full(len(part), '', dtype=object)
+
+def _take(part, rows):
+    return pd.Categorical.from_codes(part.codes[rows], categories=part.categories)
+
+def _hash_parts(parts, hash_key):
+    """64-bit hash per row of the cleaned key parts, hashing only distinct values"""
+    combined = None
+    for part in parts:
+        distinct = pd.util.hash_array(part.categories.to_numpy(dtype=object), hash_key=hash_key, categorize=False)
+        hashed = distinct[part.codes] if len(part.categories) else np.zeros(len(part), dtype=np.uint64)
+        combined = hashed if combined is None else combined * np.uint64(0x100000001B3) ^ hashed
+    return combined
+
+def _duplicated(parts, rows, keep):
+    """duplicated() over the keys of ``rows``, compared by their cleaned parts"""
+    if len(parts) == 1:
+        return pd.Index(parts[0].codes[rows]).duplicated(keep=keep)
+    codes = pd.DataFrame({idx: part.codes[rows] for idx, part in enumerate(parts)})
+    return codes.duplicated(keep=keep).to_numpy()
@@ -0,0 +1,106 @@
+import contextlib
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+
+# Pipeline stages timed by the comparison engine, in pipeline order
+STAGES = ('parse', 'index', 'mapping', 'diff', 'styling', 'widths', 'report', 'save')
+# Counters recorded per compared sheet
+COUNTERS = (
+    'rowsCompared', 'cellsChanged', 'cellsMissing', 'blankKeys', 'unmatchedKeys', 'duplicatePreloadKeys',
+    'duplicatePostloadKeys', 'preloadOnlyKeys', 'sheetsCompared',
+)
+
+class Metrics:
+    """Thread-safe stage timers (total seconds and calls) and counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = OrderedDict()
+        self._counters = OrderedDict()
+
+    def add_time(self, stage, seconds, calls=1):
+        with self._lock:
+            entry = self._stages.setdefault(stage, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += calls
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + int(value)
+
+    def merge(self, snapshot):
+        """Add the totals of another Metrics' to_dict(), e.g. one sent back by a worker process"""
+        for stage, entry in snapshot.get('stages', {}).items():
+            self.add_time(stage, entry['seconds'], entry['calls'])
+        for name, value in snapshot.get('counters', {}).items():
+            self.count(name, value)
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+    def to_dict(self):
+        """Stages in pipeline order and counters in COUNTERS order, others after them as first recorded"""
+        with self._lock:
+            return {
+                'stages': OrderedDict(
+                    (stage, {'seconds': round(seconds, 4), 'calls': calls})
+                    for stage, (seconds, calls) in _ordered(self._stages, STAGES)
+                ),
+                'counters': OrderedDict(_ordered(self._counters, COUNTERS)),
+            }
+
+def _ordered(entries, names):
+    return sorted(entries.items(), key=lambda item: names.index(item[0]) if item[0] in names else len(names))
+
+# Totals since the process started, served by /metrics
+process_metrics = Metrics()
+# Collectors active in the current thread (a job's metrics, a worker task's metrics...)
+_collectors = contextvars.ContextVar('metrics_collectors', default=(process_metrics,))
+
+@contextlib.contextmanager
+def collecting(metrics):
+    """Also record everything measured inside the block into ``metrics``"""
+    token = _collectors.set(_collectors.get() + (metrics,))
+    try:
+        yield metrics
+    finally:
+        _collectors.reset(token)
+
+# Seconds spent in stages nested inside the innermost running stage
+_nested = contextvars.ContextVar('metrics_nested', default=None)
+
+@contextlib.contextmanager
+def timed(stage):
+    """Time a block as one call of a pipeline stage.
+
+    Stages timed inside the block are left out of its time, so every second is
+    counted once and stage times add up to the time measured.
+    """
+    parent = _nested.get()
+    nested = [0.0]
+    token = _nested.set(nested)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        _nested.reset(token)
+        if parent is not None:
+            parent[0] += elapsed
+        for metrics in _collectors.get():
+            metrics.add_time(stage, elapsed - nested[0])
+
+def count(name, value=1):
+    """Increment a counter"""
+    if value:
+        for metrics in _collectors.get():
+            metrics.count(name, value)
+
+def merge(snapshot):
+    """Record totals measured elsewhere, e.g. in a worker process"""
+    for metrics in _collectors.get():
+        metrics.merge(snapshot)
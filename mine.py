@@ -1,3 +1,6 @@
+import logging
+import os
+import sys
 import pandas as pd
 from openpyxl import load_workbook
 from openpyxl.styles import PatternFill
@@ -7,6 +10,11 @@ from openpyxl.utils import get_column_letter
 preFile = "MDG Supplier Master Mass Upload Template- 1st Draft.xlsx"
 postFile = "ACVS_FD_Supplier_Master_Postload_V2.xlsx"
 outputFile = "output.xlsx"
+# Key columns present in both files, e.g. ['LIFNR', 'BANKS', 'BANKL'] for a composite key;
+# None uses the ALTKN column
+KEY_COLUMNS = None
+
+logger = logging.getLogger(__name__)
 
 
 
@@ -32,89 +40,129 @@ def get_base_column_name(column_name):
     """Get the base column name (first word before space or underscore)"""
     return column_name.split('_')[0].split()[0].strip().upper()
 
-# Load Excel files
-pre_data = pd.read_excel(preFile, sheet_name="Sheet4")
-post_data = pd.read_excel(postFile)
-
-
-
-# Find ALTKN columns
-pre_altkn_col = next(col for col in pre_data.columns if 'ALTKN' in col.upper())
-post_altkn_col = next(col for col in post_data.columns if 'ALTKN' in col.upper())
-
-# print("pre_altkn_col: ",pre_altkn_col)
-# print("post_altkn_col: ",post_altkn_col)
-
-column_mapping = {}
-
-for post_col in post_data.columns:
-    post_base = get_base_column_name(post_col)
-    # print(" post_base: ",post_base," post_col: ",post_col)
-    for pre_col in pre_data.columns:
-        # print("pre_col ",pre_col, " post_base: ",post_base)
-        if get_base_column_name(pre_col) == post_base:
-            column_mapping[post_col] = pre_col
-
-            break
+def main(pre_file=preFile, post_file=postFile, output_file=outputFile, key_columns=KEY_COLUMNS):
+    """Highlight the postload rows of ``post_file`` that differ from ``pre_file`` into ``output_file``"""
+    # Checked once: the row loops skip building debug messages entirely when disabled
+    debug = logger.isEnabledFor(logging.DEBUG)
 
-# Write post_data to new Excel
-post_data.to_excel(outputFile, index=False)
-workbook = load_workbook(outputFile)
-worksheet = workbook.active
+    # Load Excel files
+    pre_data = pd.read_excel(pre_file, sheet_name="Sheet4")
+    post_data = pd.read_excel(post_file)
 
-# Define colors
-changed_fill = PatternFill(start_color='FFF2CC', end_color='FFF2CC', fill_type='solid')  
-missing_fill = PatternFill(start_color='E5A78C', end_color='E5A78C', fill_type='solid')  
-blank_key_fill = PatternFill(start_color='E6F3FF', end_color='E6F3FF', fill_type='solid')  
 
 
-pre_dict = {}
-for _, row in pre_data.iterrows():
-    altkn = clean_value(row[pre_altkn_col])
-    if altkn:
-        # Store cleaned values
-        cleaned_row = {col: clean_value(val) for col, val in row.items()}
-        pre_dict[altkn] = cleaned_row
-        print(f"Loaded pre-load ALTKN: '{altkn}'")  # Debug print
-        
-print("pre_dict: ",pre_dict)
-
-# Compare values
-for row in range(2, worksheet.max_row + 1):
-    # Get ALTKN from post-data
-    post_altkn = clean_value(worksheet.cell(row=row, column=post_data.columns.get_loc(post_altkn_col) + 1).value)
-    print(f"\nProcessing post-load ALTKN: '{post_altkn}'")  # Debug print
-    
-    # If ALTKN is blank, highlight entire row in blue
-    if not post_altkn:
-        for col_idx in range(1, worksheet.max_column + 1):
-            cell = worksheet.cell(row=row, column=col_idx)
-            cell.fill = blank_key_fill
-        continue
-    
-    # If ALTKN exists in pre-data, compare all other fields
-    if post_altkn in pre_dict:
-        print(f"Found match for ALTKN: {post_altkn}")  # Debug print
-        for col_idx, post_col_name in enumerate(post_data.columns, 1):
-            if post_col_name != post_altkn_col:  # Skip ALTKN column
-                cell = worksheet.cell(row=row, column=col_idx)
-                post_value = clean_value(cell.value)
-                
-                # Get corresponding pre-load column name
-                pre_col_name = column_mapping.get(post_col_name)
-                if pre_col_name:
-                    pre_value = clean_value(pre_dict[post_altkn].get(pre_col_name, ''))
-                    
-                    # Compare and highlight differences
-                    if post_value != pre_value:
-                        if not post_value and pre_value:
-                            print(f"Missing value in {post_col_name}: pre='{pre_value}', post='{post_value}'")
-                            cell.fill = missing_fill
-                        else:
-                            print(f"Changed value in {post_col_name}: pre='{pre_value}', post='{post_value}'")
-                            cell.fill = changed_fill
+    # Find key columns (the ALTKN column unless KEY_COLUMNS says otherwise)
+    if key_columns:
+        pre_key_cols = list(key_columns)
+        post_key_cols = list(key_columns)
     else:
-        print(f"No match found for ALTKN: {post_altkn}")  # Debug print
-
-workbook.save(outputFile)
-
+        pre_key_cols = [next(col for col in pre_data.columns if 'ALTKN' in col.upper())]
+        post_key_cols = [next(col for col in post_data.columns if 'ALTKN' in col.upper())]
+    post_key_positions = [post_data.columns.get_loc(col) + 1 for col in post_key_cols]
+
+    # print("pre_altkn_col: ",pre_altkn_col)
+    # print("post_altkn_col: ",post_altkn_col)
+
+    column_mapping = {}
+
+    for post_col in post_data.columns:
+        post_base = get_base_column_name(post_col)
+        # print(" post_base: ",post_base," post_col: ",post_col)
+        for pre_col in pre_data.columns:
+            # print("pre_col ",pre_col, " post_base: ",post_base)
+            if get_base_column_name(pre_col) == post_base:
+                column_mapping[post_col] = pre_col
+
+                break
+
+    # Write post_data to new Excel
+    post_data.to_excel(output_file, index=False)
+    workbook = load_workbook(output_file)
+    worksheet = workbook.active
+
+    # Define colors
+    changed_fill = PatternFill(start_color='FFF2CC', end_color='FFF2CC', fill_type='solid')  
+    missing_fill = PatternFill(start_color='E5A78C', end_color='E5A78C', fill_type='solid')  
+    blank_key_fill = PatternFill(start_color='E6F3FF', end_color='E6F3FF', fill_type='solid')  
+
+
+    pre_dict = {}
+    pre_duplicates = set()
+    for _, row in pre_data.iterrows():
+        # Keys are tuples of cleaned values, one per key column; blank when all are blank
+        altkn = tuple(clean_value(row[col]) for col in pre_key_cols)
+        if any(altkn):
+            if altkn in pre_dict:
+                pre_duplicates.add(altkn)
+            # Store cleaned values
+            cleaned_row = {col: clean_value(val) for col, val in row.items()}
+            pre_dict[altkn] = cleaned_row
+            if debug:
+                logger.debug("Loaded pre-load ALTKN: '%s'", altkn)
+
+    if debug:
+        logger.debug("pre_dict: %s", pre_dict)
+
+    # Compare values
+    post_keys = set()
+    post_duplicates = set()
+    for row in range(2, worksheet.max_row + 1):
+        # Get ALTKN from post-data
+        post_altkn = tuple(clean_value(worksheet.cell(row=row, column=col).value) for col in post_key_positions)
+        if debug:
+            logger.debug("Processing post-load ALTKN: '%s'", post_altkn)
+
+        # If ALTKN is blank, highlight entire row in blue
+        if not any(post_altkn):
+            for col_idx in range(1, worksheet.max_column + 1):
+                cell = worksheet.cell(row=row, column=col_idx)
+                cell.fill = blank_key_fill
+            continue
+        if post_altkn in post_keys:
+            post_duplicates.add(post_altkn)
+        post_keys.add(post_altkn)
+
+        # If ALTKN exists in pre-data, compare all other fields
+        if post_altkn in pre_dict:
+            if debug:
+                logger.debug("Found match for ALTKN: %s", post_altkn)
+            for col_idx, post_col_name in enumerate(post_data.columns, 1):
+                if post_col_name not in post_key_cols:  # Skip key columns
+                    cell = worksheet.cell(row=row, column=col_idx)
+                    post_value = clean_value(cell.value)
+
+                    # Get corresponding pre-load column name
+                    pre_col_name = column_mapping.get(post_col_name)
+                    if pre_col_name:
+                        pre_value = clean_value(pre_dict[post_altkn].get(pre_col_name, ''))
+
+                        # Compare and highlight differences
+                        if post_value != pre_value:
+                            if not post_value and pre_value:
+                                if debug:
+                                    logger.debug("Missing value in %s: pre='%s', post='%s'", post_col_name, pre_value, post_value)
+                                cell.fill = missing_fill
+                            else:
+                                if debug:
+                                    logger.debug("Changed value in %s: pre='%s', post='%s'", post_col_name, pre_value, post_value)
+                                cell.fill = changed_fill
+        else:
+            if debug:
+                logger.debug("No match found for ALTKN: %s", post_altkn)
+
+    # Keys the per-row comparison cannot show
+    if pre_duplicates:
+        logger.warning("%d keys repeat in the preload (the last row is compared): %s", len(pre_duplicates), sorted(pre_duplicates)[:5])
+    if post_duplicates:
+        logger.warning("%d keys repeat in the postload: %s", len(post_duplicates), sorted(post_duplicates)[:5])
+    preload_only = set(pre_dict) - post_keys
+    if preload_only:
+        logger.warning("%d preload keys are missing from the postload: %s", len(preload_only), sorted(preload_only)[:5])
+
+    workbook.save(output_file)
+
+if __name__ == '__main__':
+    # Per-row details are logged at DEBUG (POSTLOAD_LOG_LEVEL=DEBUG)
+    logging.basicConfig(level=os.environ.get('POSTLOAD_LOG_LEVEL', 'INFO').upper())
+    # Optional arguments: preload file, postload file, output file
+    main(*sys.argv[1:4])
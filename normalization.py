@@ -0,0 +1,146 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Distinct strings remembered by the clean_value memo, shared by all columns and sheets
+CLEAN_CACHE_SIZE = 1 << 16
+
+def clean_value(value):
+    """Clean and standardize value for comparison"""
+    if value is None or pd.isna(value):
+        return ''
+    # Convert to string, remove all leading/trailing spaces
+    cleaned = str(value).strip()
+
+    # Handle decimal numbers (convert to integer string)
+    try:
+        if '.' in cleaned:
+            cleaned = str(int(float(cleaned)))
+        elif cleaned.isdigit():
+            cleaned = str(int(cleaned))
+    except ValueError:
+        pass
+
+    return cleaned
+
+@lru_cache(maxsize=CLEAN_CACHE_SIZE)
+def _clean_text(text):
+    # Codes and currencies repeat across columns and sheets, so the slow path is memoized
+    return clean_value(text)
+
+def normalize_column(series, clean=None):
+    """Clean a column into a Categorical of clean_value strings.
+
+    Each distinct value is cleaned once: the column is factorized first and only
+    its uniques go through the type-specific cleaning below, so repetitive
+    master data costs little more than one hash pass. Blanks become the ''
+    category; distinct raw values that clean to the same text share a code.
+    ``clean`` replaces that cleaning: it maps a Series of values to their
+    strings, blanks included (see comparison_rules.ColumnRule).
+    """
+    clean = clean or _clean_distinct
+    codes, uniques = pd.factorize(series)
+    if series.dtype == object and _mixes_bools_and_numbers(series, uniques):
+        # True == 1 when hashing, so factorizing merged values that clean differently
+        codes, uniques = pd.factorize(clean(series).to_numpy(dtype=object))
+        return pd.Categorical.from_codes(codes, categories=pd.Index(uniques, dtype=object))
+
+    cleaned_uniques = clean(pd.Series(uniques)).to_numpy(dtype=object)
+    if (codes < 0).any():
+        cleaned_uniques = np.append(cleaned_uniques, '')
+        codes = np.where(codes < 0, len(cleaned_uniques) - 1, codes)
+
+    # Distinct raw values may clean to the same text ('007' and 7.0 both give '7')
+    remap, categories = pd.factorize(cleaned_uniques)
+    return pd.Categorical.from_codes(remap[codes], categories=pd.Index(categories, dtype=object))
+
+def clean_series(series, clean=None):
+    """Vectorized clean_value: clean and standardize a whole column at once"""
+    normalized = normalize_column(series, clean)
+    return pd.Series(normalized.categories.to_numpy(dtype=object)[normalized.codes], index=series.index, dtype=object)
+
+def encode_values(categories, values):
+    """Codes of cleaned ``values`` in ``categories`` (-1 where the value is not a category).
+
+    ``values`` is either a Categorical from normalize_column, translated through
+    its (small) category list, or an array of cleaned strings.
+    """
+    if isinstance(values, pd.Categorical):
+        return categories.get_indexer(values.categories)[values.codes] if len(values) else np.empty(0, dtype=np.intp)
+    return categories.get_indexer(np.asarray(values, dtype=object)) if len(values) else np.empty(0, dtype=np.intp)
+
+def print_numbers(values):
+    """str() of each float, integral ones without their '.0' as pd.read_excel gives them in mixed columns (NaN as None)"""
+    values = np.asarray(values, dtype=float)
+    integral = np.isfinite(values) & (values == np.trunc(values)) & (np.abs(values) < 2 ** 63)
+    other = ~integral & ~np.isnan(values)
+    printed = np.empty(len(values), dtype=object)
+    printed[integral] = values[integral].astype(np.int64).astype(str)
+    printed[other] = values[other].astype(str)
+    return printed
+
+def blank_code(values):
+    """Code of the blank ('') category of a normalize_column Categorical, -2 if it has none"""
+    # -2 never matches a code, so a column without blanks flags none
+    return values.categories.get_loc('') if '' in values.categories else -2
+
+def _mixes_bools_and_numbers(series, uniques):
+    # Only a bool, 0 or 1 among the uniques can hide the other kind behind it
+    suspect = any(isinstance(value, (bool, np.bool_)) or (_is_number(value) and value in (0, 1)) for value in uniques)
+    if not suspect:
+        return False
+    kinds = {isinstance(value, (bool, np.bool_)) for value in series.to_numpy() if _is_number(value)}
+    return len(kinds) > 1
+
+def _is_number(value):
+    return isinstance(value, (bool, int, float, complex, np.number, np.bool_))
+
+def _clean_distinct(series):
+    """clean_value applied to every value of ``series``, with per-dtype fast paths"""
+    result = pd.Series('', index=series.index, dtype=object)
+    dtype = series.dtype
+
+    if pd.api.types.is_bool_dtype(dtype):
+        result[:] = series.map(str).to_numpy(dtype=object)
+        return result
+
+    if pd.api.types.is_integer_dtype(dtype):
+        # Integers print without a decimal point and without leading zeros
+        result[:] = series.to_numpy().astype(str).astype(object)
+        return result
+
+    if pd.api.types.is_float_dtype(dtype):
+        values = series.to_numpy(dtype=float)
+        present = ~np.isnan(values)
+        magnitude = np.abs(values)
+        # str() of these floats always contains a '.', so clean_value truncates them
+        plain = present & np.isfinite(values) & ((magnitude >= 1e-4) | (values == 0)) & (magnitude < 1e16)
+        cleaned = np.empty(len(values), dtype=object)
+        cleaned[:] = ''
+        cleaned[plain] = print_numbers(np.trunc(values[plain]))
+        # Scientific notation, inf and friends keep the exact per-value rules
+        other = present & ~plain
+        if other.any():
+            cleaned[other] = [clean_value(value) for value in values[other]]
+        result[:] = cleaned
+        return result
+
+    present = ~series.isna().to_numpy()
+    if not present.any():
+        return result
+    text = series[present].map(str).str.strip().astype(object)
+
+    # Plain ASCII digit strings lose their leading zeros
+    digits = (text.str.isdigit() & text.str.isascii()).to_numpy(dtype=bool)
+    if digits.any():
+        stripped = text[digits].str.lstrip('0')
+        text[digits] = stripped.where(stripped != '', '0')
+
+    # Dotted and unusual digit strings take the exact per-value rules
+    special = (text.str.contains('.', regex=False) | (text.str.isdigit() & ~text.str.isascii())).to_numpy(dtype=bool)
+    if special.any():
+        text[special] = text[special].map(_clean_text)
+
+    result[present] = text.to_numpy(dtype=object)
+    return result
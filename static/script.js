@@ -1,6 +1,12 @@
 let preloadSheets = [];
 let postloadSheets = [];
 let sheetColumns = {};
+// Files up to this size are hashed in the browser first, so a file the server already holds is not sent again;
+// crypto.subtle.digest() needs the whole file in memory, so larger files rely on a remembered digest
+const HASH_PRECHECK_MAX_BYTES = 64 * 1024 * 1024;
+// localStorage entry remembering the digests the server reported for uploaded files
+const UPLOAD_DIGESTS_KEY = 'uploadDigests';
+const UPLOAD_DIGESTS_MAX = 50;
 
 async function loadAllSheets() {
     const preloadFile = document.getElementById('preloadFile').files[0];
@@ -36,34 +42,24 @@ async function loadSheets(fileType) {
     const file = fileInput.files[0];
     
     if (file) {
-        const formData = new FormData();
-        formData.append('file', file);
-        
         try {
-            const response = await fetch(`/get_sheets/${fileType}`, {
-                method: 'POST',
-                body: formData
-            });
+            const response = await uploadFile(fileType, file);
             
             const sheets = await response.json();
             console.log(`${fileType} sheets:`, sheets);
             
+            // Columns and dimensions of every sheet come from a single header-only read
+            const sheetInfo = await loadSheetInfo(fileType);
+            sheetInfo.forEach(info => {
+                sheetColumns[`${fileType}_${info.name}`] = info.columns;
+                console.log(`${fileType} columns for ${info.name}:`, info.columns);
+            });
+            warnAboutLargeSheets(fileType, sheetInfo);
+            
             if (fileType === 'preload') {
                 preloadSheets = sheets;
-                // Load columns for each preload sheet
-                for (const sheet of sheets) {
-                    const columns = await loadColumnsForSheet('preload', sheet);
-                    sheetColumns[`preload_${sheet}`] = columns;
-                    console.log(`Preload columns for ${sheet}:`, columns);
-                }
             } else {
                 postloadSheets = sheets;
-                // Load columns for each postload sheet
-                for (const sheet of sheets) {
-                    const columns = await loadColumnsForSheet('postload', sheet);
-                    sheetColumns[`postload_${sheet}`] = columns;
-                    console.log(`Postload columns for ${sheet}:`, columns);
-                }
             }
             
             updateSheetMappings();
@@ -74,16 +70,105 @@ async function loadSheets(fileType) {
     }
 }
 
-async function loadColumnsForSheet(fileType, sheetName) {
+async function uploadFile(fileType, file) {
+    const sha256 = await fileSha256(file);
+    if (sha256) {
+        const response = await fetch(`/get_sheets/${fileType}`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ sha256: sha256, filename: file.name })
+        });
+        // 404: the server does not have this file yet
+        if (response.status !== 404) {
+            return response;
+        }
+    }
+
+    const formData = new FormData();
+    formData.append('file', file);
+    const response = await fetch(`/get_sheets/${fileType}`, {
+        method: 'POST',
+        body: formData
+    });
+    if (response.ok) {
+        rememberDigest(file, response.headers.get('X-Content-SHA256'));
+    }
+    return response;
+}
+
+async function fileSha256(file) {
+    const remembered = loadDigests()[digestKey(file)];
+    if (remembered) {
+        return remembered;
+    }
+    // crypto.subtle is only available on https and localhost
+    if (!window.crypto || !window.crypto.subtle || file.size > HASH_PRECHECK_MAX_BYTES) {
+        return null;
+    }
+    const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest))
+        .map(byte => byte.toString(16).padStart(2, '0'))
+        .join('');
+}
+
+function digestKey(file) {
+    return `${file.name}|${file.size}|${file.lastModified}`;
+}
+
+function loadDigests() {
+    try {
+        return JSON.parse(localStorage.getItem(UPLOAD_DIGESTS_KEY)) || {};
+    } catch (error) {
+        // Storage may be disabled or hold something else
+        return {};
+    }
+}
+
+function rememberDigest(file, sha256) {
+    if (!sha256) {
+        return;
+    }
+    const digests = loadDigests();
+    delete digests[digestKey(file)];
+    digests[digestKey(file)] = sha256;
+    // Keys keep insertion order, so the oldest entries go first
+    const keys = Object.keys(digests);
+    keys.slice(0, Math.max(keys.length - UPLOAD_DIGESTS_MAX, 0)).forEach(key => delete digests[key]);
+    try {
+        localStorage.setItem(UPLOAD_DIGESTS_KEY, JSON.stringify(digests));
+    } catch (error) {
+        console.warn('Could not remember upload digest:', error);
+    }
+}
+
+async function loadSheetInfo(fileType) {
     try {
-        const response = await fetch(`/get_columns/${fileType}/${sheetName}`);
+        const response = await fetch(`/get_sheet_info/${fileType}`);
+        if (!response.ok) {
+            return [];
+        }
         return await response.json();
     } catch (error) {
-        console.error(`Error loading columns for ${fileType} ${sheetName}:`, error);
+        console.error(`Error loading sheet info for ${fileType}:`, error);
         return [];
     }
 }
 
+function warnAboutLargeSheets(fileType, sheetInfo) {
+    const container = document.getElementById('sheetWarnings');
+    container.querySelectorAll(`[data-file-type="${fileType}"]`).forEach(el => el.remove());
+    
+    sheetInfo.filter(info => info.large).forEach(info => {
+        const warning = document.createElement('div');
+        warning.className = 'sheet-warning';
+        warning.dataset.fileType = fileType;
+        warning.textContent = `⚠️ ${fileType} sheet "${info.name}" has about ${info.rows.toLocaleString()} rows × ${info.columnCount} columns; comparing it may take a while.`;
+        container.appendChild(warning);
+    });
+}
+
 function updateSheetMappings() {
     const mappingContainer = document.getElementById('sheetMappings');
     mappingContainer.innerHTML = '';
@@ -111,12 +196,26 @@ function updateSheetMappings() {
             postSelect.appendChild(option);
         });
         
-        // Key column selection
+        // Key column selection; several columns form a composite key
         const keySelect = document.createElement('select');
         keySelect.className = 'key-column';
-        keySelect.innerHTML = '<option value="">Select Key Column</option>';
+        keySelect.multiple = true;
+        keySelect.title = 'Ctrl/Cmd-click to select several columns as a composite key';
+        keySelect.innerHTML = '<option value="" disabled>Select Key Column(s)</option>';
         keySelect.disabled = true;
         
+        // Match rows by key, or by their order for loads that keep the preload's row order
+        const modeSelect = document.createElement('select');
+        modeSelect.className = 'compare-mode';
+        modeSelect.innerHTML = `
+            <option value="key">Match rows by key</option>
+            <option value="position">Match rows by order</option>
+        `;
+        modeSelect.onchange = () => {
+            const postSheet = postSelect.value;
+            keySelect.disabled = modeSelect.value === 'position' || !postSheet || postSheet === 'none';
+        };
+        
         // Handle file name display
         document.getElementById('preloadFile').addEventListener('change', function(e) {
             document.getElementById('preloadFileName').textContent = e.target.files[0].name;
@@ -129,10 +228,10 @@ function updateSheetMappings() {
         // Update key column options when postload sheet is selected
         postSelect.onchange = () => {
             const selectedPostSheet = postSelect.value;
-            keySelect.innerHTML = '<option value="">Select Key Column</option>';
+            keySelect.innerHTML = '<option value="" disabled>Select Key Column(s)</option>';
             
             if (selectedPostSheet && selectedPostSheet !== 'none') {
-                keySelect.disabled = false;
+                keySelect.disabled = modeSelect.value === 'position';
                 const preColumns = sheetColumns[`preload_${preSheet}`] || [];
                 const postColumns = sheetColumns[`postload_${selectedPostSheet}`] || [];
                 const commonColumns = preColumns.filter(col => postColumns.includes(col));
@@ -150,6 +249,7 @@ function updateSheetMappings() {
         
         mappingRow.appendChild(preSheetLabel);
         mappingRow.appendChild(postSelect);
+        mappingRow.appendChild(modeSelect);
         mappingRow.appendChild(keySelect);
         mappingContainer.appendChild(mappingRow);
     });
@@ -160,19 +260,30 @@ async function compareFiles() {
     document.querySelectorAll('.mapping-row').forEach(row => {
         const preSheet = row.querySelector('.sheet-label').textContent;
         const postSheet = row.querySelector('.postload-sheet').value;
-        const keyColumn = row.querySelector('.key-column').value;
+        const mode = row.querySelector('.compare-mode').value;
+        const keyColumns = Array.from(row.querySelector('.key-column').selectedOptions)
+            .map(option => option.value)
+            .filter(value => value);
         
-        if (preSheet && postSheet && (postSheet === 'none' || keyColumn)) {
+        if (preSheet && postSheet && mode === 'position' && postSheet !== 'none') {
+            mappings.push({
+                preloadSheet: preSheet,
+                postloadSheet: postSheet,
+                mode: 'position',
+                keyColumn: null
+            });
+        } else if (preSheet && postSheet && (postSheet === 'none' || keyColumns.length)) {
             mappings.push({
                 preloadSheet: preSheet,
                 postloadSheet: postSheet,
-                keyColumn: keyColumn
+                // A single column stays a plain string, as older servers expect
+                keyColumn: keyColumns.length === 1 ? keyColumns[0] : keyColumns
             });
         }
     });
     
     if (mappings.length === 0) {
-        showStatus('Please complete at least one sheet mapping with key column', 'error');
+        showStatus('Please complete at least one sheet mapping with a key column or row order matching', 'error');
         return;
     }
     
@@ -184,28 +295,15 @@ async function compareFiles() {
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({ sheetMappings: mappings })
+            body: JSON.stringify({
+                sheetMappings: mappings,
+                reportFormat: document.getElementById('reportFormat').value || null
+            })
         });
         
         if (response.ok) {
             const result = await response.json();
-            if (result.downloadReady) {
-                // Create download button
-                const downloadBtn = document.createElement('a');
-                downloadBtn.href = '/download_result';
-                downloadBtn.className = 'action-button download-button';
-                downloadBtn.innerHTML = '⬇️ Download Comparison Result';
-                downloadBtn.download = 'comparison_result.xlsx';
-                
-                // Add or replace download button
-                const existingBtn = document.querySelector('.download-button');
-                if (existingBtn) {
-                    existingBtn.remove();
-                }
-                document.querySelector('.container').appendChild(downloadBtn);
-                
-                showStatus('Comparison completed successfully. Click the download button to get the result.', 'success');
-            }
+            await pollJob(result.jobId);
         } else {
             const error = await response.json();
             showStatus(`Error during comparison: ${error.error}`, 'error');
@@ -216,6 +314,59 @@ async function compareFiles() {
     }
 }
 
+async function pollJob(jobId) {
+    while (true) {
+        const response = await fetch(`/jobs/${jobId}`);
+        const job = await response.json();
+        
+        if (!response.ok) {
+            showStatus(`Error during comparison: ${job.error}`, 'error');
+            return;
+        }
+        if (job.status === 'failed') {
+            showStatus(`Error during comparison: ${job.error}`, 'error');
+            return;
+        }
+        if (job.status === 'completed') {
+            showDownloadButton(`/jobs/${jobId}/download`);
+            showStatus('Comparison completed successfully. Click the download button to get the result.', 'success');
+            return;
+        }
+        
+        showStatus(describeProgress(job), 'info');
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
+function describeProgress(job) {
+    if (job.status === 'queued') {
+        return 'Comparison queued...';
+    }
+    const sheets = job.sheets
+        .map(sheet => `${sheet.sheet}: ${sheet.rowsProcessed.toLocaleString()}/${sheet.rowsTotal.toLocaleString()} rows`)
+        .join(', ');
+    const eta = job.etaSeconds !== null ? `, about ${Math.ceil(job.etaSeconds)}s left` : '';
+    return `Comparing files... ${Math.round(job.progress * 100)}%${eta} (${sheets})`;
+}
+
+function showDownloadButton(url) {
+    // Create download button
+    const downloadBtn = document.createElement('a');
+    const downloadPackage = document.getElementById('downloadPackage').value;
+    downloadBtn.href = downloadPackage ? `${url}?package=${downloadPackage}` : url;
+    downloadBtn.className = 'action-button download-button';
+    downloadBtn.innerHTML = '⬇️ Download Comparison Result';
+    // Keep the file name sent by the server (workbook, report or archive)
+    downloadBtn.download = '';
+    
+    // Add or replace download button
+    const existingBtn = document.querySelector('.download-button');
+    if (existingBtn) {
+        existingBtn.remove();
+    }
+    document.querySelector('.container').appendChild(downloadBtn);
+}
+
 function showStatus(message, type) {
     const statusDiv = document.getElementById('status');
     statusDiv.textContent = message;
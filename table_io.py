@@ -0,0 +1,158 @@
+import hashlib
+import os
+import threading
+
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+from pandas._libs.parsers import STR_NA_VALUES
+
+# CSV and Parquet exports hold a single table, exposed under this sheet name
+TABLE_SHEET_NAME = 'Sheet1'
+
+_hash_lock = threading.Lock()
+_hashes = {}
+
+def file_hash(filepath):
+    """SHA-256 of a file's content, remembered per path, size and mtime"""
+    stat = os.stat(filepath)
+    stamp = (os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)
+    with _hash_lock:
+        digest = _hashes.get(stamp)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        with _hash_lock:
+            _hashes[stamp] = digest
+    return digest
+
+def remember_hash(filepath, digest):
+    """Record a file's SHA-256 computed elsewhere (e.g. while it was uploaded) so file_hash skips the read"""
+    stat = os.stat(filepath)
+    with _hash_lock:
+        _hashes[(os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)] = digest
+
+def table_format(filepath):
+    """'csv', 'parquet' or 'excel', from the file extension"""
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension in ('.csv', '.txt'):
+        return 'csv'
+    if extension in ('.parquet', '.pq'):
+        return 'parquet'
+    return 'excel'
+
+def read_table(filepath, sheet_name):
+    """Read a whole sheet (or CSV/Parquet table) into a DataFrame"""
+    file_format = table_format(filepath)
+    if file_format == 'csv':
+        _check_table_sheet(filepath, sheet_name)
+        # Text as-is: inferring numbers would mangle long account numbers
+        return pd.read_csv(filepath, dtype=str, keep_default_na=False, na_values=[''])
+    if file_format == 'parquet':
+        _check_table_sheet(filepath, sheet_name)
+        return pd.read_parquet(filepath)
+    return pd.read_excel(filepath, sheet_name=sheet_name)
+
+def iter_table_chunks(filepath, sheet_name, chunk_size):
+    """Yield a sheet as DataFrames of at most ``chunk_size`` rows, reading lazily.
+
+    Column names match what read_table would produce. For xlsx, values beyond the
+    header's last column are dropped and trailing blank rows are skipped, as
+    pd.read_excel does.
+    """
+    file_format = table_format(filepath)
+    if file_format == 'csv':
+        _check_table_sheet(filepath, sheet_name)
+        yield from pd.read_csv(filepath, dtype=str, keep_default_na=False, na_values=[''], chunksize=chunk_size)
+    elif file_format == 'parquet':
+        _check_table_sheet(filepath, sheet_name)
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet files in chunks requires the 'pyarrow' package")
+        for batch in pq.ParquetFile(filepath).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from _iter_excel_chunks(filepath, sheet_name, chunk_size)
+
+def _iter_excel_chunks(filepath, sheet_name, chunk_size):
+    workbook = load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+        columns = pandas_column_names(list(next(rows, ())))
+        width = len(columns)
+
+        chunk = []
+        blank_run = []
+        yielded = False
+        for row in rows:
+            row = tuple(row[:width]) + (None,) * (width - len(row))
+            if all(value is None for value in row):
+                # Hold blank rows back until we know they are not trailing
+                blank_run.append(row)
+                continue
+            if blank_run:
+                chunk.extend(blank_run)
+                blank_run = []
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield _rows_to_frame(chunk, columns)
+                yielded = True
+                chunk = []
+        if chunk or not yielded:
+            # Always yield at least once so callers see the columns
+            yield _rows_to_frame(chunk, columns)
+    finally:
+        workbook.close()
+
+def _rows_to_frame(rows, columns):
+    rows = [[_excel_cell(value) for value in row] for row in rows]
+    frame = pd.DataFrame.from_records(rows, columns=range(len(columns)), nrows=len(rows))
+    frame.columns = columns
+    return frame
+
+def _excel_cell(value):
+    """A cell's value as pd.read_excel reads it, before read_excel infers one type per column.
+
+    Blanks, error cells and NA strings ('NA', 'N/A', 'NULL'...) read as None and
+    integral floats as int. read_excel then infers each column's type from the
+    whole sheet, and chunks only from their own rows. After cleaning, that
+    only differs for bools (read_excel reads True as 1 in columns of bools with
+    numbers or blanks, and 1 as True in columns of bools with text) and for
+    integral numbers of 1e16 and more, which print as '3e+16' in float columns.
+    """
+    if isinstance(value, str) and (value in STR_NA_VALUES or value in ERROR_CODES):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def pandas_column_names(header):
+    """Name header cells like pd.read_excel: blanks become 'Unnamed: n', repeats get '.n'"""
+    while header and is_blank(header[-1]):
+        header = header[:-1]
+    names = [f'Unnamed: {idx}' if is_blank(value) else value for idx, value in enumerate(header)]
+
+    counts = {}
+    seen = set(names)
+    for idx, name in enumerate(names):
+        count = counts.get(name, 0)
+        if count:
+            new_name = f'{name}.{count}'
+            while new_name in seen:
+                count += 1
+                new_name = f'{name}.{count}'
+            names[idx] = new_name
+            seen.add(new_name)
+        counts[name] = count + 1
+    return names
+
+def is_blank(value):
+    return value is None or (isinstance(value, str) and value == '')
+
+def _check_table_sheet(filepath, sheet_name):
+    if sheet_name not in (None, TABLE_SHEET_NAME):
+        raise ValueError(f"{os.path.basename(filepath)} has a single sheet named '{TABLE_SHEET_NAME}'")
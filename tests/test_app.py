@@ -0,0 +1,51 @@
+import io
+import os
+import threading
+import uuid
+
+import pandas as pd
+import pytest
+
+from app import app, job_manager, workspaces
+
+@pytest.fixture
+def client():
+    client = app.test_client()
+    client.environ_base['HTTP_X_WORKSPACE_ID'] = uuid.uuid4().hex
+    return client
+
+def upload(client, file_type, rows):
+    data = io.BytesIO()
+    pd.DataFrame({'ID': list(range(rows))}).to_excel(data, sheet_name='S', index=False)
+    data.seek(0)
+    response = client.post(f'/get_sheets/{file_type}', data={'file': (data, f'{file_type}.xlsx')})
+    assert response.status_code == 200
+    workspace = workspaces.open(client.environ_base['HTTP_X_WORKSPACE_ID'])
+    return workspace, workspace.get(f'{file_type.upper()}_FILE')
+
+def test_reupload_keeps_the_file_a_running_job_reads(client):
+    workspace, first = upload(client, 'postload', 1)
+    release = threading.Event()
+    job = job_manager.submit(
+        lambda progress: release.wait(10), [('S', 1)], state_dir=workspace.jobs_dir, inputs=(first,)
+    )
+
+    _, second = upload(client, 'postload', 2)
+    assert os.path.exists(first)
+
+    release.set()
+    while job.finished_at is None:
+        release.wait(0.01)
+    upload(client, 'postload', 3)
+    # Without a job reading it, the replaced upload is deleted
+    assert not os.path.exists(second)
+
+def test_job_status_hides_file_paths(client):
+    workspace, postload = upload(client, 'postload', 1)
+    job = job_manager.submit(lambda progress: postload, [('S', 1)], state_dir=workspace.jobs_dir, inputs=(postload,))
+    while job.finished_at is None:
+        threading.Event().wait(0.01)
+
+    state = client.get(f'/jobs/{job.id}').get_json()
+    assert state['status'] == 'completed'
+    assert 'inputFiles' not in state and 'resultFile' not in state
@@ -0,0 +1,19 @@
+import random
+from difflib import get_close_matches
+
+import pytest
+
+from column_matching import ColumnMatcher
+
+def test_fuzzy_finds_matches_sharing_no_bigram():
+    assert get_close_matches('QABCR', ['AXBYC'], cutoff=0.6) == ['AXBYC']
+    assert ColumnMatcher(['AXBYC']).fuzzy('QABCR', cutoff=0.6, limit=1) == [('AXBYC', 0.6)]
+
+@pytest.mark.parametrize('limit', [1, 3, None])
+def test_fuzzy_matches_get_close_matches(limit):
+    rng = random.Random(limit)
+    names = [''.join(rng.choice('ABCDE_1') for _ in range(rng.randint(1, 8))) for _ in range(200)]
+    matcher = ColumnMatcher(names)
+    for column in names[:60] + ['ABC', 'QABCR', 'E_1']:
+        expected = get_close_matches(column, names, n=limit or len(names), cutoff=0.6)
+        assert [candidate for candidate, _ in matcher.fuzzy(column, 0.6, limit)] == expected, column
@@ -0,0 +1,99 @@
+import importlib.util
+import os
+import threading
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from columnar_cache import (
+    MANIFEST, _converting, _lock, _parse_sheets, _write_sheet, columnar_dir, convert_to_columnar, load_columnar
+)
+from table_io import TABLE_SHEET_NAME, file_hash
+from workspaces import write_json_atomic
+
+def write_csv(path, rows):
+    pd.DataFrame({'ID': [str(i) for i in range(rows)]}).to_csv(path, index=False)
+
+def test_csv_longer_than_max_rows_is_not_loaded(tmp_path):
+    write_csv(tmp_path / 'short.csv', 3)
+    write_csv(tmp_path / 'long.csv', 4)
+
+    assert [name for name, _ in _parse_sheets(str(tmp_path / 'short.csv'), 'csv', 3, {})] == [TABLE_SHEET_NAME]
+    assert list(_parse_sheets(str(tmp_path / 'long.csv'), 'csv', 3, {})) == []
+
+def test_sheets_with_unknown_row_counts_are_skipped(tmp_path):
+    workbook = Workbook()
+    workbook.active.title = 'Known'
+    workbook.create_sheet('Unknown')
+    workbook.save(tmp_path / 'book.xlsx')
+
+    sheets = _parse_sheets(str(tmp_path / 'book.xlsx'), 'excel', 10, {'Known': 0, 'Unknown': None})
+    assert [name for name, _ in sheets] == ['Known']
+
+@pytest.mark.skipif(importlib.util.find_spec('pyarrow') is not None, reason='pyarrow is installed')
+def test_nothing_is_converted_without_pyarrow(tmp_path):
+    write_csv(tmp_path / 'table.csv', 3)
+
+    convert_to_columnar(str(tmp_path / 'table.csv'))
+
+    assert load_columnar(str(tmp_path / 'table.csv'), TABLE_SHEET_NAME) is None
+    assert not (tmp_path / '.columnar').exists()
+
+def write_converted(filepath, sheets):
+    """Store ``sheets`` as a conversion of ``filepath`` would, returning the manifest"""
+    target = columnar_dir(filepath)
+    os.makedirs(target, exist_ok=True)
+    manifest = {sheet_name: _write_sheet(df, target, str(idx)) for idx, (sheet_name, df) in enumerate(sheets.items())}
+    write_json_atomic(os.path.join(target, MANIFEST), manifest)
+    return manifest
+
+def test_sheets_arrow_cannot_hold_are_pickled(tmp_path):
+    write_csv(tmp_path / 'table.csv', 3)
+    df = pd.DataFrame({'ID': ['1', '2', '3'], 'MIXED': ['007', 7, 1.5]}, dtype=object)
+
+    manifest = write_converted(str(tmp_path / 'table.csv'), {TABLE_SHEET_NAME: df})
+
+    assert manifest == {TABLE_SHEET_NAME: {'file': '0.pkl', 'format': 'pickle'}}
+    assert sorted(os.listdir(columnar_dir(str(tmp_path / 'table.csv')))) == ['0.pkl', MANIFEST]
+    loaded = load_columnar(str(tmp_path / 'table.csv'), TABLE_SHEET_NAME)
+    assert loaded.equals(df)
+    assert loaded['MIXED'].tolist() == ['007', 7, 1.5]
+    assert load_columnar(str(tmp_path / 'table.csv'), 'Other') is None
+
+def test_sheets_are_stored_as_feather(tmp_path):
+    pytest.importorskip('pyarrow')
+    write_csv(tmp_path / 'table.csv', 3)
+    df = pd.DataFrame({'ID': ['1', '2', '3'], 'AMT': [1.5, None, 3.0]})
+
+    manifest = write_converted(str(tmp_path / 'table.csv'), {TABLE_SHEET_NAME: df})
+
+    assert manifest == {TABLE_SHEET_NAME: {'file': '0.feather', 'format': 'feather'}}
+    loaded = load_columnar(str(tmp_path / 'table.csv'), TABLE_SHEET_NAME)
+    assert loaded.equals(df)
+    assert loaded.dtypes.equals(df.dtypes)
+
+def test_load_waits_for_a_conversion_in_flight(tmp_path):
+    filepath = str(tmp_path / 'table.csv')
+    write_csv(filepath, 3)
+    df = pd.DataFrame({'ID': ['1', '2', '3']})
+    done = threading.Event()
+    with _lock:
+        _converting[file_hash(filepath)] = done
+    try:
+        loaded = []
+        reader = threading.Thread(target=lambda: loaded.append(load_columnar(filepath, TABLE_SHEET_NAME)))
+        reader.start()
+        reader.join(0.2)
+        # Still waiting: reading now would find no manifest and return None
+        assert reader.is_alive()
+
+        write_converted(filepath, {TABLE_SHEET_NAME: df})
+        done.set()
+        reader.join(5)
+        assert not reader.is_alive()
+        assert loaded[0].equals(df)
+    finally:
+        with _lock:
+            _converting.pop(file_hash(filepath), None)
+        done.set()
@@ -0,0 +1,83 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from comparison_logic import compare_sheet, diff_frames
+from comparison_rules import compile_rules, rules_signature
+
+def diff(pre, post, column_rules, key='ID'):
+    pre, post = pd.DataFrame(pre), pd.DataFrame(post)
+    mapping = {column: column for column in post.columns}
+    keys, changed, missing = diff_frames(pre, post, key, mapping, rules=compile_rules(column_rules))
+    return keys, changed, missing
+
+def flagged(mask, column):
+    return mask[column].to_numpy().tolist()
+
+def test_tolerance_compares_numbers_within_it_and_keeps_blanks_missing():
+    pre = {'ID': [1, 2, 3, 4], 'AMT': [10.0, 10.0, 10.0, 10.0]}
+    post = {'ID': [1, 2, 3, 4], 'AMT': [10.004, 10.5, None, 9.99]}
+
+    _, changed, missing = diff(pre, post, {'AMT': {'tolerance': 0.01}})
+
+    assert flagged(changed, 'AMT') == [False, True, False, False]
+    assert flagged(missing, 'AMT') == [False, False, True, False]
+    # Without the rule 10.004 and 10.5 clean to 10, while 9.99 cleans to 9
+    _, changed, _ = diff(pre, post, None)
+    assert flagged(changed, 'AMT') == [False, False, False, True]
+
+def test_ignore_case_with_collapsed_whitespace():
+    pre = {'ID': [1, 2, 3], 'NAME': ['Foo Bar', 'Foo Bar', 'Foo Bar']}
+    post = {'ID': [1, 2, 3], 'NAME': ['foo   BAR', ' FOO\tbar ', 'foo baz']}
+
+    _, changed, _ = diff(pre, post, {'NAME': {'ignoreCase': True, 'collapseWhitespace': True}})
+    assert flagged(changed, 'NAME') == [False, False, True]
+
+    _, changed, _ = diff(pre, post, {'NAME': {'ignoreCase': True}})
+    assert flagged(changed, 'NAME') == [True, True, True]
+
+def test_date_format_reads_text_dates_against_excel_datetimes(tmp_path):
+    pd.DataFrame({
+        'ID': [1, 2, 3],
+        'DATE': [datetime.datetime(2024, 1, 5), datetime.datetime(2024, 1, 5), datetime.datetime(2024, 2, 29, 13, 30)],
+    }).to_excel(tmp_path / 'pre.xlsx', sheet_name='S', index=False)
+    pd.DataFrame({'ID': [1, 2, 3], 'DATE': ['05.01.2024', '06.01.2024', '29.02.2024']}).to_excel(
+        tmp_path / 'post.xlsx', sheet_name='S', index=False
+    )
+
+    comparison = compare_sheet(
+        tmp_path / 'pre.xlsx', tmp_path / 'post.xlsx', 'S', 'S', 'ID', column_rules={'DATE': {'date': '%d.%m.%Y'}}
+    )
+
+    # The third preload date has a time of day, so it is not the same as a plain date
+    assert flagged(comparison.changed, 'DATE') == [False, True, True]
+
+@pytest.mark.parametrize('leading_zeros, matched', [
+    ('strip', [True, True, True]),
+    ('digits', [True, False, True]),
+])
+def test_leading_zeros_rule_applies_to_key_columns(leading_zeros, matched):
+    pre = {'ID': ['007', '000A12', 'B1'], 'NAME': ['a', 'b', 'c']}
+    post = {'ID': [7, 'A12', 'B1'], 'NAME': ['a', 'b', 'x']}
+
+    keys, changed, _ = diff(pre, post, {'ID': {'leadingZeros': leading_zeros}})
+
+    assert keys.matched.tolist() == matched
+    assert flagged(changed, 'NAME') == [False, False, True]
+
+def test_rules_signature_follows_the_rules():
+    signature = rules_signature(compile_rules({'AMT': {'tolerance': 0.01}}))
+
+    assert signature == rules_signature(compile_rules({'AMT': {'tolerance': 0.01}}))
+    assert signature != rules_signature(compile_rules({'AMT': {'tolerance': 0.02}}))
+    assert signature != rules_signature(compile_rules({'NAME': {'tolerance': 0.01}}))
+    assert rules_signature(None) == rules_signature(compile_rules({})) == []
+
+def test_invalid_rules_are_rejected():
+    with pytest.raises(ValueError):
+        compile_rules({'AMT': {'tolerance': -1}})
+    with pytest.raises(ValueError):
+        compile_rules({'AMT': {'unknown': True}})
+    with pytest.raises(ValueError):
+        compile_rules({'AMT': {'leadingZeros': 'sometimes'}})
@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+
+from comparison_logic import compare_workbooks
+from diff_report import REPORT_COLUMNS, column_counts, counts_file, write_diff_report
+
+@pytest.fixture
+def workbooks(tmp_path):
+    pre = pd.DataFrame({'ID': [1, 2, 3, 4], 'NAME': ['a', 'b', 'c', 'd'], 'AMT': [1.5, 2.0, 3.0, 4.0]})
+    post = pd.DataFrame({'ID': [2, 1, 5, None, 3], 'NAME': ['B', 'a', 'e', 'x', 'c'], 'AMT': [2.0, None, 5.0, 1.0, 4.25]})
+    with pd.ExcelWriter(tmp_path / 'pre.xlsx') as writer:
+        pre.to_excel(writer, sheet_name='S1', index=False)
+        pre.to_excel(writer, sheet_name='S2', index=False)
+    with pd.ExcelWriter(tmp_path / 'post.xlsx') as writer:
+        post.to_excel(writer, sheet_name='S1', index=False)
+        post.iloc[:2].to_excel(writer, sheet_name='S2', index=False)
+    return tmp_path / 'pre.xlsx', tmp_path / 'post.xlsx'
+
+def compare(workbooks, output_dir, report_format):
+    output_dir.mkdir()
+    return compare_workbooks(
+        *workbooks, [('S1', 'S1', 'ID'), ('S2', 'S2', 'ID')], str(output_dir), max_workers=1,
+        report_format=report_format
+    )
+
+def test_xlsx_report_lists_each_difference_and_counts_them_per_column(workbooks, tmp_path):
+    output_file = compare(workbooks, tmp_path / 'out', 'xlsx')
+
+    records = pd.read_excel(output_file, sheet_name='Differences', dtype=str, keep_default_na=False)
+    assert list(records.columns) == REPORT_COLUMNS
+    # Values are shown cleaned, as they were compared: the preload's 1.5 reads '1'
+    assert records.values.tolist() == [
+        ['S1', '2', '2', 'NAME', 'b', 'B', 'changed'],
+        ['S1', '3', '1', 'AMT', '1', '', 'missing'],
+        ['S1', '4', '5', '', '', '', 'unmatched key'],
+        ['S1', '5', '', '', '', '', 'blank key'],
+        ['S1', '6', '3', 'AMT', '3', '4', 'changed'],
+        ['S1', '', '4', '', '', '', 'preload only key'],
+        ['S2', '2', '2', 'NAME', 'b', 'B', 'changed'],
+        ['S2', '3', '1', 'AMT', '1', '', 'missing'],
+        ['S2', '', '3', '', '', '', 'preload only key'],
+        ['S2', '', '4', '', '', '', 'preload only key'],
+    ]
+
+    counts = pd.read_excel(output_file, sheet_name='Column counts', keep_default_na=False)
+    assert counts.values.tolist() == [
+        ['S1', '', 0, 0, 1, 1, 1, 3],
+        ['S1', 'AMT', 1, 1, 0, 0, 0, 2],
+        ['S1', 'NAME', 1, 0, 0, 0, 0, 1],
+        ['S2', '', 0, 0, 0, 0, 2, 2],
+        ['S2', 'AMT', 0, 1, 0, 0, 0, 1],
+        ['S2', 'NAME', 1, 0, 0, 0, 0, 1],
+    ]
+    assert list(counts.columns) == [
+        'sheet', 'column', 'changed', 'missing', 'blank key', 'unmatched key', 'preload only key', 'total'
+    ]
+
+def test_csv_report_writes_counts_beside_it(workbooks, tmp_path):
+    output_file = compare(workbooks, tmp_path / 'out', 'csv')
+
+    records = pd.read_csv(output_file, dtype=str, keep_default_na=False)
+    assert len(records) == 10
+    counts = pd.read_csv(counts_file(output_file), keep_default_na=False)
+    assert counts['total'].sum() == 10
+
+def test_column_counts_only_has_kinds_that_occur():
+    records = pd.DataFrame({
+        'sheet': ['S', 'S', 'S'], 'column': ['A', 'A', 'B'], 'kind': ['missing', 'changed', 'changed'],
+    })
+    assert column_counts(records).values.tolist() == [['S', 'A', 1, 1, 2], ['S', 'B', 1, 0, 1]]
+
+def test_empty_report(tmp_path):
+    output_file = write_diff_report([], str(tmp_path / 'report.xlsx'))
+
+    assert pd.read_excel(output_file, sheet_name='Differences').empty
+    assert pd.read_excel(output_file, sheet_name='Column counts').columns.tolist() == ['sheet', 'column', 'total']
@@ -0,0 +1,78 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+import baseline_compare
+import comparison_logic
+
+def write_workbooks(pre_path, post_path, rows, seed):
+    rng = random.Random(seed)
+
+    def value():
+        return rng.choice([
+            None, '', ' ', rng.randint(0, 50), 1.5, 2.0, -3.25, 12.75, 0.0, '  DE', 'US ', '001', '0042', '007', 7,
+            'x.y', '1.2.3', '7.0', '12.50', 'ABC', 'abc', pd.Timestamp('2020-01-01') + pd.Timedelta(days=rng.randint(0, 3)),
+        ])
+
+    # Keys mixing str/int/float spellings of the same number, dotted strings and blanks;
+    # choosing among close numbers repeats keys on both sides
+    keys = [
+        rng.choice([str(i), f'{i:03d}', i, float(i), f'{i}.0', f'{i}.5.1', None, '  ', ''])
+        for i in (rng.randint(0, rows // 2) for _ in range(rows))
+    ]
+    pre = pd.DataFrame({
+        'ALTKN_Prev': keys, 'NAME1 ': [value() for _ in keys], 'LAND1_Country': [value() for _ in keys],
+        'AMT': [rng.choice([1.5, 2, np.nan, 3.75]) for _ in keys], 'CNT': [rng.randint(0, 3) for _ in keys],
+    })
+    post_keys = keys[:]
+    rng.shuffle(post_keys)
+    post_keys += ['999999', None, '007', 7]
+    post = pd.DataFrame({
+        'ALTKN_Prev': post_keys, 'NAME1': [value() for _ in post_keys],
+        'LAND1 Country Key': [value() for _ in post_keys], 'AMT_x': [rng.choice([1.5, 2, np.nan, 3.25]) for _ in post_keys],
+        'CNT': [rng.randint(0, 3) for _ in post_keys], 'EXTRA': ['e'] * len(post_keys),
+    })
+    with pd.ExcelWriter(pre_path) as writer:
+        pre.to_excel(writer, sheet_name='S1', index=False)
+        pre.to_excel(writer, sheet_name='S2', index=False)
+    with pd.ExcelWriter(post_path) as writer:
+        post.to_excel(writer, sheet_name='P1', index=False)
+        post.to_excel(writer, sheet_name='Other', index=False)
+        post.iloc[::-1].to_excel(writer, sheet_name='P2', index=False)
+
+def run(module, pre_path, post_path, output_dir):
+    output_dir.mkdir()
+    for pre_sheet, post_sheet in [('S1', 'P1'), ('S2', 'P2')]:
+        output_file = module.compare_excel_files(pre_path, post_path, pre_sheet, post_sheet, 'ALTKN_Prev', output_dir)
+    return output_file
+
+def read_result(path):
+    workbook = load_workbook(path)
+    return {
+        worksheet.title: (
+            [[cell.value for cell in row] for row in worksheet.iter_rows()],
+            [[cell.fill.fgColor.rgb if cell.fill.fill_type else None for cell in row] for row in worksheet.iter_rows()],
+            {column: dimension.width for column, dimension in worksheet.column_dimensions.items()},
+        )
+        for worksheet in workbook.worksheets
+    }
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_compare_excel_files_matches_the_baseline(tmp_path, seed):
+    pre_path, post_path = tmp_path / 'pre.xlsx', tmp_path / 'post.xlsx'
+    write_workbooks(pre_path, post_path, 300, seed)
+
+    expected = read_result(run(baseline_compare, pre_path, post_path, tmp_path / 'baseline'))
+    result = read_result(run(comparison_logic, pre_path, post_path, tmp_path / 'new'))
+
+    assert list(result) == list(expected)
+    for sheet, (values, fills, widths) in expected.items():
+        assert result[sheet][0] == values, sheet
+        assert result[sheet][1] == fills, sheet
+        assert result[sheet][2] == widths, sheet
+    # The generated data exercises every kind of highlight
+    highlights = {fill for _, fills, _ in expected.values() for row in fills for fill in row}
+    assert {'00FFF2CC', '00E5A78C', '00E6F3FF'} <= highlights
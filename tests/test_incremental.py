@@ -0,0 +1,89 @@
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from comparison_logic import compare_sheet
+
+ROWS = 200
+
+def write_sheet(path, frame):
+    frame.to_excel(path, sheet_name='S', index=False)
+    return path
+
+def preload():
+    ids = [str(i) for i in range(ROWS)]
+    # A duplicated and a blank key, so the key report has something to say
+    ids[5] = ids[4]
+    ids[6] = None
+    return pd.DataFrame({
+        'ID': ids, 'NAME': [f'name {i}' for i in range(ROWS)], 'AMT': [i * 1.5 for i in range(ROWS)],
+    })
+
+def postload():
+    post = preload().copy()
+    post.loc[10, 'NAME'] = 'changed'
+    post.loc[11, 'AMT'] = None
+    post.loc[12, 'ID'] = 'unmatched'
+    post.loc[13, 'ID'] = post.loc[14, 'ID']
+    post.loc[15, 'AMT'] += 0.5
+    return post
+
+def edit(post, rows):
+    post = post.copy()
+    for row in rows:
+        post.loc[row, 'NAME'] = f'edited {row}'
+    # One new row with a new key and one with a duplicated key, one row removed
+    added = pd.DataFrame({'ID': ['new', '20'], 'NAME': ['added', 'twin'], 'AMT': [1.0, 2.0]})
+    return pd.concat([post.drop(index=30), added], ignore_index=True)
+
+def assert_same_comparison(result, expected):
+    pd.testing.assert_frame_equal(result.changed, expected.changed)
+    pd.testing.assert_frame_equal(result.missing, expected.missing)
+    for flags in ('blank_key', 'unmatched_key', 'duplicate_key'):
+        np.testing.assert_array_equal(getattr(result, flags), getattr(expected, flags), err_msg=flags)
+    assert result.key_report == expected.key_report
+
+def compare(tmp_path, pre_path, post, name, column_rules=None, snapshot=True):
+    post_path = write_sheet(tmp_path / f'{name}.xlsx', post)
+    return compare_sheet(
+        pre_path, post_path, 'S', 'S', 'ID', column_rules=column_rules,
+        snapshot_dir=str(tmp_path / 'snapshots') if snapshot else None
+    )
+
+@pytest.mark.parametrize('edited, branch', [(range(40, 60), 'reusing'), (range(40, 160), 'diffing all')])
+def test_rerun_with_snapshot_matches_a_full_comparison(tmp_path, caplog, edited, branch):
+    pre_path = write_sheet(tmp_path / 'pre.xlsx', preload())
+    first = compare(tmp_path, pre_path, postload(), 'post1')
+    assert_same_comparison(first, compare(tmp_path, pre_path, postload(), 'post1', snapshot=False))
+
+    caplog.set_level(logging.DEBUG, logger='comparison_logic')
+    post = edit(postload(), edited)
+    result = compare(tmp_path, pre_path, post, 'post2')
+
+    assert f'Incremental diff: {branch}' in caplog.text
+    expected = compare(tmp_path, pre_path, post, 'post2', snapshot=False)
+    assert_same_comparison(result, expected)
+    assert expected.changed.to_numpy().any() and expected.missing.to_numpy().any()
+    assert expected.unmatched_key.any() and expected.duplicate_key.any() and expected.blank_key.any()
+
+@pytest.mark.parametrize('change', ['preload', 'rules'])
+def test_snapshot_is_not_reused_after_a_preload_or_rules_change(tmp_path, caplog, change):
+    pre_path = write_sheet(tmp_path / 'pre.xlsx', preload())
+    first = compare(tmp_path, pre_path, postload(), 'post1')
+
+    rules = None
+    if change == 'preload':
+        pre = preload()
+        pre.loc[20:25, 'NAME'] = 'new preload name'
+        pre_path = write_sheet(tmp_path / 'pre2.xlsx', pre)
+    else:
+        rules = {'NAME': {'ignoreCase': True}, 'AMT': {'tolerance': 100}}
+    caplog.set_level(logging.DEBUG, logger='comparison_logic')
+    result = compare(tmp_path, pre_path, postload(), 'post1', column_rules=rules)
+
+    assert 'Incremental diff: diffing all' in caplog.text
+    assert_same_comparison(result, compare(tmp_path, pre_path, postload(), 'post1', rules, snapshot=False))
+    # The stale snapshot would have given a different answer
+    assert not result.changed.equals(first.changed)
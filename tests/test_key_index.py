@@ -0,0 +1,82 @@
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import metrics
+from chunked_compare import compare_sheet_chunked
+from comparison_logic import compare_sheet
+from diff_report import PRELOAD_ONLY_KEY, UNMATCHED_KEY
+
+KEY = ['REGION', 'ID']
+
+@pytest.fixture
+def workbooks(tmp_path):
+    pre = pd.DataFrame([
+        ('A', 1, 'first'),
+        ('A', 1, 'last'),
+        ('B', None, 'b'),
+        (None, 2, 'c'),
+        ('C', 3, 'only in preload'),
+        (None, None, 'blank key'),
+    ], columns=[*KEY, 'VALUE'])
+    post = pd.DataFrame([
+        ('A', 1, 'last'),
+        ('B', None, 'changed'),
+        (None, 2, 'c'),
+        ('D', 4, 'd'),
+        ('D', 4, 'd'),
+        (None, None, 'blank key'),
+    ], columns=[*KEY, 'VALUE'])
+    pre.to_excel(tmp_path / 'pre.xlsx', sheet_name='S', index=False)
+    post.to_excel(tmp_path / 'post.xlsx', sheet_name='S', index=False)
+    return tmp_path / 'pre.xlsx', tmp_path / 'post.xlsx'
+
+def test_composite_keys_in_memory(workbooks, caplog):
+    caplog.set_level(logging.WARNING)
+    comparison = compare_sheet(*workbooks, 'S', 'S', KEY, report=True)
+
+    # Keys with one blank part still match; only the all-blank key is blank
+    assert comparison.blank_key.tolist() == [False, False, False, False, False, True]
+    assert comparison.unmatched_key.tolist() == [False, False, False, True, True, False]
+    assert comparison.duplicate_key.tolist() == [False, False, False, True, True, False]
+    assert comparison.key_report == {
+        'duplicatePreloadKeys': {'keys': 1, 'rows': 2, 'examples': ['A | 1']},
+        'duplicatePostloadKeys': {'keys': 1, 'rows': 2, 'examples': ['D | 4']},
+        'preloadOnlyKeys': {'keys': 1, 'rows': 1, 'examples': ['C | 3']},
+    }
+    assert "1 keys repeat on 2 preload rows" in caplog.text
+
+    records = comparison.records
+    # The last of the duplicate preload rows is compared, so 'A | 1' is unchanged
+    assert records[records['kind'] == 'changed'][['key', 'pre_value', 'post_value']].values.tolist() == [
+        ['B | ', 'b', 'changed']
+    ]
+    assert records[records['kind'] == UNMATCHED_KEY]['key'].tolist() == ['D | 4', 'D | 4']
+    assert records[records['kind'] == PRELOAD_ONLY_KEY]['key'].tolist() == ['C | 3']
+
+@pytest.mark.parametrize('chunk_size', [2, 100])
+def test_composite_keys_chunked(workbooks, tmp_path, caplog, chunk_size):
+    caplog.set_level(logging.WARNING)
+    records = []
+    with metrics.collecting(metrics.Metrics()) as collected:
+        compare_sheet_chunked(None, *workbooks, 'S', 'S', KEY, tmp_path, chunk_size=chunk_size, records=records)
+    records = pd.concat(records, ignore_index=True)
+
+    counters = collected.to_dict()['counters']
+    assert counters['blankKeys'] == 1
+    assert counters['unmatchedKeys'] == 2
+    assert counters['duplicatePreloadKeys'] == 1
+    assert counters['duplicatePostloadKeys'] == 1
+    assert counters['preloadOnlyKeys'] == 1
+    assert "1 keys repeat on 2 preload rows" in caplog.text
+    assert "1 keys repeat on 2 postload rows" in caplog.text
+    assert "1 preload keys are missing from the postload, e.g. ['C | 3']" in caplog.text
+
+    assert records[records['kind'] == 'changed'][['key', 'pre_value', 'post_value']].values.tolist() == [
+        ['B | ', 'b', 'changed']
+    ]
+    assert records[records['kind'] == UNMATCHED_KEY]['key'].tolist() == ['D | 4', 'D | 4']
+    assert records[records['kind'] == PRELOAD_ONLY_KEY]['key'].tolist() == ['C | 3']
+    assert np.array_equal(records['row'].dropna().to_numpy(dtype=int), [3, 5, 6, 7])
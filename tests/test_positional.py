@@ -0,0 +1,68 @@
+import pandas as pd
+from openpyxl import Workbook
+
+from chunked_compare import compare_large_files
+from comparison_logic import compare_workbooks
+
+def write_rows(path, rows):
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.title = 'S'
+    for row in rows:
+        worksheet.append(row)
+    workbook.save(path)
+
+def read_report(path):
+    report = pd.read_csv(path, keep_default_na=False, dtype=str)
+    return report.sort_values(['row', 'column', 'key', 'kind']).reset_index(drop=True)
+
+def test_chunked_row_order_matches_in_memory_with_blank_rows(tmp_path):
+    header = ['ID', 'NAME', 'AMT']
+    pre = [header] + [[i, f'name {i}', i * 10] for i in range(10)]
+    post = [header] + [[i, f'name {i}', i * 10] for i in range(10)]
+    # Blank rows are held back into the next chunk, so the two sheets chunk differently
+    pre[3] = [None, None, None]
+    post[9] = [None, None, None]
+    post[10][1] = 'renamed'
+    write_rows(tmp_path / 'pre.xlsx', pre)
+    write_rows(tmp_path / 'post.xlsx', post)
+    mappings = [('S', 'S', None)]
+
+    in_memory = compare_workbooks(tmp_path / 'pre.xlsx', tmp_path / 'post.xlsx', mappings, tmp_path, report_format='csv')
+    chunked = compare_large_files(
+        tmp_path / 'pre.xlsx', tmp_path / 'post.xlsx', mappings, str(tmp_path / 'chunked.csv'), chunk_size=3,
+        report=True
+    )
+
+    expected = read_report(in_memory)
+    assert len(expected) > 0
+    pd.testing.assert_frame_equal(read_report(chunked), expected)
+
+def test_highlight_differences_cleans_values_like_the_web_app(tmp_path):
+    from openpyxl import load_workbook
+    from validation import highlight_differences
+
+    write_rows(tmp_path / 'pre.xlsx', [['ID', 'NAME'], ['007', 'a'], ['8', 'b'], ['9', 'c']])
+    write_rows(tmp_path / 'post.xlsx', [['ID', 'NAME'], [7, 'a'], [8, 'x'], [9, None]])
+    workbook = load_workbook(tmp_path / 'post.xlsx')
+    workbook.create_sheet('Other').append(['kept'])
+    workbook.save(tmp_path / 'post.xlsx')
+    highlight_differences(
+        tmp_path / 'pre.xlsx', tmp_path / 'post.xlsx', tmp_path / 'out.xlsx', pre_sheet='S', pre_usecols=None,
+        interactive=False
+    )
+
+    result = load_workbook(tmp_path / 'out.xlsx')
+    # The postload workbook is copied whole: every sheet, values untouched
+    assert result.sheetnames == ['S', 'Other']
+    assert result['Other']['A1'].value == 'kept'
+    assert [[cell.value for cell in row] for row in result['S'].iter_rows()] == [
+        ['ID', 'NAME'], [7, 'a'], [8, 'x'], [9, None],
+    ]
+    worksheet = result['S']
+    fills = {
+        cell.coordinate: cell.fill.fgColor.rgb[-6:]
+        for row in worksheet.iter_rows(min_row=2) for cell in row if cell.fill.fill_type
+    }
+    # '007' and 7 clean to the same value
+    assert fills == {'B3': 'FFF2CC', 'B4': 'E5A78C'}
@@ -0,0 +1,56 @@
+import datetime
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from normalization import clean_series
+from table_io import iter_table_chunks
+
+def write_columns(path, columns):
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.title = 'S'
+    worksheet.append(list(columns))
+    for row in zip(*columns.values()):
+        worksheet.append(list(row))
+    workbook.save(path)
+
+def cleaned_differences(path, chunk_size):
+    """Cells whose cleaned value differs between pd.read_excel and the chunked reader"""
+    full = pd.read_excel(path, sheet_name='S')
+    # Chunks are cleaned one by one, as the chunked comparison does
+    chunks = pd.concat(
+        [chunk.apply(clean_series) for chunk in iter_table_chunks(path, 'S', chunk_size)], ignore_index=True
+    )
+    assert list(chunks.columns) == list(full.columns)
+    assert len(chunks) == len(full)
+    differences = set()
+    for column in full.columns:
+        differ = clean_series(full[column]) != chunks[column]
+        differences.update((column, row) for row in differ[differ].index)
+    return differences
+
+@pytest.mark.parametrize('chunk_size', [2, 5, 100])
+def test_chunks_clean_like_read_excel(tmp_path, chunk_size):
+    write_columns(tmp_path / 'values.xlsx', {
+        'TEXT': ['NA', 'N/A', 'NULL', 'NaN', '#N/A', 'null', 'x', None, ' 007 ', 'A.1'],
+        'NUMBER': [7.0, 2.5, None, 'NA', 12, 1e15, -3.0, 0.0, 'n/a', 4.75],
+        'MIXED': ['007', 7, 7.0, '7.0', 'NULL', None, 'abc', 1.5, '1.5', 10],
+        'DATE': [datetime.datetime(2024, 1, 5), None, 'NA', datetime.datetime(2024, 2, 29, 13, 30), 'text',
+                 45000, datetime.datetime(2024, 1, 5), None, 'x', 1.0],
+    })
+
+    assert cleaned_differences(tmp_path / 'values.xlsx', chunk_size) == set()
+
+def test_chunks_keep_each_cells_type_where_read_excel_infers_one(tmp_path):
+    # The differences documented on table_io._excel_cell
+    write_columns(tmp_path / 'values.xlsx', {
+        'FLAG': [True, 'x', 'y', 1, 0, False],
+        'FLAG_BLANKS': [True, False, True, None, False, True],
+        'BIG': [2.5, None, 0.5, 3e16, 3e16, 3e16],
+    })
+
+    assert cleaned_differences(tmp_path / 'values.xlsx', 3) == {
+        ('FLAG', 3), ('FLAG', 5), ('BIG', 3), ('BIG', 4), ('BIG', 5),
+    } | {('FLAG_BLANKS', row) for row in (0, 1, 2, 4, 5)}
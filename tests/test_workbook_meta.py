@@ -0,0 +1,28 @@
+from openpyxl import Workbook
+
+from workbook_meta import read_workbook_metadata
+
+def test_rows_are_counted_without_a_dimension_record(tmp_path):
+    # Write-only workbooks (like this app's streamed results) have no <dimension>
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Data')
+    worksheet.append(['ID', 'NAME'])
+    for i in range(1234):
+        worksheet.append([i, f'name {i}'])
+    workbook.create_sheet('Empty')
+    workbook.save(tmp_path / 'streamed.xlsx')
+
+    sheets = read_workbook_metadata(str(tmp_path / 'streamed.xlsx'))
+
+    assert [(sheet.name, sheet.columns, sheet.rows) for sheet in sheets] == [
+        ('Data', ['ID', 'NAME'], 1234), ('Empty', [], 0),
+    ]
+
+def test_rows_come_from_the_dimension_record(tmp_path):
+    workbook = Workbook()
+    workbook.active.append(['ID'])
+    workbook.active.append([1])
+    workbook.active['A10'] = 'last'
+    workbook.save(tmp_path / 'book.xlsx')
+
+    assert read_workbook_metadata(str(tmp_path / 'book.xlsx'))[0].rows == 9
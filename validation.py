@@ -1,7 +1,12 @@
+import logging
+import os
+import numpy as np
 import pandas as pd
 from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
-from difflib import get_close_matches
+from column_matching import ColumnMatcher
+from comparison_logic import CHANGED_FILL, MISSING_FILL, diff_positional
+
+logger = logging.getLogger(__name__)
 
 def clean_columns(df):
     df = df.dropna(axis=1, how="all")
@@ -24,11 +29,13 @@ def load_and_clean_excel(file_path, sheet_name=None, usecols=None, skiprows=None
     return clean_columns(df)
 
 def find_similar_columns(preload_cols, postload_cols, threshold=0.6):
+    # The postload columns are indexed once instead of rescanned for every preload column
+    matcher = ColumnMatcher(postload_cols)
     matched_columns = {}
     for col in preload_cols:
-        matches = get_close_matches(col, postload_cols, n=1, cutoff=threshold)
+        matches = matcher.fuzzy(col, cutoff=threshold, limit=1)
         if matches:
-            matched_columns[col] = matches[0]
+            matched_columns[col] = matches[0][0]
     return matched_columns
 
 def user_confirm_column_mapping(matched_columns, postload_cols):
@@ -46,33 +53,51 @@ def user_confirm_column_mapping(matched_columns, postload_cols):
             confirmed_matches[pre_col] = suggested_post_col
     return confirmed_matches
 
-def highlight_differences(preFile, postFile, outputFile):
-    preDf = load_and_clean_excel(preFile, sheet_name="Sheet4", usecols="B:X")
-    postDf = load_and_clean_excel(postFile)
+def highlight_differences(preFile, postFile, outputFile, pre_sheet="Sheet4", pre_usecols="B:X", interactive=True):
+    """Highlight row-by-row differences between two sheets in a copy of the postload workbook.
+
+    The first postload sheet is compared with the preload sheet by row order,
+    as the web app's row-order mode does (see diff_positional), and its cells
+    get the web app's fills; the other sheets are saved unchanged. With
+    ``interactive`` the suggested column matches are confirmed on the console
+    (see user_confirm_column_mapping); otherwise they are used as they are, so
+    the function can run unattended.
+    """
+    preDf = load_and_clean_excel(preFile, sheet_name=pre_sheet, usecols=pre_usecols)
+    excel = pd.ExcelFile(postFile)
+    post_sheet = excel.sheet_names[0]
+    post_data = excel.parse(post_sheet)
+    postDf = clean_columns(post_data)
     matched_columns = find_similar_columns(preDf.columns.tolist(), postDf.columns.tolist(), threshold=0.6)
-    print("PreDf: ",preDf.columns.tolist())
-    matched_columns = user_confirm_column_mapping(matched_columns, postDf.columns.tolist())
-    wb = load_workbook(postFile)
-    ws = wb.active
-    difference_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
-    missing_fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
-    for row in range(len(preDf)):
-        for pre_col, post_col in matched_columns.items():
-            if pre_col not in preDf.columns or post_col not in postDf.columns:
-                continue
-            pre_value = preDf.at[row, pre_col] if row < len(preDf) else None
-            post_value = postDf.at[row, post_col] if row < len(postDf) else None
-            excel_row = row + 2
-            excel_col = postDf.columns.get_loc(post_col) + 1
-            if pre_value != post_value:
-                ws.cell(row=excel_row, column=excel_col).fill = difference_fill
-            if pd.notna(pre_value) and (pd.isna(post_value) or post_value == ""):
-                ws.cell(row=excel_row, column=excel_col).fill = missing_fill
-    wb.save(outputFile)
-    print(f"✅ Highlighted differences saved in: {outputFile}")
+    logger.debug("PreDf: %s", preDf.columns.tolist())
+    if interactive:
+        matched_columns = user_confirm_column_mapping(matched_columns, postDf.columns.tolist())
+    if len(preDf) != len(postDf):
+        logger.warning(
+            "%s has %d rows and %s %d; only the first %d are compared",
+            pre_sheet, len(preDf), post_sheet, len(postDf), min(len(preDf), len(postDf))
+        )
+
+    column_mapping = {post_col: pre_col for pre_col, post_col in matched_columns.items()}
+    _, changed, missing = diff_positional(preDf, postDf, column_mapping)
+    changed = changed.to_numpy()
+    missing = missing.to_numpy()
+    # clean_columns dropped the blank columns; map the masks back onto the sheet's columns
+    kept = np.flatnonzero(post_data.notna().any(axis=0).to_numpy())
+    workbook = load_workbook(postFile)
+    worksheet = workbook[post_sheet]
+    for mask, fill in ((changed, CHANGED_FILL), (missing, MISSING_FILL)):
+        for row_idx, col_idx in zip(*np.nonzero(mask)):
+            worksheet.cell(row=row_idx + 2, column=kept[col_idx] + 1).fill = fill
+    workbook.save(outputFile)
+    logger.info(
+        "Highlighted %d changed and %d missing cells, saved in: %s", changed.sum(), missing.sum(), outputFile
+    )
 
-preFile = "MDG Supplier Master Mass Upload Template- 1st Draft.xlsx"
-postFile = "ACVS_FD_Supplier_Master_Postload_V2.xlsx"
-outputFile = "Highlighted_Postload.xlsx"
+if __name__ == '__main__':
+    logging.basicConfig(level=os.environ.get('POSTLOAD_LOG_LEVEL', 'INFO').upper())
+    preFile = "MDG Supplier Master Mass Upload Template- 1st Draft.xlsx"
+    postFile = "ACVS_FD_Supplier_Master_Postload_V2.xlsx"
+    outputFile = "Highlighted_Postload.xlsx"
 
-highlight_differences(preFile, postFile, outputFile)
+    highlight_differences(preFile, postFile, outputFile)
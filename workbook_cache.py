@@ -0,0 +1,75 @@
+import threading
+from collections import OrderedDict
+
+from columnar_cache import load_columnar
+from metrics import timed
+from table_io import file_hash, read_table
+
+# Default memory budget for parsed sheets held by the shared cache
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+class SheetCache:
+    """LRU cache of parsed sheets keyed by file content hash and sheet name.
+
+    Cached DataFrames are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sheets = OrderedDict()
+        self._bytes = 0
+
+    def get(self, filepath, sheet_name):
+        """Return the parsed sheet, reading the workbook only on a cache miss"""
+        key = (file_hash(filepath), sheet_name)
+        with self._lock:
+            entry = self._sheets.get(key)
+            if entry is not None:
+                self._sheets.move_to_end(key)
+                return entry[0]
+
+        with timed('parse'):
+            # Uploads converted to columnar files skip the Excel parse entirely
+            df = load_columnar(filepath, sheet_name)
+            if df is None:
+                df = read_table(filepath, sheet_name)
+        self._store(key, df)
+        return df
+
+    def resize(self, max_bytes):
+        """Change the memory budget, evicting entries that no longer fit"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        """Drop every cached sheet"""
+        with self._lock:
+            self._sheets.clear()
+            self._bytes = 0
+
+    def _store(self, key, df):
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            if size > self.max_bytes:
+                # Larger than the whole budget: hand it out without caching
+                return
+            previous = self._sheets.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._sheets[key] = (df, size)
+            self._bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self._sheets and self._bytes > self.max_bytes:
+            _, (_, size) = self._sheets.popitem(last=False)
+            self._bytes -= size
+
+# Cache shared by the web routes and the comparison engine
+sheet_cache = SheetCache()
+
+def read_sheet(filepath, sheet_name):
+    """Parse a sheet through the shared cache"""
+    return sheet_cache.get(filepath, sheet_name)
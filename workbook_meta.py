@@ -0,0 +1,235 @@
+import posixpath
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from xml.etree import ElementTree
+
+import pandas as pd
+from openpyxl.utils import column_index_from_string, range_boundaries
+
+from table_io import TABLE_SHEET_NAME, file_hash, pandas_column_names, table_format
+
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+# Start tag of a sheet row (any namespace prefix) and its row number
+_ROW_TAG = re.compile(rb'<(?:[\w.-]+:)?row(?=[\s/>])([^>]*)>')
+_ROW_NUMBER = re.compile(rb'\sr="(\d+)"')
+
+_metadata_lock = threading.Lock()
+_metadata = OrderedDict()
+
+class SheetInfo:
+    """Sheet name, header columns and approximate data dimensions"""
+
+    def __init__(self, name, columns, rows):
+        self.name = name
+        self.columns = columns
+        self.rows = rows
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'columns': self.columns,
+            'rows': self.rows,
+            'columnCount': len(self.columns),
+        }
+
+def read_workbook_metadata(filepath):
+    """Return a SheetInfo per sheet, reading only the header row of each sheet.
+
+    xlsx files are read straight from their XML parts: the sheet XML is parsed up
+    to its first row and shared strings only up to the highest index the
+    headers use, so the cost does not grow with the sheet size (except for
+    sheets without a dimension record, see below). Other formats fall
+    back to pandas with ``nrows=0``; CSV and Parquet exports appear as a single
+    sheet (Parquet row counts come from the file footer). Row counts come from the sheet's dimension
+    record, or from counting the rows of sheets without one, and data cells
+    beyond the header's last column are not reported.
+    Results are cached by file content hash.
+    """
+    digest = file_hash(filepath)
+    with _metadata_lock:
+        sheets = _metadata.get(digest)
+        if sheets is not None:
+            _metadata.move_to_end(digest)
+            return sheets
+
+    file_format = table_format(filepath)
+    if file_format != 'excel':
+        sheets = _read_table_metadata(filepath, file_format)
+    elif zipfile.is_zipfile(filepath):
+        sheets = _read_xlsx_metadata(filepath)
+    else:
+        sheets = _read_pandas_metadata(filepath)
+
+    with _metadata_lock:
+        _metadata[digest] = sheets
+        while len(_metadata) > 256:
+            _metadata.popitem(last=False)
+    return sheets
+
+def read_sheet_columns(filepath, sheet_name):
+    """Header columns of one sheet, named the way pd.read_excel names them"""
+    for sheet in read_workbook_metadata(filepath):
+        if sheet.name == sheet_name:
+            return sheet.columns
+    raise KeyError(f"Worksheet named '{sheet_name}' not found")
+
+def _read_pandas_metadata(filepath):
+    excel = pd.ExcelFile(filepath)
+    sheets = []
+    for name in excel.sheet_names:
+        columns = excel.parse(name, nrows=0).columns.tolist()
+        sheets.append(SheetInfo(name, columns, None))
+    return sheets
+
+def _read_table_metadata(filepath, file_format):
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        metadata = pq.read_metadata(filepath)
+        return [SheetInfo(TABLE_SHEET_NAME, list(metadata.schema.to_arrow_schema().names), metadata.num_rows)]
+    columns = pd.read_csv(filepath, nrows=0, dtype=str).columns.tolist()
+    return [SheetInfo(TABLE_SHEET_NAME, columns, None)]
+
+def _read_xlsx_metadata(filepath):
+    with zipfile.ZipFile(filepath) as archive:
+        names = set(archive.namelist())
+        sheet_parts = _sheet_parts(archive)
+
+        headers = []
+        for name, part in sheet_parts:
+            if part not in names:
+                # Chartsheets and broken relationships have no cell data
+                headers.append((name, [], None))
+                continue
+            header, rows = _read_sheet_header(archive, part)
+            headers.append((name, header, rows))
+
+        # Resolve shared string references used by any header in one pass
+        wanted = {value.index for _, header, _ in headers for value in header if isinstance(value, _SharedString)}
+        strings = _read_shared_strings(archive, names, max(wanted)) if wanted else []
+
+    sheets = []
+    for name, header, rows in headers:
+        values = [
+            (strings[value.index] if value.index < len(strings) else None)
+            if isinstance(value, _SharedString) else value
+            for value in header
+        ]
+        sheets.append(SheetInfo(name, pandas_column_names(values), rows))
+    return sheets
+
+def _sheet_parts(archive):
+    """(sheet name, zip path) pairs in workbook order"""
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    rels = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    targets = {}
+    for rel in rels.iter(f'{PKG_REL_NS}Relationship'):
+        target = rel.get('Target')
+        if target.startswith('/'):
+            target = target.lstrip('/')
+        else:
+            target = posixpath.normpath(posixpath.join('xl', target))
+        targets[rel.get('Id')] = target
+
+    parts = []
+    for sheet in workbook.iter(f'{MAIN_NS}sheet'):
+        parts.append((sheet.get('name'), targets.get(sheet.get(f'{REL_NS}id'))))
+    return parts
+
+class _SharedString:
+    """Placeholder for a header cell whose text lives in sharedStrings.xml"""
+
+    def __init__(self, index):
+        self.index = index
+
+def _read_sheet_header(archive, part):
+    """Stream a sheet's XML up to its first row and return (header, data row count)"""
+    dimension = None
+    header = []
+    with archive.open(part) as stream:
+        for _, elem in ElementTree.iterparse(stream, events=('end',)):
+            if elem.tag == f'{MAIN_NS}dimension':
+                dimension = elem.get('ref')
+            elif elem.tag == f'{MAIN_NS}row':
+                header = _row_values(elem)
+                if int(elem.get('r', 1)) > 1:
+                    # pandas still takes the (blank) first sheet row as the header
+                    header = [f'Unnamed: {idx}' for idx in range(len(header))]
+                break
+
+    rows = None
+    if dimension:
+        try:
+            _, _, _, max_row = range_boundaries(dimension)
+            rows = max(max_row - 1, 0) if max_row else None
+        except ValueError:
+            rows = None
+    else:
+        # Write-only and streamed files have no dimension record
+        rows = max(_last_row_number(archive, part) - 1, 0)
+    return header, rows
+
+def _last_row_number(archive, part):
+    """Number of a sheet's last row, from a byte scan of its <row> tags"""
+    last_row = 0
+    rest = b''
+    with archive.open(part) as stream:
+        for block in iter(lambda: stream.read(1 << 20), b''):
+            block = rest + block
+            # Only whole tags are scanned; the cut-off one is kept for the next block
+            end = block.rfind(b'>') + 1
+            block, rest = block[:end], block[end:]
+            for match in _ROW_TAG.finditer(block):
+                number = _ROW_NUMBER.search(match.group(1))
+                last_row = int(number.group(1)) if number else last_row + 1
+    return last_row
+
+def _row_values(row):
+    values = []
+    for cell in row.iter(f'{MAIN_NS}c'):
+        ref = cell.get('r')
+        if ref:
+            column = column_index_from_string(re.match(r'[A-Z]+', ref).group())
+            values.extend([None] * (column - 1 - len(values)))
+        values.append(_cell_value(cell))
+    return values
+
+def _cell_value(cell):
+    cell_type = cell.get('t', 'n')
+    if cell_type == 'inlineStr':
+        return ''.join(t.text or '' for t in cell.iter(f'{MAIN_NS}t'))
+    value = cell.findtext(f'{MAIN_NS}v')
+    if value is None:
+        return None
+    if cell_type == 's':
+        return _SharedString(int(value))
+    if cell_type == 'b':
+        return value == '1'
+    if cell_type == 'n':
+        number = float(value)
+        return int(number) if number.is_integer() else number
+    return value
+
+def _read_shared_strings(archive, names, max_index):
+    """Shared strings up to max_index, stopping the parse as soon as they are read"""
+    if 'xl/sharedStrings.xml' not in names:
+        return []
+    strings = []
+    with archive.open('xl/sharedStrings.xml') as stream:
+        for _, elem in ElementTree.iterparse(stream, events=('end',)):
+            if elem.tag != f'{MAIN_NS}si':
+                continue
+            # Phonetic runs (rPh) are annotations, not part of the text
+            text = ''.join(
+                t.text or ''
+                for child in elem if child.tag != f'{MAIN_NS}rPh'
+                for t in ([child] if child.tag == f'{MAIN_NS}t' else child.iter(f'{MAIN_NS}t'))
+            )
+            strings.append(text)
+            elem.clear()
+            if len(strings) > max_index:
+                break
+    return strings
@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+from table_io import remember_hash
+
+_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+logger = logging.getLogger(__name__)
+
+class Workspace:
+    """Per-user directory holding uploads, results, job states and small state values.
+
+    Everything lives on disk under one directory so any worker process of a
+    multi-process server sees the same workspace.
+    """
+
+    def __init__(self, root, workspace_id):
+        self.id = workspace_id
+        self.path = os.path.join(root, workspace_id)
+        self.upload_dir = os.path.join(self.path, 'uploads')
+        self.results_dir = os.path.join(self.path, 'results')
+        self.jobs_dir = os.path.join(self.path, 'jobs')
+        # Diff snapshots of earlier comparisons, for incremental re-runs
+        self.snapshots_dir = os.path.join(self.path, 'snapshots')
+        self._state_dir = os.path.join(self.path, 'state')
+
+    def get(self, key, default=None):
+        """Read a state value written by set()"""
+        try:
+            with open(os.path.join(self._state_dir, f'{key}.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return default
+
+    def set(self, key, value):
+        """Store a JSON-serializable state value; one file per key keeps writers independent"""
+        os.makedirs(self._state_dir, exist_ok=True)
+        write_json_atomic(os.path.join(self._state_dir, f'{key}.json'), value)
+        self.touch()
+
+    def delete(self, key):
+        """Forget a state value"""
+        try:
+            os.remove(os.path.join(self._state_dir, f'{key}.json'))
+        except FileNotFoundError:
+            pass
+
+    def upload_path(self, digest, filename):
+        """Where an upload with this SHA-256 is kept: uploads are stored once per content"""
+        return os.path.join(self.upload_dir, f'{digest}{os.path.splitext(filename)[1].lower()}')
+
+    def store_upload(self, part, filename):
+        """Keep a received HashingFile under its content hash and return its path.
+
+        The same content uploaded again (or as both preload and postload) is
+        already stored, so the new copy is dropped.
+        """
+        digest = part.hexdigest()
+        path = self.upload_path(digest, filename)
+        if not os.path.exists(path):
+            part.commit(path)
+            remember_hash(path, digest)
+        return path
+
+    def new_result_dir(self, name):
+        path = os.path.join(self.results_dir, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def files_in_use(self):
+        """Input files of the workspace's queued and running jobs"""
+        return {path for state in _active_job_states(self) for path in state.get('inputFiles') or []}
+
+    def contains(self, path):
+        """True if path points inside this workspace"""
+        return os.path.commonpath([os.path.abspath(path), os.path.abspath(self.path)]) == os.path.abspath(self.path)
+
+    def touch(self):
+        """Mark the workspace as recently used so TTL cleanup keeps it"""
+        if os.path.isdir(self.path):
+            os.utime(self.path)
+
+    def last_used(self):
+        return os.path.getmtime(self.path)
+
+class WorkspaceStore:
+    """Creates workspaces under a shared root and removes the ones idle past their TTL"""
+
+    def __init__(self, root, ttl_seconds=6 * 3600, cleanup_interval=60):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def open(self, workspace_id=None):
+        """Return the workspace for a valid id, or a brand new workspace otherwise.
+
+        Directories are only created once something is written, so requests that
+        never upload anything leave no trace.
+        """
+        if not workspace_id or not _ID_PATTERN.match(workspace_id):
+            workspace_id = uuid.uuid4().hex
+        workspace = Workspace(self.root, workspace_id)
+        workspace.touch()
+        return workspace
+
+    def cleanup_expired(self, force=False):
+        """Delete workspaces idle for longer than the TTL (at most once per interval)"""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_cleanup < self.cleanup_interval:
+                return
+            self._last_cleanup = now
+
+        for name in os.listdir(self.root):
+            if not _ID_PATTERN.match(name):
+                continue
+            workspace = Workspace(self.root, name)
+            try:
+                idle = now - workspace.last_used() > self.ttl_seconds
+                if idle and not _has_active_job(workspace, now - self.ttl_seconds):
+                    logger.info("Removing expired workspace %s", name)
+                    shutil.rmtree(workspace.path, ignore_errors=True)
+            except FileNotFoundError:
+                # Another worker process removed it first
+                pass
+
+def _has_active_job(workspace, updated_since):
+    """True if a job is still queued or running (and reported progress recently)"""
+    return any(True for _ in _active_job_states(workspace, updated_since))
+
+def _active_job_states(workspace, updated_since=None):
+    """States of the jobs still queued or running, optionally only those updated since a time"""
+    if not os.path.isdir(workspace.jobs_dir):
+        return
+    for name in os.listdir(workspace.jobs_dir):
+        path = os.path.join(workspace.jobs_dir, name)
+        try:
+            if updated_since is not None and os.path.getmtime(path) < updated_since:
+                continue
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if state.get('status') in ('queued', 'running'):
+            yield state
+
+def write_json_atomic(path, value):
+    """Write JSON through a temp file and rename so readers never see half a file"""
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(value, f)
+    os.replace(tmp_path, path)